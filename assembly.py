@@ -0,0 +1,84 @@
+# Assembly readout for explicit areas.
+#
+# AssemblyIndex maps the neurons of an explicit area to its fixed
+# assemblies, for reading out which word/assembly is active.
+
+import numpy as np
+
+
+def labels_from_lexicon(lexeme_dict):
+  """Assembly id -> word, for a parser `lexeme_dict` ({word: {"index": i}}).
+
+  Where several words share an assembly (e.g. Russian case forms), the
+  first one in dict order gets it, as a linear scan of the dict would.
+  """
+  labels = {}
+  for word, lexeme in lexeme_dict.items():
+    labels.setdefault(lexeme["index"], word)
+  return labels
+
+
+class AssemblyIndex:
+  """Maps each neuron of an explicit area to the assembly it belongs to.
+
+  Explicit areas are laid out as consecutive blocks of k neurons, block i
+  being assembly i (see `Brain.activate`). Reading out which assembly the
+  current winners form is then a single bincount over the winners instead
+  of intersecting them with every candidate assembly.
+
+  Attributes:
+    n, k: Area size and assembly size.
+    num_assemblies: n // k; trailing neurons belong to no assembly.
+    assembly_of: int32 array, assembly id of every neuron (-1 for none).
+    labels: Optional {assembly id: label}; its order is the priority when
+      several assemblies pass the threshold.
+  """
+
+  def __init__(self, n, k, labels=None):
+    self.n = n
+    self.k = k
+    self.num_assemblies = n // k
+    self.assembly_of = np.full(n, -1, dtype=np.int32)
+    self.assembly_of[:self.num_assemblies * k] = (
+        np.arange(self.num_assemblies * k, dtype=np.int32) // k)
+    self.labels = labels
+    # Priority of each assembly id: its position in `labels`, or its id.
+    if labels is None:
+      self._rank = np.arange(self.num_assemblies)
+    else:
+      self._rank = np.full(self.num_assemblies, np.iinfo(np.int64).max,
+                           dtype=np.int64)
+      for rank, assembly_id in enumerate(labels):
+        if 0 <= assembly_id < self.num_assemblies:
+          self._rank[assembly_id] = rank
+
+  def counts(self, winners):
+    """Number of winners in each assembly (length num_assemblies)."""
+    ids = self.assembly_of[np.asarray(winners, dtype=np.int64)]
+    return np.bincount(ids[ids >= 0], minlength=self.num_assemblies)
+
+  def readout(self, winners, min_overlap):
+    """Returns the assembly id that `winners` cover, or None.
+
+    An assembly qualifies if at least `min_overlap * k` of its neurons are
+    winners; if several do, the one with the highest priority (first in
+    `labels`, else the lowest id) is returned.
+    """
+    counts = self.counts(winners)
+    passing = np.flatnonzero(counts >= min_overlap * self.k)
+    if self.labels is not None:
+      passing = passing[self._rank[passing] < len(self.labels)]
+    if not len(passing):
+      return None
+    return int(passing[np.argmin(self._rank[passing])])
+
+  def read_label(self, winners, min_overlap):
+    """Like `readout()`, but returns the assembly's label (or None)."""
+    assembly_id = self.readout(winners, min_overlap)
+    if assembly_id is None:
+      return None
+    return self.labels[assembly_id]
+
+  def indices(self, assembly_id):
+    """The neurons of one assembly."""
+    return np.arange(assembly_id * self.k, (assembly_id + 1) * self.k)
@@ -0,0 +1,107 @@
+# Vectorized overlap analytics over winner histories.
+#
+# All functions accept a winner history in any of the forms the code base
+# produces: an `Area.saved_winners` (history.WinnerHistory, read without
+# copying it into Python lists), a list of winner lists, or a 2D array with
+# one step per row. Steps may have different numbers of winners (e.g. a
+# subsampled assembly during pattern completion).
+#
+#   overlap_matrix(b.areas["A"].saved_winners)   # steps x steps
+#   overlaps_with_reference(b.areas["A"].saved_winners, reference=9)
+
+import numpy as np
+
+import history
+
+
+def winner_rows(winners_list):
+  """Returns (rows, lengths) for a winner history.
+
+  `rows` is a 2D uint32 array with one step per row, `lengths[i]` the
+  number of valid entries of row i (the rest is padding).
+  """
+  if isinstance(winners_list, history.WinnerHistory):
+    return winners_list.padded()
+  if isinstance(winners_list, np.ndarray) and winners_list.ndim == 2:
+    rows = winners_list.astype(np.uint32, copy=False)
+    return rows, np.full(len(rows), rows.shape[1], dtype=np.uint32)
+  lengths = np.array([len(winners) for winners in winners_list],
+                     dtype=np.uint32)
+  rows = np.zeros((len(lengths), int(lengths.max()) if len(lengths) else 0),
+                  dtype=np.uint32)
+  for i, winners in enumerate(winners_list):
+    rows[i, :lengths[i]] = winners
+  return rows, lengths
+
+
+def _valid(rows, lengths):
+  return np.arange(rows.shape[1]) < lengths[:, None]
+
+
+def indicator_matrix(winners_list):
+  """Returns (indicator, neurons): a steps x neurons 0/1 float32 matrix.
+
+  Only neurons that fire in some step get a column (`neurons[j]` is the
+  neuron of column j), so the width is the support the history touches,
+  not the area size.
+  """
+  rows, lengths = winner_rows(winners_list)
+  valid = _valid(rows, lengths)
+  neurons, columns = np.unique(rows[valid], return_inverse=True)
+  indicator = np.zeros((len(rows), len(neurons)), dtype=np.float32)
+  indicator[np.nonzero(valid)[0], columns] = 1.0
+  return indicator, neurons
+
+
+def overlap_matrix(winners_list, percentage=False):
+  """Returns the steps x steps matrix of pairwise overlaps.
+
+  Entry (i, j) is |winners_i & winners_j|; with `percentage`, divided by
+  |winners_j| (as `overlap(a, b, percentage=True)` divides by len(b)).
+  Computed as one matrix product of the step/neuron indicator matrix.
+  """
+  indicator, _ = indicator_matrix(winners_list)
+  counts = np.rint(indicator @ indicator.T).astype(np.int64)
+  if percentage:
+    sizes = np.diag(counts).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      return counts / sizes[None, :]
+  return counts
+
+
+def overlaps_with_reference(winners_list, reference, percentage=False):
+  """Returns the overlap of every step with a reference assembly.
+
+  Args:
+    winners_list: A winner history.
+    reference: Index of the reference step in `winners_list`, or the
+      reference winners themselves.
+    percentage: Divide by the size of the reference.
+  """
+  rows, lengths = winner_rows(winners_list)
+  if np.ndim(reference) == 0:
+    reference = rows[reference, :lengths[reference]]
+  reference = np.unique(np.asarray(reference, dtype=np.uint32))
+  hits = np.isin(rows, reference) & _valid(rows, lengths)
+  overlaps = hits.sum(axis=1)
+  if percentage:
+    return overlaps / len(reference)
+  return overlaps
+
+
+def _neuron_array(assembly):
+  if isinstance(assembly, np.ndarray):
+    return assembly
+  return np.fromiter(assembly, dtype=np.int64)
+
+
+def overlap(a, b, percentage=False):
+  """Number of common neurons of two assemblies (divided by len(b)).
+
+  The assemblies may be any iterables of neuron indices (lists, sets,
+  arrays).
+  """
+  o = len(np.intersect1d(_neuron_array(a), _neuron_array(b)))
+  if percentage:
+    return o / len(b)
+  return o
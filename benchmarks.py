@@ -0,0 +1,252 @@
+# Benchmark suite for the core assembly operations.
+#
+# Times (and optionally memory-profiles) projection, reciprocal projection,
+# association, merge and pattern completion -- all run through the
+# simulations.py functions -- over scaling curves in n, k, p, number of
+# areas and number of rounds. Each curve varies one parameter around a base
+# configuration. Results are written as JSON; passing a stored baseline
+# reports (and exits non-zero on) cases that got slower or bigger.
+#
+#   python benchmarks.py --output bench.json
+#   python benchmarks.py --quick --baseline bench.json --tolerance 0.25
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import simulations
+
+FORMAT_VERSION = 1
+
+
+def _projection(n, k, p, beta, rounds, num_areas, **kwargs):
+  if num_areas == 1:
+    return simulations.project_sim(n, k, p, beta, t=rounds, **kwargs)
+  return simulations.project_chain_sim(n, k, p, beta, t=rounds,
+                                       num_areas=num_areas, **kwargs)
+
+
+def _reciprocal_projection(n, k, p, beta, rounds, num_areas, **kwargs):
+  return simulations.fixed_assembly_recip_proj(n, k, p, beta, rounds=rounds,
+                                               verbose=False, **kwargs)
+
+
+def _association(n, k, p, beta, rounds, num_areas, **kwargs):
+  return simulations.associate(n, k, p, beta, overlap_iter=rounds, **kwargs)
+
+
+def _merge(n, k, p, beta, rounds, num_areas, **kwargs):
+  return simulations.merge_sim(n, k, p, beta, max_t=rounds, **kwargs)
+
+
+def _pattern_completion(n, k, p, beta, rounds, num_areas, **kwargs):
+  return simulations.pattern_com(n, k, p, beta, project_iter=rounds,
+                                 alpha=0.5, comp_iter=5, **kwargs)
+
+
+# name -> (function, whether it takes the number of areas as a parameter).
+# Extra keyword arguments (e.g. brain_factory) go to the simulation.
+# The others use a fixed number of areas (1 to 3), so the `num_areas` curve
+# is only run for operations that support it.
+OPERATIONS = {
+  'projection': (_projection, True),
+  'reciprocal_projection': (_reciprocal_projection, False),
+  'association': (_association, False),
+  'merge': (_merge, False),
+  'pattern_completion': (_pattern_completion, False),
+}
+
+BASE_PARAMS = {'n': 10000, 'k': 100, 'p': 0.01, 'beta': 0.05, 'rounds': 10,
+               'num_areas': 1}
+SWEEPS = {
+  'n': [10000, 30000, 100000],
+  'k': [50, 100, 200],
+  'p': [0.005, 0.01, 0.02],
+  'num_areas': [1, 2, 4],
+  'rounds': [5, 10, 20],
+}
+QUICK_BASE_PARAMS = dict(BASE_PARAMS, n=3000, k=30, rounds=5)
+QUICK_SWEEPS = {
+  'n': [3000, 10000],
+  'k': [30, 60],
+  'p': [0.01, 0.02],
+  'num_areas': [1, 2],
+  'rounds': [5, 10],
+}
+
+
+def cases(operations=None, base_params=None, sweeps=None):
+  """Yields (operation, params) for every point of every scaling curve.
+
+  Points shared by several curves (the base configuration) are only
+  yielded once per operation.
+  """
+  base_params = BASE_PARAMS if base_params is None else base_params
+  sweeps = SWEEPS if sweeps is None else sweeps
+  for operation in operations or OPERATIONS:
+    _, takes_num_areas = OPERATIONS[operation]
+    seen = set()
+    for name, values in sweeps.items():
+      if name == 'num_areas' and not takes_num_areas:
+        continue
+      for value in values:
+        params = dict(base_params, **{name: value})
+        key = tuple(sorted(params.items()))
+        if key not in seen:
+          seen.add(key)
+          yield operation, params
+
+
+def _seed(seed):
+  np.random.seed(seed)
+  random.seed(seed)
+
+
+def run_case(operation, params, repeat=3, measure_memory=True, seed=0):
+  """Times one benchmark case.
+
+  Every repetition starts from the same seeds. Peak memory is measured in a
+  separate, untimed run under tracemalloc (numpy reports its buffers to
+  tracemalloc), so it does not distort the timings.
+
+  Returns:
+    A dict with the operation, parameters, per-repetition seconds, their
+    minimum and median, and the peak traced bytes (or None).
+  """
+  function, _ = OPERATIONS[operation]
+  seconds = []
+  for _ in range(repeat):
+    _seed(seed)
+    start = time.perf_counter()
+    function(**params)
+    seconds.append(time.perf_counter() - start)
+  peak_bytes = None
+  if measure_memory:
+    _seed(seed)
+    tracemalloc.start()
+    try:
+      function(**params)
+      _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+      tracemalloc.stop()
+  return {
+    'operation': operation,
+    'params': params,
+    'seconds': seconds,
+    'min_seconds': min(seconds),
+    'median_seconds': statistics.median(seconds),
+    'peak_bytes': peak_bytes,
+  }
+
+
+def run(operations=None, quick=False, repeat=3, measure_memory=True,
+        verbose=True):
+  """Runs the suite and returns the JSON-serializable results."""
+  base_params = QUICK_BASE_PARAMS if quick else BASE_PARAMS
+  sweeps = QUICK_SWEEPS if quick else SWEEPS
+  results = []
+  for operation, params in cases(operations, base_params, sweeps):
+    result = run_case(operation, params, repeat=repeat,
+                      measure_memory=measure_memory)
+    if verbose:
+      print(f"{operation:<22} {_format_params(params):<55} "
+            f"{result['median_seconds']:8.3f}s "
+            f"{_format_bytes(result['peak_bytes'])}")
+    results.append(result)
+  return {
+    'version': FORMAT_VERSION,
+    'meta': {
+      'python': platform.python_version(),
+      'numpy': np.__version__,
+      'platform': platform.platform(),
+      'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+      'quick': quick,
+      'repeat': repeat,
+    },
+    'results': results,
+  }
+
+
+def _format_params(params):
+  return ' '.join(f'{name}={value}' for name, value in params.items())
+
+
+def _format_bytes(num_bytes):
+  if num_bytes is None:
+    return ''
+  return f'{num_bytes / 2**20:8.1f} MiB'
+
+
+def _case_key(result):
+  return result['operation'], tuple(sorted(result['params'].items()))
+
+
+def compare(results, baseline, tolerance=0.2):
+  """Compares two result sets case by case.
+
+  Time is compared on `min_seconds` (the least noisy statistic), memory on
+  `peak_bytes`. Cases missing from either side are ignored.
+
+  Returns:
+    A list of (operation, params, metric, baseline value, new value, ratio)
+    for every case where new / baseline > 1 + tolerance.
+  """
+  baseline_by_key = {_case_key(r): r for r in baseline['results']}
+  regressions = []
+  for result in results['results']:
+    old = baseline_by_key.get(_case_key(result))
+    if old is None:
+      continue
+    for metric in ('min_seconds', 'peak_bytes'):
+      if not old.get(metric) or result.get(metric) is None:
+        continue
+      ratio = result[metric] / old[metric]
+      if ratio > 1 + tolerance:
+        regressions.append((result['operation'], result['params'], metric,
+                            old[metric], result[metric], ratio))
+  return regressions
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+      description='Benchmarks the core assembly operations.')
+  parser.add_argument('--output', help='write results to this JSON file')
+  parser.add_argument('--baseline', help='compare against this JSON file')
+  parser.add_argument('--tolerance', type=float, default=0.2,
+                      help='allowed relative slowdown / growth (default 0.2)')
+  parser.add_argument('--operations', nargs='+', choices=sorted(OPERATIONS),
+                      help='only run these operations')
+  parser.add_argument('--quick', action='store_true',
+                      help='small configurations (a smoke run)')
+  parser.add_argument('--repeat', type=int, default=3)
+  parser.add_argument('--no-memory', action='store_true',
+                      help='skip the tracemalloc peak-memory runs')
+  args = parser.parse_args(argv)
+
+  results = run(args.operations, quick=args.quick, repeat=args.repeat,
+                measure_memory=not args.no_memory)
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(results, f, indent=1)
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for operation, params, metric, old, new, ratio in regressions:
+      print(f"REGRESSION {operation} {_format_params(params)}: "
+            f"{metric} {old:.4g} -> {new:.4g} ({ratio:.2f}x)")
+    if regressions:
+      return 1
+    print('No regressions against ' + args.baseline)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
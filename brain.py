@@ -14,11 +14,38 @@ from scipy.stats import norm
 import math
 import types
 
+import assembly
+import connectome_store
+import history
+import profiling
+
 # Configurable assembly model for simulations
 # Author Daniel Mitropolsky, 2018
 
 EMPTY_MAPPING = types.MappingProxyType({})
 
+# Per-fiber connectome memory, see `Brain.connectome_memory()`.
+FiberMemory = collections.namedtuple(
+    'FiberMemory',
+    ['shape', 'live_bytes', 'capacity_bytes', 'density', 'growth_bytes'])
+# One entry of `Brain.saved_memory`: totals plus live bytes per fiber.
+MemorySample = collections.namedtuple(
+    'MemorySample', ['live_bytes', 'capacity_bytes', 'live_bytes_by_fiber'])
+
+
+# What a step observer receives for every area updated by a projection, see
+# `Brain.add_observer()`. `winners` is a read-only uint32 array; `round`
+# counts the updates of this area so far (0 for its first).
+StepRecord = collections.namedtuple(
+    'StepRecord', ['area', 'round', 'winners', 'w', 'num_first_winners'])
+
+
+class ConnectomeMemoryError(MemoryError):
+  """Raised when a projection (or a new block) could exceed the budget.
+
+  See `Brain.memory_budget`.
+  """
+
 class Area:
   """A brain area.
 
@@ -32,17 +59,28 @@ class Area:
     beta_by_stimulus: Mapping from area-name to corresponding beta.
       (In original code: `.area_beta`).
     w: Number of neurons that has ever fired in this area.
-    saved_w: List of per-round size-of-support.
+    saved_w: Per-round size-of-support (a list-like history.StepHistory).
     winners: List of winners, as set by previous action.
-    saved_winners: List of lists of all winners, per-round.
+    saved_winners: Per-round lists of all winners (a list-like
+      history.WinnerHistory).
     num_first_winners: ??? TODO(tfish): Clarify.
+    num_rounds: Number of times `.project()` updated this area.
     fixed_assembly: Whether the assembly (of winners) in this area
       is considered frozen.
     explicit: Whether to fully simulate this area (rather than performing
       a sparse-only simulation).
+    blocks: For a block area (see `Brain.add_block_area`), the block index
+      of each allocated k-neuron slot, in allocation order; else None.
+    block_slots: For a block area, mapping from block index to its slot.
+    num_blocks: For a block area, the number of valid block indices, or
+      None for no limit.
+    block_p: For a block area, the (inner, out, in) connection
+      probabilities that new blocks are sampled with.
+    block_seed: For a block area, the seed of its synapses between blocks.
   """
   def __init__(self, name, n, k, *,
-               beta=0.05, w=0, explicit=False):
+               beta=0.05, w=0, explicit=False, history_steps=None,
+               history_dir=None):
     """Initializes the instance.
 
     Args:
@@ -53,6 +91,10 @@ class Area:
       w: initial 'winner' set-size.
       explicit: boolean indicating whether the area is 'explicit'
         (fully-simulated).
+      history_steps: If set, saved_w / saved_winners only keep the last
+        this many rounds.
+      history_dir: If set, saved_w / saved_winners are memory-mapped files
+        in this directory.
     """
     self.name = name
     self.n = n
@@ -63,20 +105,29 @@ class Area:
     self.w = w
     # Value of `w` since the last time that `.project()` was called.
     self._new_w = 0
-    self.saved_w = []
+    self.saved_w = history.StepHistory(
+        max_steps=history_steps, spill_dir=history_dir)
     self.winners = []
     # Value of `winners` since the last time that `.project()` was called.
     # only to be used inside `.project()` method.
     self._new_winners = []
-    self.saved_winners = []
+    self.saved_winners = history.WinnerHistory(
+        max_steps=history_steps, spill_dir=history_dir)
     self.num_first_winners = -1
+    self.num_rounds = 0
     self.fixed_assembly = False
     self.explicit = explicit
+    self.blocks = None
+    self.block_slots = None
+    self.num_blocks = None
+    self.block_p = None
+    self.block_seed = None
 
   def _update_winners(self):
     self.winners = self._new_winners
     if not self.explicit:
       self.w = self._new_w
+    self.num_rounds += 1
 
   def update_beta_by_stimulus(self, name, new_beta):
     self.beta_by_stimulus[name] = new_beta
@@ -121,8 +172,24 @@ class Brain:
     save_size: Boolean flag, whether to save sizes.
     save_winners: Boolean flag, whether to save winners.
     disable_plasticity: Debug flag for disabling plasticity.
+    connectome_dir: Scratch directory for memory-mapped connectome buffers,
+      or None to keep them in RAM.
+    profile: Whether to time the phases of every projection step, see
+      `profile_report()`.
+    history_steps: If set, areas only keep the last this many rounds of
+      saved_w / saved_winners (ring buffers).
+    history_dir: If set, saved_w / saved_winners are spilled to
+      memory-mapped files in this directory.
+    save_memory: Boolean flag, whether to append a MemorySample to
+      `saved_memory` after every projection step.
+    memory_budget: Soft limit on the live bytes of all connectomes, or None.
+      `project()` raises ConnectomeMemoryError before touching any state if
+      the step could grow the connectomes beyond it, and so does
+      `activate()` before allocating a block (see `add_block_area`).
   """
-  def __init__(self, p, save_size=True, save_winners=False, seed=0):
+  def __init__(self, p, save_size=True, save_winners=False, seed=0,
+               connectome_dir=None, profile=False, save_memory=False,
+               memory_budget=None, history_steps=None, history_dir=None):
     self.area_by_name = {}
     self.stimulus_size_by_name = {}
     self.connectomes_by_stimulus = {}
@@ -134,6 +201,22 @@ class Brain:
     self._rng = np.random.default_rng(seed=seed)    
     # For debugging purposes in applications (eg. language)
     self._use_normal_ppf = False
+    # Allocates (and grows) every connectome buffer.
+    self.connectome_dir = connectome_dir
+    self._store = connectome_store.make_store(connectome_dir)
+    # Per-phase timings of project_into; None when profiling is off.
+    self._profiler = profiling.PhaseProfiler() if profile else None
+    self.history_steps = history_steps
+    self.history_dir = history_dir
+    self.save_memory = save_memory
+    self.saved_memory = []
+    self.memory_budget = memory_budget
+    # Live bytes per fiber before the last projection step.
+    self._previous_bytes_by_fiber = {}
+    # (observer, area names or None for all areas), see add_observer().
+    self._observers = []
+    # Cached assembly.AssemblyIndex per explicit area, see assembly_index().
+    self._assembly_indices = {}
 
   @property
   def areas(self):
@@ -143,6 +226,173 @@ class Brain:
   def stimuli_connectomes(self):
     return self.connectomes_by_stimulus
 
+  def paging_stats(self):
+    """Returns connectome storage statistics, see `connectome_store`."""
+    return self._store.paging_stats()
+
+  def close(self):
+    """Releases the scratch files of a memory-mapped brain."""
+    self._store.close()
+
+  def iter_connectomes(self):
+    """Yields (fiber, connectome) for every stimulus vector and area matrix.
+
+    Fibers are keyed `("stim", stimulus_name, area_name)` and
+    `("area", from_area_name, to_area_name)`.
+    """
+    for stim_name, connectomes in self.connectomes_by_stimulus.items():
+      for area_name, connectome in connectomes.items():
+        yield ("stim", stim_name, area_name), connectome
+    for from_area_name, connectomes in self.connectomes.items():
+      for to_area_name, connectome in connectomes.items():
+        yield ("area", from_area_name, to_area_name), connectome
+
+  def connectome_nbytes(self):
+    """Returns (live bytes, allocated bytes) of all connectomes."""
+    live = capacity = 0
+    for fiber, connectome in self.iter_connectomes():
+      live += connectome.nbytes
+      capacity += self._store.capacity_nbytes(fiber, connectome)
+    return live, capacity
+
+  def connectome_memory(self):
+    """Reports the size of every connectome.
+
+    Returns:
+      A dict from fiber (see `iter_connectomes`) to FiberMemory: the
+      current shape, live bytes, bytes allocated by the store (larger than
+      live for memory-mapped buffers with spare capacity), the fraction of
+      nonzero synapses and the live bytes added by the last projection step.
+      Computing the densities scans every connectome.
+    """
+    report = {}
+    for fiber, connectome in self.iter_connectomes():
+      report[fiber] = FiberMemory(
+          shape=connectome.shape,
+          live_bytes=connectome.nbytes,
+          capacity_bytes=self._store.capacity_nbytes(fiber, connectome),
+          density=(np.count_nonzero(connectome) / connectome.size
+                   if connectome.size else 0.0),
+          growth_bytes=connectome.nbytes - self._previous_bytes_by_fiber.get(
+              fiber, connectome.nbytes))
+    return report
+
+  def _projected_growth(self, to_update_area_names, new_block_areas=()):
+    """Upper bound of the bytes a step could add, per target area.
+
+    Assumes every updated lazy area gets k first-time winners (the most a
+    single step can add), and every block area in `new_block_areas` one
+    more block.
+    """
+    itemsize = np.dtype(connectome_store.CONNECTOME_DTYPE).itemsize
+    growth = {}
+    for area_name in to_update_area_names:
+      area = self.area_by_name[area_name]
+      if area.explicit or area.fixed_assembly:
+        continue
+      new = area.k
+      # One entry per stimulus vector, a column in every fiber into the
+      # area and a row in every fiber out of it (both for the self-fiber).
+      cells = new * len(self.connectomes_by_stimulus)
+      for other_name, other_area in self.area_by_name.items():
+        incoming_rows = self.connectomes[other_name][area_name].shape[0]
+        outgoing_cols = self.connectomes[area_name][other_name].shape[1]
+        if other_name == area_name:
+          cells += (incoming_rows + new) * (outgoing_cols + new) - (
+              incoming_rows * outgoing_cols)
+        else:
+          cells += new * incoming_rows + new * outgoing_cols
+      growth[area_name] = cells * itemsize
+    for area_name in new_block_areas:
+      growth[area_name] = growth.get(area_name, 0) + self._block_growth(
+          area_name)
+    return growth
+
+  def _check_memory_budget(self, to_update_area_names, new_block_areas=()):
+    live_bytes, _ = self.connectome_nbytes()
+    growth = self._projected_growth(to_update_area_names, new_block_areas)
+    if live_bytes + sum(growth.values()) <= self.memory_budget:
+      return
+    largest = sorted(self.iter_connectomes(), key=lambda item: -item[1].nbytes)
+    action = "Allocating a block" if new_block_areas else "Projection"
+    lines = [f"{action} could grow connectomes to "
+             f"{live_bytes + sum(growth.values()):,} bytes, over the "
+             f"memory_budget of {self.memory_budget:,} bytes.",
+             f"  currently live: {live_bytes:,} bytes"]
+    for area_name, num_bytes in growth.items():
+      lines.append(f"  growth into {area_name!r}: up to {num_bytes:,} bytes")
+    lines.append("  largest fibers:")
+    for fiber, connectome in largest[:10]:
+      lines.append(f"    {fiber}: {connectome.shape} = "
+                   f"{connectome.nbytes:,} bytes")
+    raise ConnectomeMemoryError("\n".join(lines))
+
+  def _record_memory(self):
+    live_bytes_by_fiber = {
+        fiber: connectome.nbytes
+        for fiber, connectome in self.iter_connectomes()}
+    _, capacity = self.connectome_nbytes()
+    self.saved_memory.append(MemorySample(
+        live_bytes=sum(live_bytes_by_fiber.values()),
+        capacity_bytes=capacity,
+        live_bytes_by_fiber=live_bytes_by_fiber))
+
+  def add_observer(self, observer, areas=None):
+    """Calls `observer(record)` for every area a projection updates.
+
+    Observers run once all target areas of the step have their new winners
+    (after `_update_winners`), in registration order, with a StepRecord
+    holding a read-only view of the area's winners and its support size.
+    They allow collecting per-step metrics without `save_winners`.
+
+    Args:
+      observer: A callable taking a StepRecord.
+      areas: Only report these areas (default: all).
+
+    Returns:
+      `observer`, for use with `remove_observer()`.
+    """
+    self._observers.append(
+        (observer, None if areas is None else frozenset(areas)))
+    return observer
+
+  def remove_observer(self, observer):
+    # `==` rather than `is`: bound methods are recreated on every access.
+    self._observers = [(o, areas) for o, areas in self._observers
+                       if o != observer]
+
+  def _notify_observers(self, area_names):
+    for area_name in area_names:
+      area = self.area_by_name[area_name]
+      record = None
+      for observer, areas in self._observers:
+        if areas is not None and area_name not in areas:
+          continue
+        if record is None:
+          winners = np.array(area.winners, dtype=np.uint32)
+          winners.flags.writeable = False
+          record = StepRecord(area_name, area.num_rounds - 1, winners,
+                              area.w, area.num_first_winners)
+        observer(record)
+
+  def enable_profiling(self, enabled=True):
+    """Turns per-phase profiling of projections on (fresh stats) or off."""
+    self._profiler = profiling.PhaseProfiler() if enabled else None
+
+  def profile_stats(self):
+    """Returns {(phase, target_area, fiber): (calls, seconds)}, or None.
+
+    See `profiling` for the phases; `fiber` is the stimulus or source area
+    name, or None for phases that concern the target area as a whole.
+    """
+    return self._profiler.stats() if self._profiler is not None else None
+
+  def profile_report(self):
+    """Returns a table of time spent per projection phase, area and fiber."""
+    if self._profiler is None:
+      return 'Profiling is disabled; use Brain(..., profile=True).'
+    return self._profiler.report()
+
   def add_stimulus(self, stimulus_name, size):
     """Add a stimulus to the current instance.
 
@@ -153,12 +403,13 @@ class Brain:
     self.stimulus_size_by_name[stimulus_name] = size
     this_stimulus_connectomes = {}
     for area_name in self.area_by_name:
+      key = ("stim", stimulus_name, area_name)
       if self.area_by_name[area_name].explicit:
-        this_stimulus_connectomes[area_name] = self._rng.binomial(
-            size, self.p,
-            size=self.area_by_name[area_name].n).astype(np.float32)
+        this_stimulus_connectomes[area_name] = self._store.adopt(
+            key, self._rng.binomial(
+                size, self.p, size=self.area_by_name[area_name].n))
       else:
-        this_stimulus_connectomes[area_name] = np.empty(0, dtype=np.float32)
+        this_stimulus_connectomes[area_name] = self._store.new(key, (0,))
       self.area_by_name[area_name].beta_by_stimulus[stimulus_name] = (
         self.area_by_name[area_name].beta)
     self.connectomes_by_stimulus[stimulus_name] = this_stimulus_connectomes
@@ -172,20 +423,24 @@ class Brain:
       k: Number of that can fire in this area, at any time step.
       beta: default area-beta.
     """
-    self.area_by_name[area_name] = the_area = Area(area_name, n, k, beta=beta)
+    self.area_by_name[area_name] = the_area = Area(
+        area_name, n, k, beta=beta, history_steps=self.history_steps,
+        history_dir=self.history_dir)
 
     for stim_name, stim_connectomes in self.connectomes_by_stimulus.items():
-      stim_connectomes[area_name] = np.empty(0, dtype=np.float32)
+      stim_connectomes[area_name] = self._store.new(
+          ("stim", stim_name, area_name), (0,))
       the_area.beta_by_stimulus[stim_name] = beta
 
     new_connectomes = {}
     for other_area_name in self.area_by_name:
       other_area = self.area_by_name[other_area_name]
       other_area_size = other_area.n if other_area.explicit else 0
-      new_connectomes[other_area_name] = np.empty((0, other_area_size), dtype=np.float32)
+      new_connectomes[other_area_name] = self._store.new(
+          ("area", area_name, other_area_name), (0, other_area_size))
       if other_area_name != area_name:
-        self.connectomes[other_area_name][area_name] = np.empty(
-          (other_area_size, 0), dtype=np.float32)
+        self.connectomes[other_area_name][area_name] = self._store.new(
+            ("area", other_area_name, area_name), (other_area_size, 0))
       # by default use beta for plasticity of synapses from this area
       # to other areas
       # by default use other area's beta for synapses from other area
@@ -213,14 +468,15 @@ class Brain:
     # Explicitly set w to n so that all computations involving this area
     # are explicit.
     self.area_by_name[area_name] = the_area = Area(
-        area_name, n, k, beta=beta, w=n, explicit=True)
+        area_name, n, k, beta=beta, w=n, explicit=True,
+        history_steps=self.history_steps, history_dir=self.history_dir)
     the_area.ever_fired = np.zeros(n, dtype=bool)
     the_area.num_ever_fired = 0
 
     for stim_name, stim_connectomes in self.connectomes_by_stimulus.items():
-      stim_connectomes[area_name] = self._rng.binomial(
-          self.stimulus_size_by_name[stim_name],
-          self.p, size=n).astype(np.float32)
+      stim_connectomes[area_name] = self._store.adopt(
+          ("stim", stim_name, area_name), self._rng.binomial(
+              self.stimulus_size_by_name[stim_name], self.p, size=n))
       the_area.beta_by_stimulus[stim_name] = beta
 
     inner_p = custom_inner_p if custom_inner_p is not None else self.p
@@ -229,28 +485,178 @@ class Brain:
 
     new_connectomes = {}
     for other_area_name in self.area_by_name:
+      out_key = ("area", area_name, other_area_name)
+      in_key = ("area", other_area_name, area_name)
       if other_area_name == area_name:  # create explicitly
-        new_connectomes[other_area_name] = self._rng.binomial(
-            1, inner_p, size=(n,n)).astype(np.float32)
+        new_connectomes[other_area_name] = self._store.adopt(
+            out_key, self._rng.binomial(1, inner_p, size=(n,n)))
       else:
         other_area = self.area_by_name[other_area_name]
         if other_area.explicit:
           other_n = self.area_by_name[other_area_name].n
-          new_connectomes[other_area_name] = self._rng.binomial(
-                  1, out_p, size=(n, other_n)).astype(np.float32)
-          self.connectomes[other_area_name][area_name] = self._rng.binomial(
-                  1, in_p, size=(other_n, n)).astype(np.float32)
+          new_connectomes[other_area_name] = self._store.adopt(
+              out_key, self._rng.binomial(1, out_p, size=(n, other_n)))
+          self.connectomes[other_area_name][area_name] = self._store.adopt(
+              in_key, self._rng.binomial(1, in_p, size=(other_n, n)))
         else: # we will fill these in on the fly
           # TODO: if explicit area added late, this will not work
           # But out_p to a non-explicit area must be default p,
           # for fast sampling to work.
-          new_connectomes[other_area_name] = np.empty((n, 0), dtype=np.float32)
-          self.connectomes[other_area_name][area_name] = np.empty((0, n), dtype=np.float32)
+          new_connectomes[other_area_name] = self._store.new(out_key, (n, 0))
+          self.connectomes[other_area_name][area_name] = self._store.new(
+              in_key, (0, n))
       self.area_by_name[other_area_name].beta_by_area[area_name] = (
         self.area_by_name[other_area_name].beta)
       self.area_by_name[area_name].beta_by_area[other_area_name] = beta
     self.connectomes[area_name] = new_connectomes
 
+  def add_block_area(self,
+                     area_name, k, beta, num_blocks=None, *,
+                     custom_inner_p=None,
+                     custom_out_p=None,
+                     custom_in_p=None):
+    """Add an explicit area of k-neuron blocks that are allocated on use.
+
+    The area behaves like an explicit area of num_blocks * k neurons whose
+    block i is the assembly `activate(area_name, i)` fires, but it starts
+    out empty: a block's neurons, and their rows and columns in every
+    connectome, are only sampled the first time the block is activated.
+    Neurons are numbered by slot (allocation order); see `Area.blocks`.
+
+    Only the blocks of the area's self-connectome are stored, as an
+    [n, k] array (row i: synapses from neuron i into the k neurons of its
+    own block). Synapses between different blocks are a fixed pseudo-random
+    function of the two neurons' block indices (see
+    `_cross_block_synapses`) and are not plastic. Memory thus grows
+    linearly with the blocks in use, and not with num_blocks.
+
+    Args:
+      area_name: The name of the new area.
+      k: Number of neurons per block (and of firing neurons).
+      beta: default area-beta.
+      num_blocks: Optional number of blocks, to validate block indices.
+      custom_inner_p: Optional self-linking probability.
+      custom_out_p: Optional custom output-link probability.
+      custom_in_p: Optional custom input-link probability.
+    """
+    self.add_explicit_area(area_name, 0, k, beta,
+                           custom_inner_p=custom_inner_p,
+                           custom_out_p=custom_out_p,
+                           custom_in_p=custom_in_p)
+    self.connectomes[area_name][area_name] = self._store.new(
+        ("area", area_name, area_name), (0, k))
+    the_area = self.area_by_name[area_name]
+    the_area.blocks = []
+    the_area.block_slots = {}
+    the_area.num_blocks = num_blocks
+    the_area.block_p = tuple(p if p is not None else self.p for p in (
+        custom_inner_p, custom_out_p, custom_in_p))
+    the_area.block_seed = int(self._rng.integers(2**63))
+
+  def _block_growth(self, area_name):
+    """Bytes that allocating one more block of a block area adds."""
+    area = self.area_by_name[area_name]
+    k = area.k
+    cells = k * len(self.connectomes_by_stimulus) + k * k
+    for other_name in self.area_by_name:
+      if other_name != area_name:
+        cells += k * self.connectomes[area_name][other_name].shape[1]
+        cells += k * self.connectomes[other_name][area_name].shape[0]
+    return cells * np.dtype(connectome_store.CONNECTOME_DTYPE).itemsize
+
+  def _block_slot(self, area_name, block):
+    """Returns the slot of a block area's block, allocating it if new."""
+    area = self.area_by_name[area_name]
+    slot = area.block_slots.get(block)
+    if slot is not None:
+      return slot
+    if block < 0 or (area.num_blocks is not None and block >= area.num_blocks):
+      raise IndexError(
+          f'Block {block} out of range for area {area_name!r} '
+          f'with {area.num_blocks} blocks.')
+    if self.memory_budget is not None:
+      self._check_memory_budget((), new_block_areas=(area_name,))
+    rng = self._rng
+    store = self._store
+    k = area.k
+    n = area.n
+    new_n = n + k
+    inner_p, out_p, in_p = area.block_p
+    # Connectomes grow with spare capacity (see ConnectomeStore.grow), so
+    # allocating block after block does not copy them every time.
+    for stim_name, stim_connectomes in self.connectomes_by_stimulus.items():
+      key = ("stim", stim_name, area_name)
+      stim_connectomes[area_name] = connectome = store.grow(
+          key, stim_connectomes[area_name], (new_n,))
+      connectome[n:] = rng.binomial(
+          self.stimulus_size_by_name[stim_name], self.p, size=k)
+    for other_area_name, other_area in self.area_by_name.items():
+      out_key = ("area", area_name, other_area_name)
+      if other_area_name == area_name:
+        self.connectomes[area_name][area_name] = connectome = store.grow(
+            out_key, self.connectomes[area_name][area_name], (new_n, k))
+        connectome[n:] = rng.binomial(1, inner_p, size=(k, k))
+        continue
+      # Lazy areas are filled with the default p on the fly, so their
+      # existing neurons get it here as well.
+      other_size = other_area.n if other_area.explicit else other_area.w
+      other_out_p = out_p if other_area.explicit else self.p
+      other_in_p = in_p if other_area.explicit else self.p
+      self.connectomes[area_name][other_area_name] = connectome = store.grow(
+          out_key, self.connectomes[area_name][other_area_name],
+          (new_n, other_size))
+      connectome[n:] = rng.binomial(1, other_out_p, size=(k, other_size))
+      in_key = ("area", other_area_name, area_name)
+      self.connectomes[other_area_name][area_name] = connectome = store.grow(
+          in_key, self.connectomes[other_area_name][area_name],
+          (other_size, new_n))
+      connectome[:, n:] = rng.binomial(1, other_in_p, size=(other_size, k))
+    area.n = area.w = new_n
+    area.ever_fired = np.concatenate([area.ever_fired, np.zeros(k, dtype=bool)])
+    slot = len(area.blocks)
+    area.blocks.append(block)
+    area.block_slots[block] = slot
+    return slot
+
+  def _cross_block_synapses(self, area, neurons):
+    """Synapses from `neurons` to all neurons of a block area, [len, n].
+
+    Synapses inside a block are zero here (they are stored, see
+    `add_block_area`); the others are Bernoulli(inner p), derived from a
+    hash of the area's seed and the (block, offset) of both neurons, so
+    they stay the same whatever the allocation order.
+    """
+    k = area.k
+    blocks = np.asarray(area.blocks, dtype=np.uint64)
+    ids = blocks[:, None] * np.uint64(k) + np.arange(k, dtype=np.uint64)
+    ids = ids.ravel()
+    neurons = np.asarray(neurons)
+    sources = ids[neurons]
+    with np.errstate(over='ignore'):
+      x = (np.uint64(area.block_seed) + sources[:, None]
+           * np.uint64(0x9E3779B97F4A7C15) + ids[None, :])
+      # splitmix64 finalizer.
+      x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+      x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+      x = x ^ (x >> np.uint64(31))
+    synapses = ((x >> np.uint64(11)).astype(np.float64) * 2.0**-53
+                < area.block_p[0]).astype(connectome_store.CONNECTOME_DTYPE)
+    own = neurons // k
+    for row, slot in enumerate(own):
+      synapses[row, slot * k:(slot + 1) * k] = 0
+    return synapses
+
+  def _block_self_inputs(self, area):
+    """Inputs of a block area's winners into all its neurons (self-fiber)."""
+    k = area.k
+    winners = np.asarray(area.winners)
+    connectome = self.connectomes[area.name][area.name]
+    inputs = self._cross_block_synapses(area, winners).sum(axis=0)
+    for w in winners:
+      start = (w // k) * k
+      inputs[start:start + k] += connectome[w]
+    return inputs
+
   def update_plasticity(self, from_area, to_area, new_beta):
     self.area_by_name[to_area].beta_by_area[from_area] = new_beta
 
@@ -277,11 +683,36 @@ class Brain:
 
   def activate(self, area_name, index):
     area = self.area_by_name[area_name]
+    if area.blocks is not None:
+      index = self._block_slot(area_name, index)
     k = area.k
     assembly_start = k * index
     area.winners = list(range(assembly_start, assembly_start + k))
     area.fix_assembly()
 
+  def assembly_index(self, area_name, labels=None):
+    """Returns the (cached) neuron -> assembly index of an explicit area.
+
+    Args:
+      area_name: The area, laid out as n // k assemblies of k neurons.
+      labels: Optional {assembly index: label} for `read_label()`; the
+        index is rebuilt when a different mapping is passed. For a block
+        area, assembly indices are block indices (as passed to
+        `activate`), and only allocated blocks are indexed.
+    """
+    area = self.area_by_name[area_name]
+    source_labels, index = self._assembly_indices.get(area_name, (None, None))
+    if (index is None or index.n != area.n or index.k != area.k
+        or source_labels is not labels):
+      slot_labels = labels
+      if area.blocks is not None and labels is not None:
+        slot_labels = {area.block_slots[block]: label
+                       for block, label in labels.items()
+                       if block in area.block_slots}
+      index = assembly.AssemblyIndex(area.n, area.k, slot_labels)
+      self._assembly_indices[area_name] = (labels, index)
+    return index
+
   def project(self, areas_by_stim, dst_areas_by_src_area, verbose=0):
     # Validate stim_area, area_area well defined
     # areas_by_stim: {"stim1":["A"], "stim2":["C","A"]}
@@ -305,7 +736,15 @@ class Brain:
           raise IndexError(f"Not in brain.area_by_name: {to_area_name}")
         area_in[to_area_name].append(from_area_name)
 
-    to_update_area_names = stim_in.keys() | area_in.keys()
+    # A dict rather than a set: the areas are updated (and draw from the
+    # RNG) in a fixed order, independent of string hashing.
+    to_update_area_names = dict.fromkeys([*stim_in, *area_in]).keys()
+
+    if self.memory_budget is not None:
+      self._check_memory_budget(to_update_area_names)
+    previous_bytes_by_fiber = {
+        fiber: connectome.nbytes
+        for fiber, connectome in self.iter_connectomes()}
 
     for area_name in to_update_area_names:
       area = self.area_by_name[area_name]
@@ -321,6 +760,11 @@ class Brain:
       area._update_winners()
       if self.save_size:
         area.saved_w.append(area.w)
+    self._previous_bytes_by_fiber = previous_bytes_by_fiber
+    if self.save_memory:
+      self._record_memory()
+    if self._observers:
+      self._notify_observers(to_update_area_names)
 
   def project_into(self, target_area, from_stimuli, from_areas, verbose=0):
     # projecting everything in from stim_in[area] and area_in[area]
@@ -331,6 +775,10 @@ class Brain:
     # have to wait to replace new_winners
     rng = self._rng
     area_by_name = self.area_by_name
+    prof = self._profiler
+    if prof is not None:
+      lap = prof.lap
+      t = prof.clock()
     if verbose >= 1:
       print(f"Projecting {', '.join(from_stimuli)} "
             f" and {', '.join(from_areas)} into {target_area.name}")
@@ -355,10 +803,18 @@ class Brain:
 	    for stim in from_stimuli:
 	      stim_inputs = self.connectomes_by_stimulus[stim][target_area_name]
 	      prev_winner_inputs += stim_inputs
+	      if prof is not None:
+	        t = lap(profiling.INPUTS, target_area_name, stim, t)
 	    for from_area_name in from_areas:
 	      connectome = self.connectomes[from_area_name][target_area_name]
-	      for w in self.area_by_name[from_area_name].winners:
-	        prev_winner_inputs += connectome[w]
+	      if (from_area_name == target_area_name
+	          and target_area.blocks is not None):
+	        prev_winner_inputs += self._block_self_inputs(target_area)
+	      else:
+	        for w in self.area_by_name[from_area_name].winners:
+	          prev_winner_inputs += connectome[w]
+	      if prof is not None:
+	        t = lap(profiling.INPUTS, target_area_name, from_area_name, t)
 
 	    if verbose >= 2:
 	      print("prev_winner_inputs:", prev_winner_inputs)
@@ -424,7 +880,12 @@ class Brain:
         # then you don't need the logic immediately after which sets the sample to total_k if the
         # truncnorm approximation gave something > total_k
         # however, this may be less likely to sample large inputs than the true binomial distribution
-	      potential_new_winner_inputs = (mu + truncnorm.rvs(a, np.inf, scale=std, size=target_area.k)).round(0)
+	      # Sample from the brain's own generator (not numpy's global state), so
+	      # that a seeded brain -- and a brain restored from a checkpoint --
+	      # is reproducible.
+	      potential_new_winner_inputs = (mu + truncnorm.rvs(
+	          a, np.inf, scale=std, size=target_area.k,
+	          random_state=rng)).round(0)
 	      for i in range(len(potential_new_winner_inputs)):
 	        if potential_new_winner_inputs[i] > total_k:
 	          potential_new_winner_inputs[i] = total_k
@@ -437,6 +898,8 @@ class Brain:
 	      # can generate area._new_winners, note the new indices
 	      all_potential_winner_inputs = np.concatenate(
 	          [prev_winner_inputs, potential_new_winner_inputs])
+	      if prof is not None:
+	        t = lap(profiling.SAMPLING, target_area_name, None, t)
 	    else:  # Case: Area is explicit.
 	      all_potential_winner_inputs = prev_winner_inputs
 
@@ -444,10 +907,9 @@ class Brain:
 	                                        range(len(all_potential_winner_inputs)),
 	                                        all_potential_winner_inputs.__getitem__)
 	    if target_area.explicit:
-	        for winner in new_winner_indices:
-	        	if not target_area.ever_fired[winner]:
-	        		target_area.ever_fired[winner] = True 
-	        		target_area.num_ever_fired += 1
+	      target_area.num_ever_fired += int(np.count_nonzero(
+	          ~target_area.ever_fired[new_winner_indices]))
+	      target_area.ever_fired[new_winner_indices] = True
 
 	    num_first_winners_processed = 0
 
@@ -463,6 +925,8 @@ class Brain:
 	          num_first_winners_processed += 1
 	    target_area._new_winners = new_winner_indices
 	    target_area._new_w = target_area.w + num_first_winners_processed
+	    if prof is not None:
+	      t = lap(profiling.TOP_K, target_area_name, None, t)
 
 	    if verbose >= 2:
 	      print(f"new_winners: {target_area._new_winners}")
@@ -489,6 +953,8 @@ class Brain:
 	        print(f"For first_winner # {i} with input "
 	              f"{first_winner_inputs[i]} split as so: "
 	              f"{num_connections_by_input_index}")
+	    if prof is not None and num_first_winners_processed:
+	      t = lap(profiling.FIRST_WINNERS, target_area_name, None, t)
 
     # connectome for each stim->area
       # add num_first_winners_processed cells, sampled input * (1+beta)
@@ -497,11 +963,13 @@ class Brain:
     for stim in from_stimuli:
       connectomes = self.connectomes_by_stimulus[stim]
       if num_first_winners_processed > 0:
-        connectomes[target_area_name] = target_connectome = np.resize(
+        connectomes[target_area_name] = target_connectome = self._store.resize(
+            ("stim", stim, target_area_name),
             connectomes[target_area_name],
-            target_area._new_w)
+            (target_area._new_w,))
       else:
-        target_connectome = connectomes[target_area_name]
+        connectomes[target_area_name] = target_connectome = self._store.writable(
+            ("stim", stim, target_area_name), connectomes[target_area_name])
       first_winner_synapses = target_connectome[target_area.w:]
       for i in range(num_first_winners_processed):
         first_winner_synapses[i] = (
@@ -515,18 +983,23 @@ class Brain:
         print(f"{stim} now looks like: ")
         print(self.connectomes_by_stimulus[stim][target_area_name])
       num_inputs_processed += 1
+      if prof is not None:
+        t = lap(profiling.STIMULUS_PLASTICITY, target_area_name, stim, t)
 
     # update connectomes from stimuli that were not fired this round into the area.
     if (not target_area.explicit) and (num_first_winners_processed > 0):
 	    for stim_name, connectomes in self.connectomes_by_stimulus.items():
 	        if stim_name in from_stimuli:
 	    	    continue
-	        connectomes[target_area_name] = the_connectome = np.resize(
+	        connectomes[target_area_name] = the_connectome = self._store.resize(
+	    		("stim", stim_name, target_area_name),
 	    		connectomes[target_area_name],
-	    		target_area._new_w)
+	    		(target_area._new_w,))
 	        the_connectome[target_area.w:] = rng.binomial(
                 self.stimulus_size_by_name[stim_name], self.p,
                 size=(num_first_winners_processed))
+	        if prof is not None:
+	          t = lap(profiling.STIMULUS_EXPANSION, target_area_name, stim_name, t)
 
     # connectome for each in_area->area
       # add num_first_winners_processed columns
@@ -535,30 +1008,50 @@ class Brain:
     for from_area_name in from_areas:
       from_area_w = self.area_by_name[from_area_name].w
       from_area_winners = self.area_by_name[from_area_name].winners
-      from_area_winners_set = set(from_area_winners)
       from_area_connectomes = self.connectomes[from_area_name]
-      # Q: Can we replace .pad() with numpy.resize() here?
-      the_connectome = from_area_connectomes[target_area_name] = np.pad(
+      the_connectome = from_area_connectomes[target_area_name] = (
+        self._store.resize(
+          ("area", from_area_name, target_area_name),
           from_area_connectomes[target_area_name],
-          ((0, 0), (0, num_first_winners_processed)))
+          (from_area_connectomes[target_area_name].shape[0],
+           from_area_connectomes[target_area_name].shape[1]
+           + num_first_winners_processed)))
+      the_connectome = from_area_connectomes[target_area_name] = (
+        self._store.writable(("area", from_area_name, target_area_name),
+                             the_connectome))
+      if num_first_winners_processed > 0:
+        # Rows of the source's support that did not fire, in increasing
+        # order (one Bernoulli draw each, as the scalar loop used to do).
+        non_winners = np.ones(from_area_w, dtype=bool)
+        non_winners[from_area_winners] = False
+        non_winner_rows = np.flatnonzero(non_winners)
       for i in range(num_first_winners_processed):
         total_in = inputs_by_first_winner_index[i][num_inputs_processed]
         sample_indices = rng.choice(from_area_winners, int(total_in), replace=False)
-        for j in sample_indices:
-          the_connectome[j, target_area.w + i] = 1.0
-        for j in range(from_area_w):
-          if j not in from_area_winners_set:
-            the_connectome[j, target_area.w + i] = rng.binomial(1, self.p)
+        the_connectome[sample_indices, target_area.w + i] = 1.0
+        the_connectome[non_winner_rows, target_area.w + i] = rng.binomial(
+            1, self.p, size=len(non_winner_rows))
       area_to_area_beta = (
         0 if self.disable_plasticity
         else target_area.beta_by_area[from_area_name])
-      for i in target_area._new_winners:
-        for j in from_area_winners:
-          the_connectome[j, i] *= 1.0 + area_to_area_beta
+      if (from_area_name == target_area_name
+          and target_area.blocks is not None):
+        # Only synapses within a block are stored (and plastic).
+        k = target_area.k
+        for i in target_area._new_winners:
+          for j in from_area_winners:
+            if i // k == j // k:
+              the_connectome[j, i % k] *= 1.0 + area_to_area_beta
+      else:
+        for i in target_area._new_winners:
+          for j in from_area_winners:
+            the_connectome[j, i] *= 1.0 + area_to_area_beta
       if verbose >= 2:
         print(f"Connectome of {from_area_name} to {target_area_name} is now:",
               the_connectome)
       num_inputs_processed += 1
+      if prof is not None:
+        t = lap(profiling.AREA_PLASTICITY, target_area_name, from_area_name, t)
 
     # expand connectomes from other areas that did not fire into area
     # also expand connectome for area->other_area
@@ -566,24 +1059,36 @@ class Brain:
       other_area_connectomes = self.connectomes[other_area_name]
       if other_area_name not in from_areas:
         the_other_area_connectome = other_area_connectomes[target_area_name] = (
-          np.pad(
+          self._store.resize(
+              ("area", other_area_name, target_area_name),
               other_area_connectomes[target_area_name],
-              ((0, 0), (0, num_first_winners_processed))))
-        the_other_area_connectome[:, target_area.w:] = rng.binomial(
-          1, self.p, size=(the_other_area_connectome.shape[0],
-                           target_area._new_w - target_area.w))
+              (other_area_connectomes[target_area_name].shape[0],
+               other_area_connectomes[target_area_name].shape[1]
+               + num_first_winners_processed)))
+        # (Skipped when nothing grew: a read-only shared connectome must
+        # not be written to, and an empty draw does not advance the rng.)
+        if num_first_winners_processed > 0:
+          the_other_area_connectome[:, target_area.w:] = rng.binomial(
+            1, self.p, size=(the_other_area_connectome.shape[0],
+                             target_area._new_w - target_area.w))
       # add num_first_winners_processed rows, all bernoulli with probability p
       target_area_connectomes = self.connectomes[target_area_name]
       the_target_area_connectome = target_area_connectomes[other_area_name] = (
-        np.pad(
+        self._store.resize(
+          ("area", target_area_name, other_area_name),
           target_area_connectomes[other_area_name],
-          ((0, num_first_winners_processed), (0, 0))))
-      the_target_area_connectome[target_area.w:, :] = rng.binomial(
-          1, self.p,
-          size=(target_area._new_w - target_area.w,
-                the_target_area_connectome.shape[1]))
+          (target_area_connectomes[other_area_name].shape[0]
+           + num_first_winners_processed,
+           target_area_connectomes[other_area_name].shape[1])))
+      if num_first_winners_processed > 0:
+        the_target_area_connectome[target_area.w:, :] = rng.binomial(
+            1, self.p,
+            size=(target_area._new_w - target_area.w,
+                  the_target_area_connectome.shape[1]))
       if verbose >= 2:
         print(f"Connectome of {target_area_name!r} to {other_area_name!r} "
               "is now:", self.connectomes[target_area_name][other_area_name])
+      if prof is not None:
+        t = lap(profiling.AREA_EXPANSION, target_area_name, other_area_name, t)
 
     return num_first_winners_processed
@@ -0,0 +1,582 @@
+#! /usr/bin/python
+
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import assembly
+import assembly_analytics
+import benchmarks
+import brain
+import brain_util
+import checkpoint
+import connectivity
+import history
+import meanfield
+import observers
+import scaling
+import shared_brain
+import simulations
+import sweep
+
+
+def small_brain(connectome_dir=None):
+    np.random.seed(1)
+    b = brain.Brain(0.05, seed=1, connectome_dir=connectome_dir)
+    b.add_stimulus("stim", 30)
+    b.add_area("A", 3000, 30, 0.1)
+    b.add_area("B", 3000, 30, 0.1)
+    b.add_explicit_area("E", 200, 20, 0.1)
+    return b
+
+
+def run_small_brain(b, rounds=10):
+    b.project({"stim": ["A"]}, {})
+    for _ in range(rounds):
+        b.project({"stim": ["A"]}, {"A": ["A", "B", "E"]})
+    for _ in range(3):
+        b.project({}, {"A": ["B"], "B": ["A", "B"], "E": ["A"]})
+    return b
+
+
+class TestConnectomeStorage(unittest.TestCase):
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    def test_memmap_matches_in_memory(self):
+        b_mem = run_small_brain(small_brain())
+        b_map = run_small_brain(small_brain(self.scratch))
+        for area_name in b_mem.area_by_name:
+            self.assertEqual(b_mem.area_by_name[area_name].saved_w,
+                             b_map.area_by_name[area_name].saved_w)
+        for from_area, connectomes in b_mem.connectomes.items():
+            for to_area, connectome in connectomes.items():
+                np.testing.assert_array_equal(
+                    connectome, b_map.connectomes[from_area][to_area])
+        stats = b_map.paging_stats()
+        self.assertEqual(stats['backend'], 'memmap')
+        self.assertGreater(stats['num_remaps'], 0)
+        self.assertEqual(stats['num_files'], len(os.listdir(self.scratch)))
+        b_map.close()
+        self.assertEqual(os.listdir(self.scratch), [])
+
+
+class TestSharedBrain(unittest.TestCase):
+    def test_attached_brain_matches_copy(self):
+        b = run_small_brain(small_brain(), rounds=3)
+        template = shared_brain.publish(b)
+        try:
+            attached = run_small_brain(template.attach(), rounds=3)
+            run_small_brain(b, rounds=3)
+            for area_name in b.area_by_name:
+                self.assertEqual(b.area_by_name[area_name].saved_w,
+                                 attached.area_by_name[area_name].saved_w)
+            for (key, connectome), (other_key, other) in zip(
+                    b.iter_connectomes(), attached.iter_connectomes()):
+                self.assertEqual(key, other_key)
+                np.testing.assert_array_equal(connectome, other)
+            stats = attached.paging_stats()
+            self.assertEqual(stats['backend'], 'copy-on-write')
+            self.assertGreater(stats['num_private_copies'], 0)
+            # The shared block still holds the published connectomes.
+            fresh = template.attach()
+            published = run_small_brain(small_brain(), rounds=3)
+            for (_, connectome), (_, shared) in zip(
+                    published.iter_connectomes(), fresh.iter_connectomes()):
+                np.testing.assert_array_equal(connectome, shared)
+            del attached, fresh, shared, other
+        finally:
+            template.unlink()
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    def run_rounds(self, b, start, stop, ckpt=None):
+        for i in range(start, stop):
+            if i == 0:
+                b.project({"stim": ["A"]}, {})
+            elif i == 1:
+                b.project({"stim": ["A"]}, {"A": ["A", "B"]})
+            else:
+                b.project({"stim": ["A"]}, {"A": ["A", "B"], "B": ["A"]})
+            if ckpt:
+                ckpt.step(next_round=i + 1)
+
+    def test_resume_is_bit_identical(self):
+        expected = small_brain()
+        self.run_rounds(expected, 0, 12)
+
+        interrupted = small_brain()
+        ckpt = checkpoint.Checkpointer(interrupted, self.scratch, every=2,
+                                       full_every=3)
+        self.run_rounds(interrupted, 0, 9, ckpt)
+        # Only the chain since the last full snapshot is kept.
+        self.assertLessEqual(len(checkpoint.checkpoint_files(self.scratch)), 3)
+
+        resumed = small_brain()
+        ckpt = checkpoint.Checkpointer(resumed, self.scratch, every=2,
+                                       full_every=3)
+        extra = ckpt.restore()
+        self.assertEqual(extra, {"next_round": 8})
+        self.run_rounds(resumed, extra["next_round"], 12, ckpt)
+
+        for area_name, area in expected.area_by_name.items():
+            self.assertEqual(area.saved_w,
+                             resumed.area_by_name[area_name].saved_w)
+            self.assertEqual(area.winners,
+                             resumed.area_by_name[area_name].winners)
+        for from_area, connectomes in expected.connectomes.items():
+            for to_area, connectome in connectomes.items():
+                np.testing.assert_array_equal(
+                    connectome, resumed.connectomes[from_area][to_area])
+
+    def test_resume_with_bounded_history(self):
+        expected = small_brain()
+        expected.save_winners = True
+        self.run_rounds(expected, 0, 12)
+
+        interrupted = small_brain()
+        interrupted.save_winners = True
+        for area in interrupted.area_by_name.values():
+            area.saved_winners = history.WinnerHistory(max_steps=4)
+        ckpt = checkpoint.Checkpointer(interrupted, self.scratch, every=3)
+        self.run_rounds(interrupted, 0, 9, ckpt)
+
+        resumed = small_brain()
+        resumed.save_winners = True
+        ckpt = checkpoint.Checkpointer(resumed, self.scratch, every=3)
+        self.run_rounds(resumed, ckpt.restore()["next_round"], 12, ckpt)
+        saved_winners = resumed.area_by_name["A"].saved_winners
+        self.assertEqual(saved_winners.max_steps, 4)
+        self.assertEqual(saved_winners.num_appended, 12)
+        self.assertEqual(saved_winners,
+                         expected.area_by_name["A"].saved_winners[-4:])
+
+
+class TestHistory(unittest.TestCase):
+    def test_winner_history_is_list_like(self):
+        b = run_small_brain(small_brain())
+        b.save_winners = True
+        for _ in range(3):
+            b.project({"stim": ["A"]}, {"A": ["A"]})
+        saved_winners = b.area_by_name["A"].saved_winners
+        self.assertEqual(len(saved_winners), 3)
+        self.assertEqual(saved_winners[-1], b.area_by_name["A"].winners)
+        self.assertEqual(saved_winners.to_array().shape, (3, 30))
+        self.assertEqual(saved_winners.to_array().dtype, np.uint32)
+
+    def test_ring_and_spill(self):
+        scratch = tempfile.mkdtemp()
+        try:
+            steps = history.StepHistory(max_steps=3, chunk_size=2,
+                                        spill_dir=scratch)
+            winners = history.WinnerHistory(max_steps=3, chunk_size=2)
+            for i in range(7):
+                steps.append(i)
+                winners.append(list(range(i, i + 1 + i % 2)))
+            self.assertEqual(steps, [4, 5, 6])
+            self.assertEqual(winners, [[4], [5, 6], [6]])
+            self.assertEqual(winners.num_dropped, 4)
+            self.assertEqual(len(os.listdir(scratch)), 1)
+            self.assertEqual(copy.deepcopy(steps), [4, 5, 6])
+            with self.assertRaises(ValueError):
+                winners.to_array()
+            steps.truncate(-1)
+            self.assertEqual(steps[:], [4, 5])
+            del steps
+        finally:
+            shutil.rmtree(scratch)
+
+    def test_growth_is_geometric(self):
+        steps = history.StepHistory(chunk_size=4)
+        capacities = set()
+        for i in range(1000):
+            steps.append(i)
+            capacities.add(steps._data.shape[0])
+        self.assertEqual(sorted(capacities),
+                         [4, 8, 16, 32, 64, 128, 256, 512, 1024])
+        self.assertEqual(steps[:], list(range(1000)))
+
+
+class TestAssemblyAnalytics(unittest.TestCase):
+    def test_matches_set_overlaps(self):
+        b = small_brain()
+        b.save_winners = True
+        run_small_brain(b)
+        saved_winners = b.area_by_name["A"].saved_winners
+        steps = list(saved_winners)
+        steps[3] = steps[3][:10]
+        for winners_list in (saved_winners, steps):
+            matrix = assembly_analytics.overlap_matrix(winners_list)
+            for i, a in enumerate(winners_list):
+                for j, b_winners in enumerate(winners_list):
+                    self.assertEqual(matrix[i, j],
+                                     len(set(a) & set(b_winners)))
+            self.assertEqual(
+                list(assembly_analytics.overlaps_with_reference(
+                    winners_list, 5, percentage=True)),
+                list(matrix[:, 5] / matrix[5, 5]))
+
+    def test_overlap_accepts_any_iterable(self):
+        for a, b in (({1, 2, 3}, {2, 3, 4}), ([1, 2, 3], [2, 3, 4]),
+                     (np.array([1, 2, 3]), np.array([2, 3, 4])),
+                     ({1, 2, 3}, np.array([2, 3, 4]))):
+            self.assertEqual(brain_util.overlap(a, b), 2)
+            self.assertEqual(brain_util.overlap(a, b, percentage=True), 2 / 3)
+
+
+class TestAssembly(unittest.TestCase):
+    def test_assembly_index_matches_set_readout(self):
+        n, k = 105, 10
+        # Words 'x' and 'y' share assembly 3; the first in dict order wins.
+        lexicon = {'a': {'index': 0}, 'x': {'index': 3}, 'y': {'index': 3},
+                   'b': {'index': 7}}
+        index = assembly.AssemblyIndex(
+            n, k, assembly.labels_from_lexicon(lexicon))
+        rng = np.random.default_rng(1)
+        for _ in range(50):
+            winners = rng.choice(n, k, replace=False).tolist()
+            if rng.random() < 0.7:
+                block = int(rng.choice([0, 3, 5, 7]))
+                winners[:8] = range(block * k, block * k + 8)
+            winners = list(dict.fromkeys(winners))
+            expected = None
+            for word, lexeme in lexicon.items():
+                start = lexeme['index'] * k
+                if len(set(winners) & set(range(start, start + k))) >= 0.7 * k:
+                    expected = word
+                    break
+            self.assertEqual(index.read_label(winners, 0.7), expected)
+            unlabeled = [i for i in range(n // k)
+                         if len(set(winners) & set(range(i * k, i * k + k)))
+                         >= 0.7 * k]
+            self.assertEqual(
+                assembly.AssemblyIndex(n, k).readout(winners, 0.7),
+                unlabeled[0] if unlabeled else None)
+
+
+class TestConnectivity(unittest.TestCase):
+    def test_metrics_match_pair_loops(self):
+        b = small_brain()
+        run_small_brain(b)
+        conn = b.connectomes["A"]["A"]
+        winners = b.areas["A"].winners
+        edges = weight = mutual = directed = 0
+        for i in winners:
+            for j in winners:
+                if conn[i][j] != 0:
+                    edges += 1
+                    weight += conn[i][j]
+                    if i != j:
+                        directed += 1
+                        mutual += conn[j][i] != 0
+        metrics = connectivity.assembly_metrics(conn, winners, bins=5)
+        self.assertEqual(metrics['num_edges'], edges)
+        self.assertAlmostEqual(metrics['density'], edges / len(winners) ** 2)
+        self.assertAlmostEqual(metrics['mean_weight'], weight / edges)
+        self.assertAlmostEqual(metrics['reciprocity'], mutual / directed)
+        self.assertEqual(metrics['weight_histogram'][0].sum(), edges)
+        sparse_conn = connectivity.sparse.csr_matrix(conn)
+        self.assertAlmostEqual(connectivity.density(sparse_conn, winners),
+                               metrics['density'])
+        other = np.random.default_rng(0).choice(
+            b.areas["A"].w, len(winners), replace=False)
+        batch = connectivity.batch_metrics(conn, [winners, other])
+        self.assertEqual(batch[0]['num_edges'], edges)
+        self.assertEqual(
+            batch[1], connectivity.assembly_metrics(conn, other))
+
+
+class TestScaling(unittest.TestCase):
+    def test_measure_and_fit(self):
+        init = brain.Brain.__init__
+        result = scaling.measure(
+            'projection', dict(n=2000, k=20, p=0.05, beta=0.05, rounds=3,
+                               num_areas=1))
+        self.assertIs(brain.Brain.__init__, init)
+        self.assertGreater(result['final_w'], 20)
+        self.assertGreater(result['connectome_bytes'], 0)
+        self.assertGreater(sum(result['phase_seconds'].values()), 0)
+        self.assertAlmostEqual(
+            scaling.fit_exponent([10, 20, 40], [3, 12, 48]), 2.0)
+
+
+class TestSweep(unittest.TestCase):
+    def test_parallel_matches_inline_and_caches(self):
+        points = sweep.grid(n=[2000], k=[20], p=[0.05], beta=[0.05, 0.1],
+                            rounds=[3])
+        cache_dir = tempfile.mkdtemp()
+        try:
+            parallel = sweep.run(simulations.density, points, seeds=[0, 1],
+                                 processes=2, cache_dir=cache_dir,
+                                 verbose=False)
+            inline = sweep.run(simulations.density, points, seeds=[0, 1],
+                               processes=1, verbose=False)
+            cached = sweep.run(simulations.density, points, seeds=[0, 1],
+                               processes=1, cache_dir=cache_dir,
+                               verbose=False)
+        finally:
+            shutil.rmtree(cache_dir)
+        self.assertEqual([r.value for r in parallel],
+                         [r.value for r in inline])
+        self.assertEqual([r.value for r in cached],
+                         [r.value for r in inline])
+        self.assertTrue(all(r.cached for r in cached))
+        self.assertNotEqual(sweep.point_seed(points[0], 0),
+                            sweep.point_seed(points[1], 0))
+
+    def test_adaptive_stops_at_width_or_budget(self):
+        points = sweep.grid(n=[2000], k=[20], p=[0.05], beta=[0.1],
+                            rounds=[3])
+        wide, = sweep.run_adaptive(simulations.density, points, width=1.0,
+                                   statistic=lambda out: out[0],
+                                   processes=1, verbose=False)
+        self.assertEqual(wide.num_trials, 3)
+        self.assertTrue(wide.converged)
+        narrow, = sweep.run_adaptive(simulations.density, points, width=1e-9,
+                                     statistic=lambda out: out[0],
+                                     max_trials=5, processes=1,
+                                     verbose=False)
+        self.assertEqual(narrow.num_trials, 5)
+        self.assertFalse(narrow.converged)
+        self.assertEqual(narrow.values[:3], wide.values)
+
+
+class TestMeanField(unittest.TestCase):
+    def test_tracks_exact_support_growth(self):
+        report, = meanfield.check([dict(n=10000, k=100, p=0.01, beta=0.1)],
+                                  t=20)
+        self.assertLess(report['final_error'], 0.2)
+        self.assertLessEqual(abs(report['meanfield_convergence']
+                                 - report['exact_convergence']), 3)
+        w = meanfield.project_w(10000, 100, 0.01, 0.1, t=20)
+        self.assertEqual(w[0], 100)
+        self.assertEqual(w, sorted(w))
+
+
+class TestObservers(unittest.TestCase):
+    def test_observers_match_saved_history(self):
+        b = small_brain()
+        b.save_winners = True
+        records = []
+        b.add_observer(records.append, areas=["A"])
+        overlap = b.add_observer(
+            observers.OverlapObserver(reference_round=5), areas=["A"])
+        stats = b.add_observer(observers.RoundStats(lambda r: r.w))
+        run_small_brain(b)
+        area = b.area_by_name["A"]
+        self.assertEqual([r.round for r in records],
+                         list(range(len(area.saved_winners))))
+        self.assertEqual([r.w for r in records], area.saved_w)
+        self.assertEqual([r.winners.tolist() for r in records],
+                         area.saved_winners)
+        self.assertFalse(records[-1].winners.flags.writeable)
+        reference = set(area.saved_winners[5])
+        self.assertEqual(overlap.overlaps,
+                         [len(reference & set(winners))
+                          for winners in area.saved_winners])
+        self.assertEqual(stats.summary("B")["max"],
+                         max(b.area_by_name["B"].saved_w))
+        b.remove_observer(records.append)
+        b.project({"stim": ["A"]}, {"A": ["A"]})
+        self.assertEqual(len(records), len(area.saved_winners) - 1)
+
+
+class TestProfiling(unittest.TestCase):
+    def test_profiling_does_not_change_results(self):
+        plain = run_small_brain(small_brain())
+        profiled = small_brain()
+        profiled.enable_profiling()
+        run_small_brain(profiled)
+        self.assertIsNone(plain.profile_stats())
+        for area_name, area in plain.area_by_name.items():
+            self.assertEqual(area.saved_w,
+                             profiled.area_by_name[area_name].saved_w)
+        stats = profiled.profile_stats()
+        self.assertEqual(stats[("inputs", "A", "stim")].calls, 11)
+        self.assertEqual(stats[("top_k", "E", None)].calls, 10)
+        self.assertIn(("area_plasticity", "B", "A"), stats)
+        self.assertIn("sampling", profiled.profile_report())
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_tiny_case_and_compare(self):
+        params = dict(n=2000, k=20, p=0.05, beta=0.05, rounds=2, num_areas=2)
+        cases = list(benchmarks.cases(['projection', 'merge'], params,
+                                      {'num_areas': [1, 2], 'k': [20]}))
+        self.assertEqual(cases, [('projection', dict(params, num_areas=1)),
+                                 ('projection', params),
+                                 ('merge', params)])
+        result = benchmarks.run_case('projection', params, repeat=1,
+                                     measure_memory=False)
+        self.assertGreater(result['min_seconds'], 0)
+        self.assertIsNone(result['peak_bytes'])
+        baseline = {'results': [
+            dict(result, min_seconds=1.0, peak_bytes=100),
+            dict(result, params=dict(params, k=40), min_seconds=1.0,
+                 peak_bytes=None)]}
+        new = {'results': [
+            dict(result, min_seconds=1.1, peak_bytes=200),
+            dict(result, params=dict(params, k=40), min_seconds=0.5,
+                 peak_bytes=None)]}
+        self.assertEqual(benchmarks.compare(new, baseline, tolerance=0.2),
+                         [('projection', params, 'peak_bytes', 100, 200, 2.0)])
+        # Swapped, the memory drop is fine but the k=40 case got slower.
+        self.assertEqual(
+            benchmarks.compare(baseline, new, tolerance=0.2),
+            [('projection', dict(params, k=40), 'min_seconds', 0.5, 1.0, 2.0)])
+        self.assertEqual(len(benchmarks.compare(new, baseline, tolerance=0.05)),
+                         2)
+
+
+class TestMemoryAccounting(unittest.TestCase):
+    def test_memory_report_and_time_series(self):
+        b = small_brain()
+        b.save_memory = True
+        run_small_brain(b, rounds=3)
+        report = b.connectome_memory()
+        self.assertEqual(report[("area", "A", "A")].shape,
+                         b.connectomes["A"]["A"].shape)
+        self.assertEqual(report[("stim", "stim", "E")].live_bytes, 200 * 4)
+        live, capacity = b.connectome_nbytes()
+        self.assertEqual(live, sum(m.live_bytes for m in report.values()))
+        self.assertEqual(capacity, live)
+        self.assertGreater(report[("area", "A", "A")].density, 0.0)
+        self.assertEqual(len(b.saved_memory), len(b.area_by_name["A"].saved_w))
+        self.assertEqual(b.saved_memory[-1].live_bytes, live)
+        growth = [later.live_bytes - earlier.live_bytes
+                  for earlier, later in zip(b.saved_memory, b.saved_memory[1:])]
+        self.assertEqual(sum(m.growth_bytes for m in report.values()),
+                         growth[-1])
+
+    def test_budget_raises_before_projecting(self):
+        b = small_brain()
+        run_small_brain(b, rounds=1)
+        live, _ = b.connectome_nbytes()
+        b.memory_budget = live + 1
+        saved_w = list(b.area_by_name["A"].saved_w)
+        with self.assertRaises(brain.ConnectomeMemoryError) as raised:
+            b.project({"stim": ["A"]}, {"A": ["A"]})
+        self.assertIn("growth into 'A'", str(raised.exception))
+        self.assertEqual(b.area_by_name["A"].saved_w, saved_w)
+        self.assertEqual(b.connectome_nbytes()[0], live)
+
+
+class TestBlockArea(unittest.TestCase):
+    def block_brain(self, **kwargs):
+        b = brain.Brain(0.05, seed=1, **kwargs)
+        b.add_stimulus("stim", 30)
+        b.add_area("A", 3000, 30, 0.1)
+        b.add_block_area("W", 20, 0.1, num_blocks=10000)
+        b.add_explicit_area("E", 50, 10, 0.1)
+        return b
+
+    def test_blocks_are_allocated_on_activation(self):
+        b = self.block_brain()
+        self.assertEqual(b.connectome_nbytes()[0],
+                         b.connectomes["E"]["E"].nbytes + 50 * 4)
+        b.activate("W", 9000)
+        b.project({}, {"W": ["A", "E"]})
+        b.project({}, {"W": ["A"], "A": ["A", "W"]})
+        # Allocated after A has fired: its rows and columns cover A's support.
+        b.activate("W", 3)
+        b.project({}, {"W": ["A", "W"], "A": ["A"]})
+        area = b.area_by_name["W"]
+        self.assertEqual(area.blocks, [9000, 3])
+        self.assertEqual(area.winners, list(range(20, 40)))
+        w = b.area_by_name["A"].w
+        # The self-fiber only stores each neuron's synapses into its block.
+        self.assertEqual(b.connectomes["W"]["W"].shape, (40, 20))
+        self.assertEqual(b.connectomes["W"]["A"].shape, (40, w))
+        self.assertEqual(b.connectomes["A"]["W"].shape, (w, 40))
+        self.assertEqual(b.connectomes["W"]["E"].shape, (40, 50))
+        self.assertEqual(b.connectomes_by_stimulus["stim"]["W"].shape, (40,))
+        self.assertGreater(b.connectomes["W"]["A"][20:].sum(), 0)
+        index = b.assembly_index("W", {3: "three", 9000: "nine", 5: "five"})
+        self.assertEqual(index.read_label(area.winners, 0.7), "three")
+        self.assertEqual(index.read_label(range(20), 0.7), "nine")
+        b.activate("W", 9000)
+        self.assertEqual(area.winners, list(range(20)))
+        with self.assertRaises(IndexError):
+            b.activate("W", 10000)
+
+    def test_self_projection_between_blocks(self):
+        b = self.block_brain()
+        for block in (7, 2, 5):
+            b.activate("W", block)
+        area = b.area_by_name["W"]
+        stored = b.connectomes["W"]["W"].copy()
+        cross = b._cross_block_synapses(area, range(60))
+        # Synapses between blocks do not depend on the allocation order.
+        other = self.block_brain()
+        other.area_by_name["W"].block_seed = area.block_seed
+        for block in (5, 7, 2):
+            other.activate("W", block)
+        other_cross = other._cross_block_synapses(
+            other.area_by_name["W"], [20, 21, 40, 41])
+        self.assertTrue(np.array_equal(
+            other_cross[:, [20, 21, 40, 41, 0, 1]],
+            cross[[0, 1, 20, 21]][:, [0, 1, 20, 21, 40, 41]]))
+        self.assertTrue(np.all(cross[:20, :20] == 0))
+        self.assertAlmostEqual(cross[:20, 20:].mean(), 0.05, delta=0.03)
+        # Unfixed self-projection: the inputs are the stored block plus the
+        # synapses into the other blocks.
+        b.area_by_name["W"].unfix_assembly()
+        winners = list(area.winners)
+        expected = cross[40:60].sum(axis=0)
+        expected[40:60] += stored[40:60].sum(axis=0)
+        top = set(np.argsort(-expected, kind="stable")[:20].tolist())
+        b.project({}, {"W": ["W"]})
+        self.assertEqual(set(area.winners), top)
+        beta = 1.1
+        for j in winners:
+            for i in area.winners:
+                if i // 20 == j // 20:
+                    self.assertAlmostEqual(
+                        b.connectomes["W"]["W"][j, i % 20],
+                        stored[j, i % 20] * beta, places=5)
+
+    def test_memory_grows_linearly_with_blocks(self):
+        b = self.block_brain()
+        b.activate("W", 0)
+        b.project({}, {"W": ["A"]})
+        live_bytes = []
+        for block in range(1, 401):
+            b.activate("W", block * 7)
+            if block % 100 == 0:
+                live_bytes.append(b.connectome_nbytes()[0])
+        increments = np.diff(live_bytes)
+        self.assertTrue(np.all(increments == increments[0]))
+        live, capacity = b.connectome_nbytes()
+        self.assertLess(capacity, 2 * live)
+        # An eager area of the same size would need 401 * 20 neurons squared
+        # for its self-connectome alone.
+        self.assertLess(live, (401 * 20) ** 2)
+
+    def test_budget_covers_new_blocks(self):
+        b = self.block_brain()
+        b.activate("W", 0)
+        live, _ = b.connectome_nbytes()
+        b.memory_budget = live + b._block_growth("W") - 1
+        b.activate("W", 0)
+        with self.assertRaises(brain.ConnectomeMemoryError) as raised:
+            b.activate("W", 1)
+        self.assertIn("growth into 'W'", str(raised.exception))
+        self.assertEqual(b.area_by_name["W"].blocks, [0])
+        self.assertEqual(b.connectome_nbytes()[0], live)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import assembly_analytics
 import brain
 import numpy as np
 import random
@@ -16,24 +17,12 @@ def sim_load(file_name):
 		return pickle.load(f)
 
 # Compute item overlap between two lists viewed as sets.
+# (For many steps at once see assembly_analytics.overlap_matrix.)
 def overlap(a,b,percentage=False):
-	o = len(set(a) & set(b))
-	if percentage:
-		return (float(o)/float(len(b)))
-	else:
-		return o
+	return assembly_analytics.overlap(a,b,percentage)
 
 # Compute overlap of each list of winners in winners_list 
 # with respect to a specific winners set, namely winners_list[base]
 def get_overlaps(winners_list,base,percentage=False):
-	overlaps = []
-	base_winners = winners_list[base]
-	k = len(base_winners)
-	for i in xrange(len(winners_list)):
-		o = overlap(winners_list[i],base_winners)
-		if percentage:
-			overlaps.append(float(o)/float(k))
-		else:
-			overlaps.append(o)
-	return overlaps
-
+	return assembly_analytics.overlaps_with_reference(
+		winners_list,base,percentage).tolist()
@@ -0,0 +1,349 @@
+# Incremental, resumable checkpoints for long simulations.
+#
+# A checkpoint directory holds a chain of files checkpoint-000000.pkl,
+# checkpoint-000001.pkl, ... Every `full_every`-th file is a full snapshot;
+# the files in between only contain
+# - the connectome tiles whose contents changed since the previous file,
+# - the entries appended to each area's saved_w / saved_winners,
+# - the (small) rest of the brain: areas, winners, betas, the brain's RNG,
+# plus the global numpy / `random` RNG states and a driver-defined `extra`
+# dict (e.g. the loop index to continue from). Restoring replays the chain
+# from the last full snapshot, so a resumed run continues bit-identically.
+#
+# Typical driver loop:
+#   ckpt = checkpoint.Checkpointer(b, "ckpt_dir", every=10)
+#   extra = ckpt.restore()   # None on a fresh start
+#   start = extra["next_step"] if extra else 0
+#   for i in range(start, t):
+#     b.project(...)
+#     ckpt.step(next_step=i+1)
+
+import copy
+import glob
+import hashlib
+import os
+import pickle
+import random
+
+import numpy as np
+
+CHECKPOINT_VERSION = 1
+# 2D connectomes are diffed in TILE_SHAPE tiles, stimulus vectors in
+# VECTOR_TILE-sized chunks.
+TILE_SHAPE = (256, 256)
+VECTOR_TILE = 1 << 16
+_FILE_PATTERN = 'checkpoint-%06d.pkl'
+
+
+def _set_connectome(brain, key, array):
+  kind, source, target = key
+  if kind == 'stim':
+    brain.connectomes_by_stimulus.setdefault(source, {})[target] = array
+  else:
+    brain.connectomes.setdefault(source, {})[target] = array
+
+
+def _tiles(shape):
+  """Yields (tile_index, slices) covering an array of the given shape."""
+  if len(shape) == 1:
+    for start in range(0, shape[0], VECTOR_TILE):
+      yield (start // VECTOR_TILE,), (slice(start, start + VECTOR_TILE),)
+    return
+  rows, cols = TILE_SHAPE
+  for row in range(0, shape[0], rows):
+    for col in range(0, shape[1], cols):
+      yield ((row // rows, col // cols),
+             (slice(row, row + rows), slice(col, col + cols)))
+
+
+def _tile_slices(shape_len, tile_index, tile_shape):
+  if shape_len == 1:
+    start = tile_index[0] * VECTOR_TILE
+    return (slice(start, start + tile_shape[0]),)
+  row = tile_index[0] * TILE_SHAPE[0]
+  col = tile_index[1] * TILE_SHAPE[1]
+  return (slice(row, row + tile_shape[0]), slice(col, col + tile_shape[1]))
+
+
+def _digest(tile):
+  return hashlib.blake2b(np.ascontiguousarray(tile).data,
+                         digest_size=16).digest()
+
+
+def _skeleton(brain):
+  """Pickles `brain` without its connectomes and saved histories."""
+  shallow = copy.copy(brain)
+  shallow.connectomes = {}
+  shallow.connectomes_by_stimulus = {}
+  shallow.area_by_name = {}
+  # Observers are live callbacks of the driver, not brain state.
+  shallow._observers = []
+  for name, area in brain.area_by_name.items():
+    area_copy = copy.copy(area)
+    area_copy.saved_w = area.saved_w.copy_empty()
+    area_copy.saved_winners = area.saved_winners.copy_empty()
+    shallow.area_by_name[name] = area_copy
+  return pickle.dumps(shallow, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _history_delta(history, last_written):
+  """Returns (start, entries): the steps of `history` not yet written.
+
+  `start` is the absolute step number (counting steps a ring buffer
+  dropped) of the first entry. `last_written` is (num_appended, num_edits)
+  as of the previous checkpoint, or None.
+  """
+  num_appended = history.num_appended
+  first_retained = num_appended - len(history)
+  if last_written is not None:
+    old_appended, old_edits = last_written
+    if (old_edits == history.num_edits and
+        first_retained <= old_appended <= num_appended):
+      return old_appended, history[old_appended - first_retained:]
+  # First checkpoint, or the history was edited: resend what is retained.
+  return first_retained, list(history)
+
+
+def _mark(history):
+  return history.num_appended, history.num_edits
+
+
+def _apply_history_delta(replayed, delta):
+  first, entries = replayed
+  start, new_entries = delta
+  if start < first:
+    return start, list(new_entries)
+  return first, entries[:start - first] + new_entries
+
+
+def checkpoint_files(directory):
+  """Returns the checkpoint files in `directory`, oldest first."""
+  return sorted(glob.glob(os.path.join(directory, 'checkpoint-*.pkl')))
+
+
+def _read(path):
+  with open(path, 'rb') as f:
+    record = pickle.load(f)
+  if record.get('version') != CHECKPOINT_VERSION:
+    raise ValueError(f'Unsupported checkpoint version in {path!r}')
+  return record
+
+
+def _replay(directory):
+  """Reconstructs the latest checkpoint of `directory`.
+
+  Returns:
+    (record, connectomes, histories) where `record` is the latest checkpoint
+    record, `connectomes` maps connectome keys to arrays and `histories`
+    maps area names to the saved_w and saved_winners, each as (number of
+    the first step, list of steps); or None if the directory holds no
+    checkpoint.
+  """
+  files = checkpoint_files(directory)
+  if not files:
+    return None
+  latest = _read(files[-1])
+  base = latest['base']
+  connectomes = {}
+  histories = {}
+  for index in range(base, latest['index'] + 1):
+    record = latest if index == latest['index'] else _read(
+        os.path.join(directory, _FILE_PATTERN % index))
+    for key, shape in record['shapes'].items():
+      old = connectomes.get(key)
+      array = np.zeros(shape, dtype=np.float32)
+      if old is not None:
+        overlap = tuple(slice(0, min(a, b)) for a, b in zip(old.shape, shape))
+        array[overlap] = old[overlap]
+      for tile_index, tile in record['tiles'].get(key, ()):
+        array[_tile_slices(len(shape), tile_index, tile.shape)] = tile
+      connectomes[key] = array
+    for key in list(connectomes):
+      if key not in record['shapes']:
+        del connectomes[key]
+    for area_name, (w_delta, winners_delta) in record['histories'].items():
+      saved_w, saved_winners = histories.get(area_name, ((0, []), (0, [])))
+      histories[area_name] = (_apply_history_delta(saved_w, w_delta),
+                              _apply_history_delta(saved_winners,
+                                                   winners_delta))
+  return latest, connectomes, histories
+
+
+def _restore_histories(brain, histories):
+  for area_name, (saved_w, saved_winners) in histories.items():
+    area = brain.area_by_name[area_name]
+    (w_first, w_entries), (winners_first, winners_entries) = (
+        saved_w, saved_winners)
+    area.saved_w.reset(w_entries, num_dropped=w_first)
+    area.saved_winners.reset(winners_entries, num_dropped=winners_first)
+
+
+class Checkpointer:
+  """Writes incremental checkpoints of a brain into a directory.
+
+  Attributes:
+    brain: The brain being checkpointed.
+    directory: Where checkpoint files are written.
+    every: `step()` writes a checkpoint every this many calls.
+    full_every: Every this many checkpoints a full snapshot is written (and
+      older files are pruned unless `keep_history` is set).
+    keep_history: Whether to keep checkpoint files that are no longer
+      needed for resuming.
+  """
+
+  def __init__(self, brain, directory, every=10, full_every=20,
+               keep_history=False):
+    if every < 1 or full_every < 1:
+      raise ValueError('every and full_every must be >= 1')
+    os.makedirs(directory, exist_ok=True)
+    self.brain = brain
+    self.directory = directory
+    self.every = every
+    self.full_every = full_every
+    self.keep_history = keep_history
+    self._num_steps = 0
+    self._next_index = 0
+    self._base = 0
+    # Per connectome key: (shape, {tile_index: digest}) as last written.
+    self._digests = {}
+    # Per area: (num_appended, num_edits) of saved_w and of saved_winners
+    # as last written.
+    self._history_marks = {}
+    files = checkpoint_files(directory)
+    if files:
+      latest = _read(files[-1])
+      self._next_index = latest['index'] + 1
+      self._base = latest['base']
+
+  def restore(self):
+    """Loads the latest checkpoint of the directory into `self.brain`.
+
+    The brain's state (areas, winners, connectomes, RNG) is replaced in
+    place; the numpy global and `random` module RNG states are restored too.
+
+    Returns:
+      The `extra` dict passed when the checkpoint was written, or None if
+      there is no checkpoint to resume from (the brain is left untouched).
+    """
+    replayed = _replay(self.directory)
+    if replayed is None:
+      return None
+    record, connectomes, histories = replayed
+    restored = pickle.loads(record['brain'])
+    store = self.brain._store
+    observers = self.brain._observers
+    self.brain.__dict__.clear()
+    self.brain.__dict__.update(restored.__dict__)
+    self.brain._store = store
+    self.brain._observers = observers
+    for key, array in connectomes.items():
+      _set_connectome(self.brain, key, store.adopt(key, array))
+    _restore_histories(self.brain, histories)
+    np.random.set_state(record['np_random_state'])
+    random.setstate(record['random_state'])
+    self._remember(self.brain)
+    self._num_steps = record['num_steps']
+    return record['extra']
+
+  def _remember(self, brain):
+    self._digests = {
+      key: (array.shape,
+            {tile_index: _digest(array[slices])
+             for tile_index, slices in _tiles(array.shape)})
+      for key, array in brain.iter_connectomes()}
+    self._history_marks = {
+      name: (_mark(area.saved_w), _mark(area.saved_winners))
+      for name, area in brain.area_by_name.items()}
+
+  def step(self, **extra):
+    """Counts one driver step; writes a checkpoint every `every` steps."""
+    self._num_steps += 1
+    if self._num_steps % self.every == 0:
+      return self.save(**extra)
+    return None
+
+  def save(self, **extra):
+    """Writes a checkpoint now.
+
+    Args:
+      **extra: Driver state to hand back from `restore()`, e.g. the index
+        of the next loop iteration.
+
+    Returns:
+      The path of the checkpoint file.
+    """
+    index = self._next_index
+    full = (index - self._base) % self.full_every == 0 or not self._digests
+    if full:
+      self._base = index
+      self._digests = {}
+      self._history_marks = {}
+    shapes = {}
+    tiles = {}
+    digests = {}
+    for key, array in self.brain.iter_connectomes():
+      shapes[key] = array.shape
+      old_shape, old_digests = self._digests.get(key, (None, {}))
+      new_digests = {}
+      changed = []
+      for tile_index, slices in _tiles(array.shape):
+        tile = array[slices]
+        digest = _digest(tile)
+        new_digests[tile_index] = digest
+        if old_digests.get(tile_index) != digest or old_shape is None:
+          changed.append((tile_index, np.array(tile)))
+      if changed:
+        tiles[key] = changed
+      digests[key] = (array.shape, new_digests)
+    histories = {}
+    history_marks = {}
+    for name, area in self.brain.area_by_name.items():
+      w_mark, winners_mark = self._history_marks.get(name, (None, None))
+      histories[name] = (_history_delta(area.saved_w, w_mark),
+                         _history_delta(area.saved_winners, winners_mark))
+      history_marks[name] = (_mark(area.saved_w), _mark(area.saved_winners))
+    record = {
+      'version': CHECKPOINT_VERSION,
+      'index': index,
+      'base': self._base,
+      'num_steps': self._num_steps,
+      'brain': _skeleton(self.brain),
+      'shapes': shapes,
+      'tiles': tiles,
+      'histories': histories,
+      'np_random_state': np.random.get_state(),
+      'random_state': random.getstate(),
+      'extra': extra,
+    }
+    path = os.path.join(self.directory, _FILE_PATTERN % index)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+      pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    self._digests = digests
+    self._history_marks = history_marks
+    self._next_index = index + 1
+    if full and not self.keep_history:
+      for old_path in checkpoint_files(self.directory):
+        if old_path != path:
+          os.remove(old_path)
+    return path
+
+
+def load(directory):
+  """Returns (brain, extra) for the latest checkpoint in `directory`.
+
+  Returns None if there is no checkpoint. Like `Checkpointer.restore`, this
+  also restores the numpy global and `random` module RNG states.
+  """
+  replayed = _replay(directory)
+  if replayed is None:
+    return None
+  record, connectomes, histories = replayed
+  brain = pickle.loads(record['brain'])
+  for key, array in connectomes.items():
+    _set_connectome(brain, key, brain._store.adopt(key, array))
+  _restore_histories(brain, histories)
+  np.random.set_state(record['np_random_state'])
+  random.setstate(record['random_state'])
+  return brain, record['extra']
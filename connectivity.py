@@ -0,0 +1,164 @@
+# Connectivity metrics of assemblies.
+#
+# Statistics of the synapses among an assembly -- the winners x winners
+# block of a fiber's connectome (or winners x targets across two areas) --
+# computed on the gathered block in one vectorized call instead of looping
+# over neuron pairs:
+#
+#   conn = b.connectomes["A"]["A"]
+#   connectivity.density(conn, b.areas["A"].winners)
+#   connectivity.assembly_metrics(conn, winners)   # all metrics at once
+#   connectivity.batch_metrics(conn, [winners_1, winners_2, ...])
+#
+# Connectomes may be dense arrays (including memory-mapped ones) or
+# scipy.sparse matrices; only the requested block is ever densified.
+
+import numpy as np
+from scipy import sparse
+
+
+def connectome(b, fiber):
+  """Returns the connectome of a fiber key as yielded by iter_connectomes().
+
+  Only area fibers, `("area", from_area, to_area)`, have a neuron x neuron
+  block; stimulus fibers are per-target vectors.
+  """
+  kind, source, target = fiber
+  if kind != "area":
+    raise ValueError(f"Not an area-to-area fiber: {fiber!r}")
+  return b.connectomes[source][target]
+
+
+def block(connectome, winners, targets=None):
+  """Gathers connectome[winners][:, targets] as a dense array.
+
+  Args:
+    connectome: A 2D array or scipy.sparse matrix, rows = source neurons.
+    winners: Source neurons (e.g. an area's winners).
+    targets: Target neurons; defaults to `winners` (a recurrent fiber).
+  """
+  rows = np.asarray(winners, dtype=np.int64)
+  cols = rows if targets is None else np.asarray(targets, dtype=np.int64)
+  if sparse.issparse(connectome):
+    return connectome.tocsr()[rows][:, cols].toarray()
+  return np.asarray(connectome)[np.ix_(rows, cols)]
+
+
+def _block_metrics(sub, recurrent, include_diagonal, bins, weight_range):
+  """Metrics of one (rows, cols) block, or a (m, rows, cols) batch.
+
+  `recurrent` blocks are winners x winners: their diagonal is the
+  self-connections and reciprocity is defined.
+  """
+  if recurrent and not include_diagonal:
+    mask = ~np.eye(sub.shape[-1], dtype=bool)
+  else:
+    mask = np.ones(sub.shape[-2:], dtype=bool)
+  mask = np.broadcast_to(mask, sub.shape)
+  edges = (sub != 0) & mask
+  num_pairs = mask.sum(axis=(-2, -1))
+  num_edges = edges.sum(axis=(-2, -1))
+  total_weight = np.where(edges, sub, 0).sum(axis=(-2, -1), dtype=np.float64)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    density = num_edges / num_pairs
+    mean_weight = np.where(num_edges > 0, total_weight / num_edges, 0.0)
+  metrics = {
+    'num_edges': num_edges,
+    'density': density,
+    'mean_weight': mean_weight,
+  }
+  if recurrent:
+    # Of the edges i -> j (i != j), the fraction whose j -> i also exists.
+    edges = edges & ~np.eye(sub.shape[-1], dtype=bool)
+    mutual = (edges & np.swapaxes(edges, -2, -1)).sum(axis=(-2, -1))
+    directed = edges.sum(axis=(-2, -1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+      metrics['reciprocity'] = np.where(directed > 0, mutual / directed, 0.0)
+  if bins is not None:
+    if sub.ndim == 2:
+      metrics['weight_histogram'] = np.histogram(
+          sub[(sub != 0) & mask], bins=bins, range=weight_range)
+    else:
+      metrics['weight_histogram'] = [
+          np.histogram(s[(s != 0) & mask[0]], bins=bins, range=weight_range)
+          for s in sub]
+  return metrics
+
+
+def density(connectome, winners, targets=None, include_diagonal=True):
+  """Fraction of winner -> target pairs that are connected (weight != 0).
+
+  With `include_diagonal` (the default, matching the original edge count
+  of simulations.density) self-connections of a winners x winners block
+  count as pairs.
+  """
+  sub = block(connectome, winners, targets)
+  return float(_block_metrics(sub, targets is None, include_diagonal, None,
+                              None)['density'])
+
+
+def mean_weight(connectome, winners, targets=None, include_diagonal=True):
+  """Mean weight of the existing winner -> target synapses (0 if none)."""
+  sub = block(connectome, winners, targets)
+  return float(
+      _block_metrics(sub, targets is None, include_diagonal, None,
+                     None)['mean_weight'])
+
+
+def reciprocity(connectome, winners):
+  """Fraction of edges i -> j among the winners whose j -> i also exists."""
+  sub = block(connectome, winners)
+  return float(_block_metrics(sub, True, True, None, None)['reciprocity'])
+
+
+def weight_histogram(connectome, winners, targets=None, bins=10,
+                     weight_range=None, include_diagonal=True):
+  """np.histogram of the existing synapse weights among the winners."""
+  sub = block(connectome, winners, targets)
+  return _block_metrics(sub, targets is None, include_diagonal, bins,
+                        weight_range)['weight_histogram']
+
+
+def _scalars(metrics):
+  return {name: (value if name == 'weight_histogram' else value.item())
+          for name, value in metrics.items()}
+
+
+def assembly_metrics(connectome, winners, targets=None, bins=None,
+                     weight_range=None, include_diagonal=True):
+  """Returns all metrics of one assembly from a single gathered block.
+
+  Returns:
+    A dict with `num_edges`, `density`, `mean_weight`, `reciprocity` (for
+    a winners x winners block) and, if `bins` is given, `weight_histogram`
+    as (counts, bin_edges).
+  """
+  sub = block(connectome, winners, targets)
+  return _scalars(_block_metrics(sub, targets is None, include_diagonal,
+                                 bins, weight_range))
+
+
+def batch_metrics(connectome, assemblies, bins=None, weight_range=None,
+                  include_diagonal=True):
+  """assembly_metrics() of many assemblies of one recurrent fiber.
+
+  Assemblies of equal size on a dense connectome are gathered into one
+  (m, k, k) array and reduced together; otherwise each is done in turn.
+
+  Returns:
+    A list of metric dicts, one per assembly.
+  """
+  assemblies = [np.asarray(a, dtype=np.int64) for a in assemblies]
+  sizes = {len(a) for a in assemblies}
+  if len(sizes) != 1 or sparse.issparse(connectome):
+    return [assembly_metrics(connectome, a, bins=bins,
+                             weight_range=weight_range,
+                             include_diagonal=include_diagonal)
+            for a in assemblies]
+  index = np.stack(assemblies)
+  sub = np.asarray(connectome)[index[:, :, None], index[:, None, :]]
+  metrics = _block_metrics(sub, True, include_diagonal, bins, weight_range)
+  return [
+    {name: (value[i] if name == 'weight_histogram' else value[i].item())
+     for name, value in metrics.items()}
+    for i in range(len(assemblies))]
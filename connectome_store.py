@@ -0,0 +1,382 @@
+# Storage back-ends for the connectome buffers of a `brain.Brain`.
+#
+# The brain only ever holds *views* handed out by a store: every time a
+# connectome has to grow (new first-winners in a lazy area), `project_into`
+# asks the store for a resized buffer and replaces its reference.
+# - ConnectomeStore keeps everything in RAM (the historical behaviour).
+#   Its grow() reserves spare capacity for connectomes that keep growing
+#   along the same axes (the blocks of a block area, see Brain.add_block_area).
+# - MemmapConnectomeStore places the buffers in memory-mapped scratch files
+#   and over-allocates geometrically, so most growth steps happen in place
+#   and large simulations degrade to disk speed instead of running out of RAM.
+# - CopyOnWriteStore serves buffers shared with other brains (a brain
+#   attached to a shared template, see shared_brain.py); the pages or
+#   buffers a projection writes to are copied into private memory.
+
+import os
+import re
+import tempfile
+import weakref
+
+import numpy as np
+
+try:
+  import resource
+except ImportError:  # Not available on Windows.
+  resource = None
+
+CONNECTOME_DTYPE = np.float32
+
+
+def _process_page_faults():
+  """Returns (minor, major) page faults of this process, if available."""
+  if resource is None:
+    return None, None
+  usage = resource.getrusage(resource.RUSAGE_SELF)
+  return usage.ru_minflt, usage.ru_majflt
+
+
+class ConnectomeStore:
+  """Keeps connectome buffers as ordinary in-memory numpy arrays.
+
+  Connectomes are addressed by a key, e.g. `("stim", stim_name, area_name)`
+  or `("area", from_area_name, to_area_name)`.
+  """
+
+  def __init__(self):
+    # Connectomes handed out by grow(): key -> (buffer, view of its prefix).
+    self._reserved = {}
+
+  def __getstate__(self):
+    # Copies of a brain get their own arrays, without spare capacity.
+    state = self.__dict__.copy()
+    state['_reserved'] = {}
+    return state
+
+  def new(self, key, shape):
+    """Returns a fresh zero-filled connectome of the given shape."""
+    self._reserved.pop(key, None)
+    return np.zeros(shape, dtype=CONNECTOME_DTYPE)
+
+  def adopt(self, key, array):
+    """Takes ownership of an already-populated connectome."""
+    self._reserved.pop(key, None)
+    return np.asarray(array, dtype=CONNECTOME_DTYPE)
+
+  def resize(self, key, array, shape):
+    """Returns `array` grown to `shape`; new entries are zero.
+
+    The old contents are preserved in the overlapping region. If the shape
+    does not change, `array` itself is returned (no copy).
+    """
+    if array.shape == tuple(shape):
+      return array
+    self._reserved.pop(key, None)
+    resized = np.zeros(shape, dtype=CONNECTOME_DTYPE)
+    overlap = tuple(slice(0, min(old, new))
+                    for old, new in zip(array.shape, shape))
+    resized[overlap] = array[overlap]
+    return resized
+
+  def grow(self, key, array, shape):
+    """Like `resize`, but reserves spare capacity along the growing axes.
+
+    A connectome grown again along the same axes is then extended in place
+    until the reserve runs out, so growing it step by step copies it
+    O(log size) times instead of on every step. The reserve counts in
+    `capacity_nbytes`.
+    """
+    shape = tuple(shape)
+    buffer, view = self._reserved.get(key, (None, None))
+    if view is not array or any(
+        new > cap for new, cap in zip(shape, buffer.shape)):
+      capacity = tuple(max(new, 2 * old) if new > old else new
+                       for old, new in zip(array.shape, shape))
+      buffer = self.resize(key, array, capacity)
+    view = buffer[tuple(slice(0, dim) for dim in shape)]
+    self._reserved[key] = (buffer, view)
+    return view
+
+  def writable(self, key, array):
+    """Returns `array` ready for in-place updates (here: `array` itself).
+
+    `project_into` calls this before updating a connectome it does not
+    resize, so stores serving read-only buffers can copy them first.
+    """
+    return array
+
+  def capacity_nbytes(self, key, array):
+    """Number of bytes allocated for the connectome behind `array`."""
+    buffer, view = self._reserved.get(key, (None, None))
+    if view is array:
+      return buffer.nbytes
+    return array.nbytes
+
+  def paging_stats(self):
+    """Reports how much connectome memory is resident vs. file-backed."""
+    minor_faults, major_faults = _process_page_faults()
+    return {
+      'backend': 'memory',
+      'num_files': 0,
+      'mapped_bytes': 0,
+      'num_remaps': 0,
+      'bytes_copied_on_remap': 0,
+      'minor_page_faults': minor_faults,
+      'major_page_faults': major_faults,
+    }
+
+  def close(self):
+    pass
+
+
+class _MappedBuffer:
+  """A memory-mapped file holding one connectome, plus its live view."""
+
+  def __init__(self, path, buffer, view):
+    self.path = path
+    self.buffer = buffer
+    self.view = view
+
+
+def _remove_files(paths):
+  for path in list(paths):
+    try:
+      os.remove(path)
+    except OSError:
+      pass
+    paths.discard(path)
+
+
+class MemmapConnectomeStore(ConnectomeStore):
+  """Places connectome buffers in memory-mapped files in a scratch directory.
+
+  Each buffer is allocated with spare capacity in every dimension that has
+  grown so far (multiplying by `growth_factor`), so that growing a
+  connectome by a few rows/columns usually only re-slices the mapping.
+  When a buffer runs out of capacity it is copied into a larger file and the
+  old file is deleted.
+
+  Files are removed when the store is closed or garbage-collected. Copies of
+  a brain (`copy.deepcopy`, `pickle`) get fresh in-memory arrays; they are
+  moved into new files of the same directory the next time they grow.
+  """
+
+  def __init__(self, directory, growth_factor=2.0):
+    """Initializes the instance.
+
+    Args:
+      directory: Scratch directory for the backing files. Created if needed.
+      growth_factor: Capacity multiplier applied when a buffer is full.
+    """
+    if growth_factor <= 1.0:
+      raise ValueError(f'growth_factor must be > 1, got {growth_factor}')
+    os.makedirs(directory, exist_ok=True)
+    self.directory = directory
+    self.growth_factor = growth_factor
+    self._buffers = {}
+    self._paths = set()
+    self._num_remaps = 0
+    self._bytes_copied = 0
+    self._finalizer = weakref.finalize(self, _remove_files, self._paths)
+
+  def __getstate__(self):
+    # The mapped files belong to this instance only.
+    return {'directory': self.directory, 'growth_factor': self.growth_factor}
+
+  def __setstate__(self, state):
+    self.__init__(state['directory'], state['growth_factor'])
+
+  def _map(self, key, capacity):
+    if 0 in capacity:
+      # Nothing to map yet (lazy areas start with zero support).
+      return None, np.zeros(capacity, dtype=CONNECTOME_DTYPE)
+    prefix = re.sub(r'[^A-Za-z0-9_.-]+', '_', '-'.join(map(str, key))) + '-'
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix='.f32',
+                                dir=self.directory)
+    os.close(fd)
+    self._paths.add(path)
+    return path, np.memmap(path, dtype=CONNECTOME_DTYPE, mode='w+',
+                           shape=capacity)
+
+  def _release(self, entry):
+    # The mapping itself goes away with the last view still referencing it;
+    # unlinking the file just makes sure its blocks are freed then.
+    if entry.path is not None:
+      _remove_files({entry.path})
+      self._paths.discard(entry.path)
+
+  def _install(self, key, capacity, shape, contents=None):
+    old_entry = self._buffers.get(key)
+    path, buffer = self._map(key, capacity)
+    view = buffer[tuple(slice(0, dim) for dim in shape)].view(np.ndarray)
+    if contents is not None:
+      overlap = tuple(slice(0, min(old, new))
+                      for old, new in zip(contents.shape, shape))
+      view[overlap] = contents[overlap]
+    self._buffers[key] = _MappedBuffer(path, buffer, view)
+    if old_entry is not None:
+      self._release(old_entry)
+    return view
+
+  def new(self, key, shape):
+    return self._install(key, tuple(shape), shape)
+
+  def adopt(self, key, array):
+    array = np.asarray(array, dtype=CONNECTOME_DTYPE)
+    return self._install(key, array.shape, array.shape, contents=array)
+
+  def resize(self, key, array, shape):
+    shape = tuple(shape)
+    entry = self._buffers.get(key)
+    if entry is None or entry.view is not array:
+      # Not (or no longer) one of our buffers, e.g. after a deepcopy.
+      return self._install(key, shape, shape, contents=array)
+    if array.shape == shape:
+      return array
+    capacity = entry.buffer.shape
+    if all(new <= cap for new, cap in zip(shape, capacity)):
+      entry.view = entry.buffer[
+        tuple(slice(0, dim) for dim in shape)].view(np.ndarray)
+      return entry.view
+    new_capacity = tuple(
+      cap if new <= cap else max(new, int(cap * self.growth_factor))
+      for new, cap in zip(shape, capacity))
+    self._num_remaps += 1
+    self._bytes_copied += array.nbytes
+    return self._install(key, new_capacity, shape, contents=array)
+
+  def grow(self, key, array, shape):
+    # resize() already over-allocates.
+    return self.resize(key, array, shape)
+
+  def capacity_nbytes(self, key, array):
+    entry = self._buffers.get(key)
+    if entry is None or entry.view is not array:
+      return array.nbytes
+    return entry.buffer.nbytes
+
+  def paging_stats(self):
+    """Reports mapped file sizes, remap activity and process page faults.
+
+    Returns:
+      A dict with the number of backing files, total mapped bytes (capacity),
+      live bytes (the part of the buffers in use), how often buffers had to
+      be copied into larger files and how many bytes that copied, plus the
+      process' minor/major page-fault counters. Major faults are the ones
+      that hit the disk; a rapidly rising count means the working set no
+      longer fits in RAM.
+    """
+    minor_faults, major_faults = _process_page_faults()
+    return {
+      'backend': 'memmap',
+      'directory': self.directory,
+      'num_files': sum(1 for e in self._buffers.values() if e.path),
+      'mapped_bytes': sum(e.buffer.nbytes for e in self._buffers.values()
+                          if e.path),
+      'live_bytes': sum(e.view.nbytes for e in self._buffers.values()),
+      'num_remaps': self._num_remaps,
+      'bytes_copied_on_remap': self._bytes_copied,
+      'minor_page_faults': minor_faults,
+      'major_page_faults': major_faults,
+    }
+
+  def close(self):
+    """Deletes all backing files.
+
+    Mappings stay valid until the brain drops its references to them.
+    """
+    self._buffers.clear()
+    self._finalizer()
+
+
+class CopyOnWriteStore(ConnectomeStore):
+  """Serves connectomes shared with other brains, copying on write.
+
+  Connectomes in a private (copy-on-write) mapping of a shared block, see
+  shared_brain.attach(), are writable as they are: the OS copies just the
+  pages a projection writes to, i.e. the rows around the winners, so an
+  updated connectome mostly stays shared. `private_region` is the
+  (address, nbytes) of that mapping, to report how much of it has been
+  copied. Read-only buffers (where the block cannot be mapped privately)
+  are copied whole into private memory the first time they are updated.
+  Growing a connectome always moves it into a fresh private buffer.
+  """
+
+  def __init__(self, private_region=None):
+    super().__init__()
+    self.private_region = private_region
+    self._num_copies = 0
+    self._bytes_copied = 0
+
+  def __getstate__(self):
+    # Copies of a brain get their own arrays, outside the mapping.
+    state = super().__getstate__()
+    state['private_region'] = None
+    return state
+
+  def _shared(self, array):
+    if not array.flags.writeable:
+      return True
+    if self.private_region is None or array.size == 0:
+      return False
+    address, nbytes = self.private_region
+    return address <= array.ctypes.data < address + nbytes
+
+  def resize(self, key, array, shape):
+    if array.shape != tuple(shape) and self._shared(array):
+      self._num_copies += 1
+      self._bytes_copied += array.nbytes
+    return super().resize(key, array, shape)
+
+  def writable(self, key, array):
+    if array.flags.writeable:
+      return array
+    self._num_copies += 1
+    self._bytes_copied += array.nbytes
+    return np.array(array)
+
+  def paging_stats(self):
+    """Adds the whole-connectome copies and the pages copied on write.
+
+    `private_page_bytes` is None where the platform does not report it
+    (it is read from /proc/self/smaps).
+    """
+    stats = super().paging_stats()
+    private_page_bytes = 0
+    if self.private_region is not None:
+      private_page_bytes = _anonymous_bytes(*self.private_region)
+    stats.update(backend='copy-on-write',
+                 num_private_copies=self._num_copies,
+                 bytes_copied_on_write=self._bytes_copied,
+                 private_page_bytes=private_page_bytes)
+    return stats
+
+
+def _anonymous_bytes(address, nbytes):
+  """Bytes of [address, address + nbytes) the OS has copied privately.
+
+  These are the anonymous pages of a private file mapping (Linux), or None
+  where /proc/self/smaps is not available.
+  """
+  try:
+    with open('/proc/self/smaps') as f:
+      lines = f.readlines()
+  except OSError:
+    return None
+  total = 0
+  inside = False
+  for line in lines:
+    header = re.match(r'([0-9a-f]+)-([0-9a-f]+) ', line)
+    if header:
+      start, end = (int(bound, 16) for bound in header.groups())
+      inside = start < address + nbytes and address < end
+    elif inside and line.startswith('Anonymous:'):
+      total += int(line.split()[1]) * 1024
+  return total
+
+
+def make_store(directory=None, growth_factor=2.0):
+  """Returns the store to use for a brain's `connectome_dir` option."""
+  if directory is None:
+    return ConnectomeStore()
+  return MemmapConnectomeStore(directory, growth_factor=growth_factor)
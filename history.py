@@ -0,0 +1,324 @@
+# Compact per-step histories for `Area.saved_w` and `Area.saved_winners`.
+#
+# Instead of a Python list holding one boxed int (saved_w) or one list of k
+# boxed ints (saved_winners) per step, the values live in a preallocated
+# numpy array that grows geometrically (by at least a chunk at a time):
+# - StepHistory: one int64 per step,
+# - WinnerHistory: one row of uint32 winner indices per step (rows may be
+#   shorter than the widest one, e.g. a subsampled fixed assembly).
+# Both can be bounded (`max_steps`: a ring buffer keeping the last N steps)
+# and spilled to disk (`spill_dir`: the buffer is a memory-mapped file).
+#
+# Reading keeps the list API: len(), iteration, indexing and slicing return
+# plain ints / lists of ints, and histories compare equal to lists. Use
+# `to_array()` for vectorized access.
+
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 256
+
+
+def _remove_file(path):
+  try:
+    os.remove(path)
+  except OSError:
+    pass
+
+
+class _History:
+  """Shared ring/chunk/spill logic; subclasses define the row layout."""
+
+  dtype = None
+
+  def __init__(self, max_steps=None, chunk_size=DEFAULT_CHUNK_SIZE,
+               spill_dir=None):
+    """Initializes the instance.
+
+    Args:
+      max_steps: Keep only the last this many steps (ring buffer), or None
+        to keep everything.
+      chunk_size: Minimum number of steps the buffer grows by; it at least
+        doubles, so a long history is copied O(log steps) times.
+      spill_dir: Directory for a memory-mapped backing file, or None to
+        keep the buffer in RAM.
+    """
+    if max_steps is not None and max_steps < 1:
+      raise ValueError(f'max_steps must be >= 1, got {max_steps}')
+    if chunk_size < 1:
+      raise ValueError(f'chunk_size must be >= 1, got {chunk_size}')
+    self.max_steps = max_steps
+    self.chunk_size = chunk_size
+    self.spill_dir = spill_dir
+    # Physical index of the oldest retained step (nonzero only once a ring
+    # buffer has wrapped around).
+    self._start = 0
+    self._size = 0
+    self._num_dropped = 0
+    # Counts clear() / truncate() calls, i.e. edits other than appends.
+    self.num_edits = 0
+    self._data = self._allocate(0, self._row_shape(0))
+    self._path = None
+
+  # Subclass hooks.
+  def _row_shape(self, width):
+    raise NotImplementedError
+
+  def _store_row(self, index, value):
+    raise NotImplementedError
+
+  def _load_row(self, index):
+    raise NotImplementedError
+
+  # Storage.
+  def _allocate(self, capacity, row_shape):
+    shape = (capacity,) + row_shape
+    if self.spill_dir is None or capacity == 0:
+      return np.zeros(shape, dtype=self.dtype)
+    os.makedirs(self.spill_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix='history-', suffix='.bin',
+                                dir=self.spill_dir)
+    os.close(fd)
+    weakref.finalize(self, _remove_file, path)
+    old_path = getattr(self, '_path', None)
+    if old_path is not None:
+      _remove_file(old_path)
+    self._path = path
+    return np.memmap(path, dtype=self.dtype, mode='w+', shape=shape)
+
+  def _reserve(self, row_shape):
+    """Makes room for one more step with rows of (at least) `row_shape`."""
+    capacity = self._data.shape[0]
+    old_row_shape = self._data.shape[1:]
+    full = self._size == capacity
+    if self.max_steps is not None and capacity == self.max_steps:
+      full = False  # The ring overwrites its oldest step instead.
+    wider = any(new > old for new, old in zip(row_shape, old_row_shape))
+    if not full and not wider:
+      return
+    if full:
+      capacity = max(2 * capacity, capacity + self.chunk_size)
+      if self.max_steps is not None:
+        capacity = min(capacity, self.max_steps)
+    row_shape = tuple(max(new, old)
+                      for new, old in zip(row_shape, old_row_shape))
+    # Copy the retained steps, oldest first, into the new buffer.
+    order = self._physical(np.arange(self._size))
+    data = self._allocate(capacity, row_shape)
+    data[(slice(0, self._size),)
+         + tuple(slice(0, dim) for dim in old_row_shape)] = self._data[order]
+    self._data = data
+    self._reorder(capacity, order)
+    self._start = 0
+
+  def _reorder(self, capacity, order):
+    """Hook: re-lays out per-step side arrays like `_reserve` did `_data`."""
+
+  def _physical(self, index):
+    if self._start == 0:
+      return index
+    return (self._start + index) % self._data.shape[0]
+
+  def _resolve(self, index):
+    if index < 0:
+      index += self._size
+    if not 0 <= index < self._size:
+      raise IndexError('history index out of range')
+    return self._physical(index)
+
+  def _push(self, value, row_shape):
+    self._reserve(row_shape)
+    capacity = self._data.shape[0]
+    if self._size == capacity:  # Full ring: overwrite the oldest step.
+      index = self._start
+      self._start = (self._start + 1) % capacity
+      self._num_dropped += 1
+    else:
+      index = self._physical(self._size)
+      self._size += 1
+    self._store_row(index, value)
+
+  # List-like API.
+  @property
+  def num_appended(self):
+    """Number of steps ever appended, including ones the ring dropped."""
+    return self._size + self._num_dropped
+
+  @property
+  def num_dropped(self):
+    """Number of old steps a bounded history has discarded."""
+    return self._num_dropped
+
+  def __len__(self):
+    return self._size
+
+  def __bool__(self):
+    return self._size > 0
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self._load_row(self._physical(i))
+              for i in range(*index.indices(self._size))]
+    return self._load_row(self._resolve(index))
+
+  def __iter__(self):
+    for i in range(self._size):
+      yield self._load_row(self._physical(i))
+
+  def __eq__(self, other):
+    try:
+      return len(self) == len(other) and list(self) == list(other)
+    except TypeError:
+      return NotImplemented
+
+  def __repr__(self):
+    return f'{type(self).__name__}({list(self)!r})'
+
+  def __array__(self, dtype=None, copy=None):
+    array = self.to_array()
+    return array if dtype is None else array.astype(dtype)
+
+  def extend(self, values):
+    for value in values:
+      self.append(value)
+
+  def clear(self):
+    """Drops all steps (and the dropped-step count)."""
+    self._start = 0
+    self._size = 0
+    self._num_dropped = 0
+    self.num_edits += 1
+
+  def truncate(self, length):
+    """Keeps only the first `length` retained steps (like `del h[length:]`).
+
+    A negative `length` counts from the end, as in a slice.
+    """
+    if length < 0:
+      length = max(0, self._size + length)
+    self._size = min(self._size, length)
+    self.num_edits += 1
+
+  def reset(self, values, num_dropped=0):
+    """Replaces the contents by `values`, preceded by `num_dropped` steps."""
+    self.clear()
+    self.extend(values)
+    self._num_dropped += num_dropped
+
+  def copy_empty(self):
+    """Returns an empty history with the same settings."""
+    return type(self)(max_steps=self.max_steps, chunk_size=self.chunk_size,
+                      spill_dir=self.spill_dir)
+
+  def _ordered(self):
+    return self._data[self._physical(np.arange(self._size))]
+
+  def __getstate__(self):
+    # Only the retained steps, compacted, in memory.
+    state = self.__dict__.copy()
+    state['_data'] = np.array(self._ordered())
+    state['_start'] = 0
+    state['_path'] = None
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    if self.spill_dir is not None and self._size:
+      data = self._data
+      self._data = self._allocate(data.shape[0], data.shape[1:])
+      self._data[...] = data
+
+
+class StepHistory(_History):
+  """Per-step scalar history, e.g. the support size `w` (Area.saved_w)."""
+
+  dtype = np.int64
+
+  def _row_shape(self, width):
+    return ()
+
+  def append(self, value):
+    self._push(value, ())
+
+  def _store_row(self, index, value):
+    self._data[index] = value
+
+  def _load_row(self, index):
+    return int(self._data[index])
+
+  def to_array(self):
+    """Returns the retained steps as a 1D int64 array (a copy)."""
+    return np.array(self._ordered())
+
+
+class WinnerHistory(_History):
+  """Per-step winner lists (Area.saved_winners) as rows of a uint32 array."""
+
+  dtype = np.uint32
+
+  def __init__(self, max_steps=None, chunk_size=DEFAULT_CHUNK_SIZE,
+               spill_dir=None):
+    super().__init__(max_steps=max_steps, chunk_size=chunk_size,
+                     spill_dir=spill_dir)
+    # Number of winners stored in each row.
+    self._lengths = np.zeros(0, dtype=np.uint32)
+
+  def _row_shape(self, width):
+    return (width,)
+
+  def append(self, winners):
+    winners = np.asarray(winners, dtype=self.dtype)
+    self._push(winners, winners.shape)
+
+  def _reorder(self, capacity, order):
+    lengths = np.zeros(capacity, dtype=np.uint32)
+    lengths[:len(order)] = self._lengths[order]
+    self._lengths = lengths
+
+  def _store_row(self, index, winners):
+    num = len(winners)
+    self._data[index, :num] = winners
+    self._lengths[index] = num
+
+  def _load_row(self, index):
+    return self._data[index, :self._lengths[index]].tolist()
+
+  def row(self, index):
+    """Returns the winners of one step as a uint32 array (a view)."""
+    physical = self._resolve(index)
+    return self._data[physical, :self._lengths[physical]]
+
+  def lengths(self):
+    """Returns the number of winners per retained step."""
+    return np.array(self._lengths[self._physical(np.arange(self._size))])
+
+  def padded(self):
+    """Returns (rows, lengths) for steps of possibly different sizes.
+
+    `rows` is a (steps, max length) uint32 array (a copy); only the first
+    `lengths[i]` entries of row i are winners.
+    """
+    lengths = self.lengths()
+    width = int(lengths.max()) if len(lengths) else 0
+    return np.array(self._ordered()[:, :width]), lengths
+
+  def to_array(self):
+    """Returns the retained steps as a (steps, k) uint32 array (a copy).
+
+    Raises:
+      ValueError: If the steps have different numbers of winners.
+    """
+    lengths = self.lengths()
+    if len(lengths) and (lengths != lengths[0]).any():
+      raise ValueError('Steps have different numbers of winners; '
+                       'use row() or lengths().')
+    width = int(lengths[0]) if len(lengths) else 0
+    return np.array(self._ordered()[:, :width])
+
+  def __getstate__(self):
+    state = super().__getstate__()
+    state['_lengths'] = self.lengths()
+    return state
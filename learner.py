@@ -1,7 +1,9 @@
 import brain
 import brain_util as bu
+import checkpoint
 import numpy as np
 import random
+import sweep
 
 ######## Example commands ########
 # Word/part-of-speech acquisition experiments
@@ -68,68 +70,65 @@ PHON_INDICES = {
 	CORRER: 7
 }
 
+# One trial of the experiments below, as a module-level function for
+# parallel sweeps (see sweep.py), e.g. betas with 5 seeds each:
+# sweep.run(learner.sentences_needed, sweep.grid(beta=[0.1, 0.08, 0.06]), seeds=range(5), cache_dir="sweeps")
+def sentences_needed(p=0.05, beta=0.06, LEX_k=50, LEX_n=100000, num_nouns=2, num_verbs=2, increment=1, use_extra_context=False, seed=0, **brain_kwargs):
+	brain = LearnBrain(p, LEX_k=LEX_k, LEX_n=LEX_n, num_nouns=num_nouns, num_verbs=num_verbs, beta=beta, seed=seed, **brain_kwargs)
+	brain.no_print=True
+	return brain.train_experiment_randomized(increment=increment, use_extra_context=use_extra_context)
+
+# The experiments below run their trials in parallel (see sweep.py), `repeat`
+# seeds per point; with cache_dir, finished trials are kept there and not
+# recomputed. Returns the sentences needed by each trial, grouped by point.
+def sentences_needed_sweep(points, repeat=1, processes=None, cache_dir=None):
+	results = sweep.run(sentences_needed, points, seeds=range(repeat), processes=processes, cache_dir=cache_dir, verbose=False)
+	return [[r.value for r in results[i*repeat:(i+1)*repeat]] for i in range(len(points))]
+
 # lexicon_sizes_experiment(2, 10, p=0.05, LEX_k=50, LEX_n=100000, beta=0.06, repeat=5, output_file="lex_size.txt")
 # lexicon_sizes_experiment(2, 6, p=0.05, LEX_k=50, LEX_n=100000, beta=0.06, repeat=5, extra_context_model="C", extra_context_area_k=20, output_file="lex_size_extracontext.txt")
-def lexicon_sizes_experiment(start, end, p=0.05, LEX_k=50, LEX_n=100000, beta=0.06, extra_context_areas=0, extra_context_model="B", use_extra_context=False, extra_context_area_k=20, repeat=1, output_file=None):
-	results = {}
+def lexicon_sizes_experiment(start, end, p=0.05, LEX_k=50, LEX_n=100000, beta=0.06, extra_context_areas=0, extra_context_model="B", use_extra_context=False, extra_context_area_k=20, repeat=1, output_file=None, processes=None, cache_dir=None):
+	sizes = list(range(start, end+1))
+	points = [dict(p=p, LEX_k=LEX_k, LEX_n=LEX_n, num_nouns=n, num_verbs=n, beta=beta, extra_context_areas=extra_context_areas, extra_context_model=extra_context_model, use_extra_context=use_extra_context) for n in sizes]
+	results = dict(zip(sizes, sentences_needed_sweep(points, repeat, processes, cache_dir)))
 	if output_file:
-		f = open(output_file, 'a')
-	for n in range(start, end+1):
-		results[n] = []
-		if output_file:
-			f.write(str(n)+",")
-		for _ in range(repeat):
-			brain = LearnBrain(p, LEX_k=LEX_k, LEX_n=LEX_n, num_nouns=n, num_verbs=n, beta=beta, extra_context_areas=extra_context_areas, extra_context_model=extra_context_model)
-			brain.no_print=True
-			num_sentences_needed = brain.train_experiment_randomized(use_extra_context=use_extra_context)
-			results[n].append(num_sentences_needed)
-			if output_file:
-				f.write(str(num_sentences_needed)+",")
-		if output_file:
-			f.write("\n")
-	if output_file:
-		f.close()
+		with open(output_file, 'a') as f:
+			for n, trials in results.items():
+				f.write(str(n)+","+"".join(str(t)+"," for t in trials)+"\n")
 	return results
 
 # betas_experiment(0.1, 0.05, 0.01)
 # betas_experiment(0.1, 0.015, 0.005, p=0.05, LEX_k=50, LEX_n=100000, num_nouns=2, num_verbs=2, repeat=5, output_file="betas.txt")
 # betas_experiment(0.1, 0.095, 0.005, p=0.05, LEX_k=50, LEX_n=100000, num_nouns=2, num_verbs=2, repeat=2, output_file="TEST_betas.txt")
-def betas_experiment(start, end, decrement, p=0.05, LEX_k=50, LEX_n=100000, num_nouns=2, num_verbs=2, repeat=1, output_file=None):
-	results = {}
-	if output_file:
-		f = open(output_file, 'a')
-
+def betas_experiment(start, end, decrement, p=0.05, LEX_k=50, LEX_n=100000, num_nouns=2, num_verbs=2, repeat=1, output_file=None, processes=None, cache_dir=None):
+	betas = []
 	beta = start 
 	while beta >= end: 
-		results[beta] = []
-		if output_file:
-			f.write(str(beta)+",")
-		for _ in range(repeat):
-			brain = LearnBrain(p, LEX_k=LEX_k, LEX_n=LEX_n, num_nouns=num_nouns, num_verbs=num_verbs, beta=beta)
-			brain.no_print=True
-			num_sentences_needed = brain.train_experiment_randomized()
-			results[beta].append(num_sentences_needed)
-			print(str(beta) + ": " + str(num_sentences_needed))
-			if output_file:
-				f.write(str(num_sentences_needed)+",")
+		betas.append(beta)
 		beta -= decrement
-		if output_file:
-			f.write("\n")
+	points = [dict(p=p, LEX_k=LEX_k, LEX_n=LEX_n, num_nouns=num_nouns, num_verbs=num_verbs, beta=beta) for beta in betas]
+	results = dict(zip(betas, sentences_needed_sweep(points, repeat, processes, cache_dir)))
+	for beta, trials in results.items():
+		for num_sentences_needed in trials:
+			print(str(beta) + ": " + str(num_sentences_needed))
 	if output_file:
-		f.close()
+		with open(output_file, 'a') as f:
+			for beta, trials in results.items():
+				f.write(str(beta)+","+"".join(str(t)+"," for t in trials)+"\n")
 	return results
 
 # p_experiment(0.01, 0.05, 0.01)
-def p_experiment(start, end, increment, LEX_k=50, LEX_n=100000, CONTEXTUAL_k=100, PHON_k=100, beta=0.05, num_nouns=2, num_verbs=2):
-	results = {}
+def p_experiment(start, end, increment, LEX_k=50, LEX_n=100000, CONTEXTUAL_k=100, PHON_k=100, beta=0.05, num_nouns=2, num_verbs=2, processes=None, cache_dir=None):
+	ps = []
 	p = start 
 	while p <= end:
-		brain = LearnBrain(p, LEX_k=LEX_k, LEX_n=LEX_n, num_nouns=num_nouns, num_verbs=num_verbs, beta=beta)
-		brain.no_print=True
-		num_sentences_needed = brain.train_experiment_randomized(increment=5)
+		ps.append(p)
+		p += increment 
+	points = [dict(p=p, LEX_k=LEX_k, LEX_n=LEX_n, num_nouns=num_nouns, num_verbs=num_verbs, beta=beta, increment=5) for p in ps]
+	results = {}
+	for p, (num_sentences_needed,) in zip(ps, sentences_needed_sweep(points, 1, processes, cache_dir)):
 		results[p] = num_sentences_needed
 		print(str(p) + ": " + str(num_sentences_needed))
-		p += increment 
 	return results
 
 # this function returns num WORDS used for training.. i.e. project rounds -= num words * brain.proj_rounds
@@ -164,8 +163,8 @@ def single_word_tutoring_exp(lex_size_start, lex_size_end, p=0.05, LEX_k=50, LEX
 
 class LearnBrain(brain.Brain):
 	def __init__(self, p, PHON_k=100, CONTEXTUAL_k=100, EXPLICIT_k=100, LEX_k=100, LEX_n=10000, beta=0.06, proj_rounds=2,
-		CORE_k=10, bilingual=False, LANG_k=100, num_nouns=2, num_verbs=2, extra_context_areas=0, extra_context_area_k=10, extra_context_model="B", extra_context_delay=0):
-		brain.Brain.__init__(self, p)
+		CORE_k=10, bilingual=False, LANG_k=100, num_nouns=2, num_verbs=2, extra_context_areas=0, extra_context_area_k=10, extra_context_model="B", extra_context_delay=0, seed=0):
+		brain.Brain.__init__(self, p, seed=seed)
 		self.bilingual = bilingual
 
 		# make this sum of #verbs + #nouns, more easily adjustable
@@ -414,13 +413,25 @@ class LearnBrain(brain.Brain):
 
 # l = learner.LearnBrain(0.05, LEX_k=50, LEX_n=100000, num_nouns=2, num_verbs=2, beta=0.06)
 # train_experiment_randomized()
-	def train_experiment_randomized(self, max_samples=500, increment=1, start_testing=0, use_extra_context=False):
+	# checkpoint_dir: checkpoint the brain (and RNG states) every checkpoint_every
+	# samples; rerunning with the same checkpoint_dir resumes from the last one.
+	def train_experiment_randomized(self, max_samples=500, increment=1, start_testing=0, use_extra_context=False,
+		checkpoint_dir=None, checkpoint_every=10):
 		#self.extra_context_areas = 0
-		for i in range(0, max_samples):
+		ckpt = None
+		start = 0
+		if checkpoint_dir:
+			ckpt = checkpoint.Checkpointer(self, checkpoint_dir, every=checkpoint_every)
+			extra = ckpt.restore()
+			if extra:
+				start = extra["next_sample"]
+		for i in range(start, max_samples):
 			self.train_random_sentence()
 			if (i > start_testing) and (i % increment == 0) and self.test_all_words(use_extra_context=use_extra_context):
 				print("Succeeded after " + str(i) + " random sentences.")
 				return i  
+			if ckpt:
+				ckpt.step(next_sample=i+1)
 			#if i == 30:
 			#	self.extra_context_areas = 2
 		print("Did not succeed after " + str(max_samples) + " samples.")
@@ -451,18 +462,11 @@ class LearnBrain(brain.Brain):
 	def get_explicit_assembly(self, area_name, min_overlap=0.75):
 		if not self.area_by_name[area_name].winners:
 			raise Exception("Cannot get word because no assembly in " + area_name)
-		winners = set(self.area_by_name[area_name].winners)
-		area = self.area_by_name[area_name]
-		area_k = area.k
-		threshold = min_overlap * area_k
-		num_assemblies = int(area.n / area.k)
-		for index in range(num_assemblies):
-			assembly_start = index * area_k
-			assembly = set(range(assembly_start, assembly_start + area_k))
-			if len((winners & assembly)) >= threshold:
-				return index 
-		print("Got non-assembly in " + area_name)
-		return None
+		index = self.assembly_index(area_name).readout(
+			self.area_by_name[area_name].winners, min_overlap)
+		if index is None:
+			print("Got non-assembly in " + area_name)
+		return index
 
 	def get_PHON(self, min_overlap=0.75):
 		index = self.get_explicit_assembly(PHON, min_overlap)
@@ -0,0 +1,37 @@
+#! /usr/bin/python
+
+import contextlib
+import io
+import shutil
+import tempfile
+import unittest
+
+import learner
+
+
+class TestExperimentSweeps(unittest.TestCase):
+    def run_silently(self, experiment, *args, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return experiment(*args, processes=1, **kwargs)
+
+    def test_experiments_run_one_point_each(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            betas = self.run_silently(learner.betas_experiment, 0.1, 0.1, 0.05,
+                                      cache_dir=cache_dir)
+            cached = self.run_silently(learner.betas_experiment, 0.1, 0.1,
+                                       0.05, cache_dir=cache_dir)
+            ps = self.run_silently(learner.p_experiment, 0.05, 0.05, 0.01)
+            sizes = self.run_silently(learner.lexicon_sizes_experiment, 2, 2)
+        finally:
+            shutil.rmtree(cache_dir)
+        self.assertEqual(list(betas), [0.1])
+        self.assertEqual(len(betas[0.1]), 1)
+        self.assertEqual(cached, betas)
+        self.assertEqual(list(ps), [0.05])
+        self.assertEqual(list(sizes), [2])
+        self.assertEqual(len(sizes[2]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
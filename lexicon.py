@@ -0,0 +1,85 @@
+# Lexicon rules of the parsers, and their compiled form.
+#
+# A lexeme (an entry of parser.LEXEME_DICT, parser.RUSSIAN_LEXEME_DICT or
+# chinese_parser.CHINESE_LEXEME_DICT) lists the AreaRules and FiberRules
+# that inhibit or disinhibit areas and fibers before (PRE_RULES) and after
+# (POST_RULES) the word is projected. Inhibition state is a bitmask per
+# area and per fiber (bit i: inhibited by rule index i), so the rules of a
+# phase add up to one "set" and one "keep" mask per area and fiber:
+#
+#   state = (state & keep) | set
+#
+# compile_lexicon() builds these programs once per lexicon, and
+# ParserBrain.applyProgram() runs one with a few integer operations per
+# touched area or fiber instead of dispatching on every rule.
+
+from collections import namedtuple
+
+DISINHIBIT = "DISINHIBIT"
+INHIBIT = "INHIBIT"
+
+AreaRule = namedtuple('AreaRule', ['action', 'area', 'index'])
+FiberRule = namedtuple('FiberRule', ['action', 'area1', 'area2', 'index'])
+FiringRule = namedtuple('FiringRule', ['action'])
+OtherRule = namedtuple('OtherRule', ['action'])
+
+# areas: (area, set mask, keep mask) triples; fibers: (from area, to area,
+# set mask, keep mask), with both directions of every FiberRule.
+Program = namedtuple('Program', ['areas', 'fibers'])
+LexemeProgram = namedtuple('LexemeProgram', ['pre', 'post'])
+
+EMPTY_PROGRAM = Program((), ())
+
+
+def _update(masks, target, action, index):
+  set_mask, clear_mask = masks.get(target, (0, 0))
+  bit = 1 << index
+  if action == INHIBIT:
+    set_mask, clear_mask = set_mask | bit, clear_mask & ~bit
+  elif action == DISINHIBIT:
+    set_mask, clear_mask = set_mask & ~bit, clear_mask | bit
+  else:
+    raise ValueError(f'Unknown rule action: {action!r}')
+  masks[target] = (set_mask, clear_mask)
+
+
+def compile_rules(rules):
+  """Compiles rules, applied in order, into one Program.
+
+  Rules other than AreaRules and FiberRules are ignored, as by
+  ParserBrain.applyRule.
+  """
+  area_masks = {}
+  fiber_masks = {}
+  for rule in rules:
+    if isinstance(rule, FiberRule):
+      _update(fiber_masks, (rule.area1, rule.area2), rule.action, rule.index)
+      _update(fiber_masks, (rule.area2, rule.area1), rule.action, rule.index)
+    elif isinstance(rule, AreaRule):
+      _update(area_masks, rule.area, rule.action, rule.index)
+  return Program(
+      tuple((area, set_mask, ~clear_mask)
+            for area, (set_mask, clear_mask) in area_masks.items()),
+      tuple((from_area, to_area, set_mask, ~clear_mask)
+            for (from_area, to_area), (set_mask, clear_mask)
+            in fiber_masks.items()))
+
+
+def compile_lexeme(lexeme):
+  return LexemeProgram(compile_rules(lexeme.get("PRE_RULES", ())),
+                       compile_rules(lexeme.get("POST_RULES", ())))
+
+
+# Compiled lexicons by id(); the lexicon is kept alongside so its id stays
+# valid. Lexicons are module-level constants and never change.
+_compiled = {}
+
+
+def compile_lexicon(lexeme_dict):
+  """Returns {word: LexemeProgram} for a lexicon, compiled once."""
+  entry = _compiled.get(id(lexeme_dict))
+  if entry is None or entry[0] is not lexeme_dict:
+    entry = (lexeme_dict, {word: compile_lexeme(lexeme)
+                           for word, lexeme in lexeme_dict.items()})
+    _compiled[id(lexeme_dict)] = entry
+  return entry[1]
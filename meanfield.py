@@ -0,0 +1,155 @@
+# Mean-field fast-forward of lazy-area projection dynamics.
+#
+# When a sweep only needs the support-size trajectory w(t) of a stimulus
+# projected into a recurrent area (simulations.project_sim), the exact
+# engine spends nearly all its time and memory on the w x w recurrent
+# connectome. This module runs the same round structure without it:
+# - new winners are sampled exactly as in Brain.project_into (a binomial
+#   quantile threshold, k truncated-normal candidates, top-k against the
+#   support's inputs), and a first winner's input is split between the
+#   stimulus and the area hypergeometrically, like the engine's choice of
+#   input neurons;
+# - every support neuron keeps its stimulus weight (exactly as the
+#   engine's stimulus connectome) and, instead of its column of the
+#   recurrent connectome, one number: the potentiated weight it received
+#   from the winners of the round before it last fired. Its recurrent
+#   input from the current winners is that mass scaled by the overlap of
+#   the two winner sets (the mean-field step), plus Binomial(rest, p) unit
+#   synapses from the winners outside the overlap.
+# A round is O(w + rounds * k) instead of O(k * w), and memory is O(w).
+#
+#   w = meanfield.project_w(n=100000, k=317, p=0.01, beta=0.05, t=100)
+#   meanfield.check(points, t=50)  # errors vs the exact engine
+#
+# Only the single-area project_sim / project_beta_sim dynamics are
+# modelled; use the exact engine for anything with several areas.
+
+import math
+
+import numpy as np
+from scipy.stats import binom
+from scipy.stats import truncnorm
+
+import simulations
+
+
+def _sample_new_inputs(rng, n, w, k, total_k, p):
+  """k candidate inputs of never-fired neurons, as in Brain.project_into."""
+  effective_n = n - w
+  if effective_n <= k:
+    raise RuntimeError('Remaining area too small to sample k new winners.')
+  alpha = binom.ppf((effective_n - k) / effective_n, total_k, p)
+  mu = total_k * p
+  std = math.sqrt(total_k * p * (1.0 - p))
+  inputs = (mu + truncnorm.rvs((alpha - mu) / std, np.inf, scale=std,
+                               size=k, random_state=rng)).round(0)
+  return np.minimum(inputs, total_k)
+
+
+def project_w(n=1000000, k=1000, p=0.01, beta=0.05, t=50, seed=0):
+  """Mean-field counterpart of simulations.project_sim.
+
+  Returns:
+    The support size w after each of the t rounds (like saved_w).
+  """
+  rng = np.random.default_rng(seed)
+  stim_weight = np.zeros(0)
+  # Potentiated recurrent weight from the winners preceding the neuron's
+  # last firing, and the round of those winners (-1: none yet).
+  recurrent_mass = np.zeros(0)
+  mass_round = np.zeros(0, dtype=np.int64)
+  winners_by_round = []
+  saved_w = []
+  for round_index in range(t):
+    w = len(stim_weight)
+    if round_index == 0:
+      # Stimulus only; the area has no assembly yet.
+      total_k = k
+      support_inputs = np.zeros(0)
+      support_recurrent = np.zeros(0)
+    else:
+      previous = winners_by_round[-1]
+      total_k = 2 * k
+      in_previous = np.zeros(w, dtype=bool)
+      in_previous[previous] = True
+      # Overlap of the previous winners with the winners of every round.
+      overlap_by_round = np.array(
+          [np.count_nonzero(in_previous[r]) for r in winners_by_round]
+          + [0])  # index -1: no reference round
+      overlap = overlap_by_round[mass_round]
+      support_recurrent = (recurrent_mass * overlap / k
+                           + rng.binomial(len(previous) - overlap, p))
+      support_inputs = stim_weight + support_recurrent
+    new_inputs = _sample_new_inputs(rng, n, w, k, total_k, p)
+    all_inputs = np.concatenate([support_inputs, new_inputs])
+    # Top-k; ties broken towards the support, like heapq.nlargest.
+    order = np.argsort(-all_inputs, kind='stable')[:k]
+    old_winners = order[order < w]
+    first_inputs = all_inputs[order[order >= w]]
+    num_first = len(first_inputs)
+
+    # Plasticity into the winners (the stimulus and the area both fired).
+    stim_weight[old_winners] *= 1 + beta
+    if round_index > 0:
+      recurrent_mass[old_winners] = (support_recurrent[old_winners]
+                                     * (1 + beta))
+      mass_round[old_winners] = round_index - 1
+    # First winners: split their input between the stimulus and the area.
+    if round_index == 0:
+      first_stim = first_inputs
+    else:
+      first_stim = rng.hypergeometric(k, k, first_inputs.astype(np.int64))
+    stim_weight = np.concatenate([stim_weight, first_stim * (1 + beta)])
+    recurrent_mass = np.concatenate(
+        [recurrent_mass, (first_inputs - first_stim) * (1 + beta)])
+    mass_round = np.concatenate([
+        mass_round,
+        np.full(num_first, round_index - 1 if round_index else -1)])
+    winners_by_round.append(
+        np.concatenate([old_winners, np.arange(w, w + num_first)]))
+    saved_w.append(w + num_first)
+  return saved_w
+
+
+def convergence_round(saved_w, tolerance=0.01):
+  """First round after which w grows by at most tolerance * final w."""
+  saved_w = np.asarray(saved_w)
+  remaining_growth = saved_w[-1] - saved_w
+  return int(np.argmax(remaining_growth <= tolerance * saved_w[-1]))
+
+
+def project_beta_w(n=100000, k=317, p=0.01, t=100,
+                   betas=(0.25, 0.1, 0.075, 0.05, 0.03, 0.01, 0.007, 0.005,
+                          0.003, 0.001), seed=0):
+  """Mean-field counterpart of simulations.project_beta_sim."""
+  return {beta: project_w(n, k, p, beta, t, seed=seed) for beta in betas}
+
+
+def check(points, t=50, seeds=(0,), tolerance=0.01):
+  """Compares the mean-field trajectory with the exact engine.
+
+  Args:
+    points: Dicts with n, k, p and beta.
+    t: Rounds to project.
+    seeds: Each point is run once per seed in both engines.
+    tolerance: For convergence_round().
+
+  Returns:
+    One dict per point and seed with the exact and mean-field final w,
+    their relative error, both convergence rounds and the largest relative
+    error over the whole trajectory.
+  """
+  report = []
+  for point in points:
+    for seed in seeds:
+      exact = np.array(simulations.project_sim(t=t, seed=seed, **point))
+      approx = np.array(project_w(t=t, seed=seed, **point))
+      report.append(dict(
+          point, seed=seed,
+          exact_w=int(exact[-1]),
+          meanfield_w=int(approx[-1]),
+          final_error=float(abs(approx[-1] - exact[-1]) / exact[-1]),
+          max_error=float(np.max(np.abs(approx - exact) / exact)),
+          exact_convergence=convergence_round(exact, tolerance),
+          meanfield_convergence=convergence_round(approx, tolerance)))
+  return report
@@ -0,0 +1,108 @@
+# Ready-made step observers for `brain.Brain.add_observer()`.
+#
+# They compute per-step metrics online, so experiments do not need
+# `save_winners=True` and a pass over the saved history afterwards:
+#
+#   overlap = observers.OverlapObserver(reference_round=9, percentage=True)
+#   b.add_observer(overlap, areas=["A"])
+#   ... b.project(...) ...
+#   overlap.overlaps  # overlap of every round of A with round 9
+
+import math
+
+import numpy as np
+
+
+class OverlapObserver:
+  """Records the overlap of an area's winners with a reference assembly.
+
+  The reference is either given (`reference=` or `set_reference()`) or
+  taken from the area's winners at `reference_round`. Rounds before the
+  reference round are buffered until it arrives -- at most
+  `reference_round - start_round` rows -- and streamed afterwards.
+
+  Attributes:
+    overlaps: Overlap per observed round, from `start_round` on.
+  """
+
+  def __init__(self, reference_round=None, reference=None, start_round=0,
+               percentage=False):
+    """Initializes the instance.
+
+    Args:
+      reference_round: Area round whose winners are the reference.
+      reference: Explicit reference winners (instead of reference_round).
+      start_round: First area round to record.
+      percentage: Report overlap / len(reference) instead of counts.
+    """
+    if (reference_round is None) == (reference is None):
+      raise ValueError('Pass exactly one of reference_round and reference.')
+    self.reference_round = reference_round
+    self.start_round = start_round
+    self.percentage = percentage
+    self.overlaps = []
+    self._pending = []
+    self._reference = None
+    if reference is not None:
+      self.set_reference(reference)
+
+  def set_reference(self, winners):
+    """Sets the reference assembly; scores any buffered rounds against it."""
+    self._reference = np.array(winners, dtype=np.uint32)
+    pending, self._pending = self._pending, []
+    for winners in pending:
+      self.overlaps.append(self._overlap(winners))
+
+  def _overlap(self, winners):
+    overlap = int(np.count_nonzero(np.isin(winners, self._reference)))
+    if self.percentage:
+      return overlap / len(self._reference)
+    return overlap
+
+  def __call__(self, record):
+    if record.round < self.start_round:
+      return
+    if self._reference is None:
+      if record.round == self.reference_round:
+        self._pending.append(record.winners)
+        self.set_reference(record.winners)
+      else:
+        # Copy: buffered rows must not depend on the caller's array.
+        self._pending.append(np.array(record.winners))
+      return
+    self.overlaps.append(self._overlap(record.winners))
+
+
+class RoundStats:
+  """Streams count / mean / standard deviation / min / max of a metric.
+
+  Uses Welford's algorithm, so nothing but five numbers per area is kept.
+  `metric` maps a StepRecord to a number, e.g. `lambda r: r.w`.
+  """
+
+  def __init__(self, metric):
+    self.metric = metric
+    self._stats = {}
+
+  def __call__(self, record):
+    value = self.metric(record)
+    stats = self._stats.get(record.area)
+    if stats is None:
+      self._stats[record.area] = stats = [0, 0.0, 0.0, value, value]
+    stats[0] += 1
+    delta = value - stats[1]
+    stats[1] += delta / stats[0]
+    stats[2] += delta * (value - stats[1])
+    stats[3] = min(stats[3], value)
+    stats[4] = max(stats[4], value)
+
+  def summary(self, area):
+    """Returns a dict with count, mean, std, min and max for `area`."""
+    count, mean, sum_sq, low, high = self._stats[area]
+    return {
+      'count': count,
+      'mean': mean,
+      'std': math.sqrt(sum_sq / (count - 1)) if count > 1 else 0.0,
+      'min': low,
+      'max': high,
+    }
@@ -1,14 +1,8 @@
 #! /usr/bin/python3.9
-import brain
-import brain_util as bu
-import numpy as np
-import pptree
-import json
-import copy
-
-from collections import namedtuple
+import lexicon
+import parser_engine
+
 from collections import defaultdict
-from enum import Enum
 
 # BrainAreas
 LEX = "LEX"
@@ -31,8 +25,8 @@ LEX_SIZE = 20
 DET_SIZE = 20
 
 # Actions
-DISINHIBIT = "DISINHIBIT"
-INHIBIT = "INHIBIT"
+DISINHIBIT = lexicon.DISINHIBIT
+INHIBIT = lexicon.INHIBIT
 # Skip firing in this round, just activate the word in LEX/DET/other word areas.
 # All other rules for these lexical items should be in PRE_RULES.
 ACTIVATE_ONLY = "ACTIVATE_ONLY"
@@ -47,10 +41,11 @@ RUSSIAN_EXPLICIT_AREAS = [LEX]
 RUSSIAN_LEX_SIZE = 7
 
 
-AreaRule = namedtuple('AreaRule', ['action', 'area', 'index'])
-FiberRule = namedtuple('FiberRule', ['action', 'area1', 'area2', 'index'])
-FiringRule = namedtuple('FiringRule', ['action'])
-OtherRule = namedtuple('OtherRule', ['action'])
+# Shared by all parsers, see lexicon.py.
+AreaRule = lexicon.AreaRule
+FiberRule = lexicon.FiberRule
+FiringRule = lexicon.FiringRule
+OtherRule = lexicon.OtherRule
 
 def generic_noun(index):
 	return {
@@ -336,145 +331,25 @@ RUSSIAN_READOUT_RULES = {
 	LEX: [],
 }
 
-class ParserBrain(brain.Brain):
-	def __init__(self, p, lexeme_dict={}, all_areas=[], recurrent_areas=[], initial_areas=[], readout_rules={}):
-		brain.Brain.__init__(self, p)
-		self.lexeme_dict = lexeme_dict
-		self.all_areas = all_areas
-		self.recurrent_areas = recurrent_areas
-		self.initial_areas = initial_areas
-
-		self.fiber_states = defaultdict()
-		self.area_states = defaultdict(set)
-		self.activated_fibers = defaultdict(set)
-		self.readout_rules = readout_rules
-		self.initialize_states()
-
-	def initialize_states(self):
-		for from_area in self.all_areas:
-			self.fiber_states[from_area] = defaultdict(set)
-			for to_area in self.all_areas:
-				self.fiber_states[from_area][to_area].add(0)
-
-		for area in self.all_areas:
-			self.area_states[area].add(0)
-
-		for area in self.initial_areas:
-			self.area_states[area].discard(0)
-
-	def applyFiberRule(self, rule):
-		if rule.action == INHIBIT:
-			self.fiber_states[rule.area1][rule.area2].add(rule.index)
-			self.fiber_states[rule.area2][rule.area1].add(rule.index)
-		elif rule.action == DISINHIBIT:
-			self.fiber_states[rule.area1][rule.area2].discard(rule.index)
-			self.fiber_states[rule.area2][rule.area1].discard(rule.index)
-
-	def applyAreaRule(self, rule):
-		if rule.action == INHIBIT:
-			self.area_states[rule.area].add(rule.index)
-		elif rule.action == DISINHIBIT:
-			self.area_states[rule.area].discard(rule.index)
-
-	def applyRule(self, rule):
-		if isinstance(rule, FiberRule):
-			self.applyFiberRule(rule)
-			return True
-		if isinstance(rule, AreaRule):
-			self.applyAreaRule(rule)
-			return True
-		return False
-
-	def parse_project(self):
-		project_map = self.getProjectMap()
-		self.remember_fibers(project_map)
-		self.project({}, project_map)
-
-	# For fiber-activation readout, remember all fibers that were ever fired.
-	def remember_fibers(self, project_map):
-		for from_area, to_areas in project_map.items():
-			self.activated_fibers[from_area].update(to_areas)
-
-	def recurrent(self, area):
-		return (area in self.recurrent_areas)
-
-	# TODO: Remove brain from ProjectMap somehow
-	# perhaps replace Parser state with ParserBrain:Brain, better design
-	def getProjectMap(self):
-		proj_map = defaultdict(set)
-		for area1 in self.all_areas:
-			if len(self.area_states[area1]) == 0:
-				for area2 in self.all_areas:
-					if area1 == LEX and area2 == LEX:
-						continue
-					if len(self.area_states[area2]) == 0:
-						if len(self.fiber_states[area1][area2]) == 0:
-							if self.area_by_name[area1].winners:
-								proj_map[area1].add(area2)
-							if self.area_by_name[area2].winners:
-								proj_map[area2].add(area2)
-		return proj_map
-
-	def activateWord(self, area_name, word):
-		area = self.area_by_name[area_name]
-		k = area.k
-		assembly_start = self.lexeme_dict[word]["index"]*k
-		area.winners = list(range(assembly_start, assembly_start+k))
-		area.fix_assembly()
-
-	def activateIndex(self, area_name, index):
-		area = self.area_by_name[area_name]
-		k = area.k
-		assembly_start = index*k
-		area.winners = list(range(assembly_start, assembly_start+k))
-		area.fix_assembly()
-
-	def interpretAssemblyAsString(self, area_name):
-		return self.getWord(area_name, 0.7)
-
-	def getWord(self, area_name, min_overlap=0.7):
-		if not self.area_by_name[area_name].winners:
-			raise Exception("Cannot get word because no assembly in " + area_name)
-		winners = set(self.area_by_name[area_name].winners)
-		area_k = self.area_by_name[area_name].k
-		threshold = min_overlap * area_k
-		for word, lexeme in self.lexeme_dict.items():
-			word_index = lexeme["index"]
-			word_assembly_start = word_index * area_k
-			word_assembly = set(range(word_assembly_start, word_assembly_start + area_k))
-			if len((winners & word_assembly)) >= threshold:
-				return word
-		return None
-
-	def getActivatedFibers(self):
-		# Prune activated_fibers pased on the readout_rules
-		pruned_activated_fibers = defaultdict(set)
-		for from_area, to_areas in self.activated_fibers.items():
-			for to_area in to_areas:
-				if to_area in self.readout_rules[from_area]:
-					pruned_activated_fibers[from_area].add(to_area)
-
-		# Transitive reduction: if A->C and C->B, remove A->B
-		# This helps remove redundant connections, e.g. VERB->ADJ when VERB->OBJ->ADJ exists
-		# (like in "dogs are big cats")
-		for area in list(pruned_activated_fibers.keys()):
-			targets = list(pruned_activated_fibers[area])
-			for target_b in targets:
-				if target_b == LEX:
-					continue
-				for target_c in targets:
-					if target_b == target_c:
-						continue
-					if target_b in pruned_activated_fibers[target_c]:
-						pruned_activated_fibers[area].discard(target_b)
-						break
-
-		return pruned_activated_fibers
+# Everything language-independent lives in parser_engine.py.
+ParserBrain = parser_engine.ParserBrain
+ParserDebugger = parser_engine.ParserDebugger
+ReadoutMethod = parser_engine.ReadoutMethod
+potentiate_word_in_LEX = parser_engine.potentiate_word_in_LEX
+parseWord = parser_engine.parseWord
+readOut = parser_engine.readOut
+readoutRoots = parser_engine.readoutRoots
+ParseResult = parser_engine.ParseResult
+parse_quietly = parser_engine.parse_quietly
+parse_batch = parser_engine.parse_batch
+ParseCache = parser_engine.ParseCache
+IncrementalParser = parser_engine.IncrementalParser
+parse_incrementally = parser_engine.parse_incrementally
 
 
 class RussianParserBrain(ParserBrain):
 	def __init__(self, p, non_LEX_n=10000, non_LEX_k=100, LEX_k=10, 
-		default_beta=0.2, LEX_beta=1.0, recurrent_beta=0.05, interarea_beta=0.5, verbose=False):
+		default_beta=0.2, LEX_beta=1.0, recurrent_beta=0.05, interarea_beta=0.5, verbose=False, seed=0, block_LEX=False):
 
 		recurrent_areas = [NOM, VERB, ACC, DAT]
 		ParserBrain.__init__(self, p, 
@@ -482,11 +357,12 @@ class RussianParserBrain(ParserBrain):
 			all_areas=RUSSIAN_AREAS, 
 			recurrent_areas=recurrent_areas,
 			initial_areas=[LEX],
-			readout_rules=RUSSIAN_READOUT_RULES)
+			readout_rules=RUSSIAN_READOUT_RULES,
+			seed=seed,
+			block_LEX=block_LEX)
 		self.verbose = verbose
 
-		LEX_n = RUSSIAN_LEX_SIZE * LEX_k
-		self.add_explicit_area(LEX, LEX_n, LEX_k, default_beta)
+		self.addLEXArea(RUSSIAN_LEX_SIZE, LEX_k, default_beta)
 
 		self.add_area(NOM, non_LEX_n, non_LEX_k, default_beta)
 		self.add_area(ACC, non_LEX_n, non_LEX_k, default_beta)
@@ -510,18 +386,24 @@ class RussianParserBrain(ParserBrain):
 
 
 class EnglishParserBrain(ParserBrain):
+	single_LEX_fiber = True
+	null_det_area = DET
+	null_det_index = DET_SIZE - 1
+	non_word = "<NON-WORD>"
+
 	def __init__(self, p, non_LEX_n=10000, non_LEX_k=100, LEX_k=20, 
-		default_beta=0.2, LEX_beta=1.0, recurrent_beta=0.05, interarea_beta=0.5, verbose=False):
+		default_beta=0.2, LEX_beta=1.0, recurrent_beta=0.05, interarea_beta=0.5, verbose=False, seed=0, block_LEX=False):
 		ParserBrain.__init__(self, p, 
 			lexeme_dict=LEXEME_DICT, 
 			all_areas=AREAS, 
 			recurrent_areas=RECURRENT_AREAS, 
 			initial_areas=[LEX, SUBJ, VERB],
-			readout_rules=ENGLISH_READOUT_RULES)
+			readout_rules=ENGLISH_READOUT_RULES,
+			seed=seed,
+			block_LEX=block_LEX)
 		self.verbose = verbose
 
-		LEX_n = LEX_SIZE * LEX_k
-		self.add_explicit_area(LEX, LEX_n, LEX_k, default_beta)
+		self.addLEXArea(LEX_SIZE, LEX_k, default_beta)
 
 		DET_k = LEX_k
 		self.add_area(SUBJ, non_LEX_n, non_LEX_k, default_beta)
@@ -548,109 +430,7 @@ class EnglishParserBrain(ParserBrain):
 
 		self.update_plasticities(area_update_map=custom_plasticities)
 
-	def getProjectMap(self):
-		proj_map = ParserBrain.getProjectMap(self)
-		# "War of fibers"
-		if LEX in proj_map and len(proj_map[LEX]) > 2:  # because LEX->LEX
-			raise Exception("Got that LEX projecting into many areas: " + str(proj_map[LEX]))
-		return proj_map
-
-
-	def getWord(self, area_name, min_overlap=0.7):
-		word = ParserBrain.getWord(self, area_name, min_overlap)
-		if word:
-			return word
-		if not word and area_name == DET:
-			winners = set(self.area_by_name[area_name].winners)
-			area_k = self.area_by_name[area_name].k
-			threshold = min_overlap * area_k
-			nodet_index = DET_SIZE - 1
-			nodet_assembly_start = nodet_index * area_k
-			nodet_assembly = set(range(nodet_assembly_start, nodet_assembly_start + area_k))
-			if len((winners & nodet_assembly)) > threshold:
-				return "<null-det>"
-		# If nothing matched, at least we can see that in the parse output.
-		return "<NON-WORD>"
-
-
-
-class ParserDebugger():
-	def __init__(self, brain, all_areas, explicit_areas):
-		self.b = brain
-		self.all_areas = all_areas
-		self.explicit_areas = explicit_areas
-
-	def run(self):
-		command = input("DEBUGGER: ENTER to continue, 'P' for PEAK \n")
-		while command:
-			if command == "P":
-				self.peak()
-				return
-			elif command:
-				print("DEBUGGER: Command not recognized...")
-				command = input("DEBUGGER: ENTER to continue, 'P' for PEAK \n")
-			else:
-				return
-
-	def peak(self):
-		remove_map = defaultdict(int)
-		# Temporarily set beta to 0
-		self.b.disable_plasticity = True
-		self.b.save_winners = True
-
-		for area in self.all_areas:
-			self.b.area_by_name[area].unfix_assembly()
-		while True:
-			test_proj_map_string = input("DEBUGGER: enter projection map, eg. {\"VERB\": [\"LEX\"]}, or ENTER to quit\n")
-			if not test_proj_map_string:
-				break
-			test_proj_map = json.loads(test_proj_map_string)
-			# Important: save winners to later "remove" this test project round 
-			to_area_set = set()
-			for _, to_area_list in test_proj_map.items():
-				for to_area in to_area_list:
-					to_area_set.add(to_area)
-					if not self.b.area_by_name[to_area].saved_winners:
-						self.b.area_by_name[to_area].saved_winners.append(self.b.area_by_name[to_area].winners)
-
-			for to_area in to_area_set:
-				remove_map[to_area] += 1
-
-			self.b.project({}, test_proj_map)
-			for area in self.explicit_areas:
-				if area in to_area_set:
-					area_word = self.b.interpretAssemblyAsString(area)
-					print("DEBUGGER: in explicit area " + area + ", got: " + area_word)
-
-			print_assemblies = input("DEBUGGER: print assemblies in areas? Eg. 'LEX,VERB' or ENTER to cont\n")
-			if not print_assemblies:
-				continue
-			for print_area in print_assemblies.split(","):
-				print("DEBUGGER: Printing assembly in area " + print_area)
-				print(str(self.b.area_by_name[print_area].winners))
-				if print_area in self.explicit_areas:
-					word = self.b.interpretAssemblyAsString(print_area)
-					print("DEBUGGER: in explicit area got assembly = " + word)
-
-		# Restore assemblies (winners) and w values to before test projections
-		for area, num_test_projects in remove_map.items():
-			self.b.area_by_name[area].winners = self.b.area_by_name[area].saved_winners[0]
-			self.b.area_by_name[area].w = self.b.area_by_name[area].saved_w[-num_test_projects - 1]
-			self.b.area_by_name[area].saved_w = self.b.area_by_name[area].saved_w[:(-num_test_projects)]
-		self.b.disable_plasticity = False
-		self.b.save_winners = False
-		for area in self.all_areas:
-			self.b.area_by_name[area].saved_winners = []
-
-	
-
-# strengthen the assembly representing this word in LEX
-# possibly useful way to simulate long-term potentiated word assemblies 
-# so that they are easily completed.
-def potentiate_word_in_LEX(b, word, rounds=20):
-	b.activateWord(LEX, word)
-	for _ in range(20):
-		b.project({}, {LEX: [LEX]})
+
 
 # "dogs chase cats" experiment, what should happen?
 # simplifying assumption 1: after every project round, freeze assemblies
@@ -668,156 +448,47 @@ def potentiate_word_in_LEX(b, word, rounds=20):
 # "cats": 
 
 
-# Readout types
-class ReadoutMethod(Enum):
-	FIXED_MAP_READOUT = 1
-	FIBER_READOUT = 2
-	NATURAL_READOUT = 3
-
-
-
+# Language packs of this parser, also registered with the engine under
+# these names (so e.g. parse_batch(sentences, language="Russian") works).
+LANGUAGES = {
+	"English": parser_engine.register(parser_engine.LanguagePack("English",
+		EnglishParserBrain, LEXEME_DICT, AREAS, EXPLICIT_AREAS,
+		ENGLISH_READOUT_RULES)),
+	"Russian": parser_engine.register(parser_engine.LanguagePack("Russian",
+		RussianParserBrain, RUSSIAN_LEXEME_DICT, RUSSIAN_AREAS,
+		RUSSIAN_EXPLICIT_AREAS, RUSSIAN_READOUT_RULES)),
+}
 
 
+# With min_rounds set, each word is projected for between min_rounds and
+# project_rounds rounds, stopping once the parse settles (see
+# parser_engine.parseWord), and the rounds used per word are printed.
 def parse(sentence="dogs are bad cats", language="English", p=0.1, LEX_k=20, 
-	project_rounds=20, verbose=False, debug=False, readout_method=ReadoutMethod.FIBER_READOUT):
-
-	if language == "English":
-		b = EnglishParserBrain(p, LEX_k=LEX_k, verbose=verbose)
-		lexeme_dict = LEXEME_DICT
-		all_areas = AREAS
-		explicit_areas = EXPLICIT_AREAS
-		readout_rules = ENGLISH_READOUT_RULES
+	project_rounds=20, verbose=False, debug=False, readout_method=ReadoutMethod.FIBER_READOUT,
+	min_rounds=None, block_LEX=False):
 
-	if language == "Russian":
-		b = RussianParserBrain(p, LEX_k=LEX_k, verbose=verbose)
-		lexeme_dict = RUSSIAN_LEXEME_DICT
-		all_areas = RUSSIAN_AREAS
-		explicit_areas = RUSSIAN_EXPLICIT_AREAS
-		readout_rules = RUSSIAN_READOUT_RULES
-
-	parseHelper(b, sentence, p, LEX_k, project_rounds, verbose, debug, 
-		lexeme_dict, all_areas, explicit_areas, readout_method, readout_rules)
+	pack = LANGUAGES[language]
+	b = parser_engine.newBrain(pack, p, LEX_k, verbose=verbose,
+		block_LEX=block_LEX)
+	return parseHelper(b, sentence, p, LEX_k, project_rounds, verbose, debug, 
+		pack.lexeme_dict, pack.all_areas, pack.explicit_areas, readout_method,
+		pack.readout_rules, min_rounds)
 
 
 def parseHelper(b, sentence, p, LEX_k, project_rounds, verbose, debug, 
-	lexeme_dict, all_areas, explicit_areas, readout_method, readout_rules):
-	debugger = ParserDebugger(b, all_areas, explicit_areas)
-
-	sentence = sentence.split(" ")
-
-	extreme_debug = False
-
-	for word in sentence:
-		lexeme = lexeme_dict[word]
-		b.activateWord(LEX, word)
-		if verbose:
-			print("Activated word: " + word)
-			print(b.area_by_name[LEX].winners)
-
-		for rule in lexeme["PRE_RULES"]:
-			b.applyRule(rule)
-
-		proj_map = b.getProjectMap()
-		for area in proj_map:
-			if area not in proj_map[LEX]:
-				b.area_by_name[area].fix_assembly()
-				if verbose:
-					print("FIXED assembly bc not LEX->this area in: " + area)
-			elif area != LEX:
-				b.area_by_name[area].unfix_assembly()
-				b.area_by_name[area].winners = []
-				if verbose:
-					print("ERASED assembly because LEX->this area in " + area)
-
-		proj_map = b.getProjectMap()
-		if verbose:
-			print("Got proj_map = ")
-			print(proj_map)
-
-		for i in range(project_rounds):
-			b.parse_project()
-			if verbose:
-				proj_map = b.getProjectMap()
-				print("Got proj_map = ")
-				print(proj_map)
-			if extreme_debug and word == "a":
-				print("Starting debugger after round " + str(i) + "for word" + word)
-				debugger.run()
-
-		#if verbose:
-		#	print("Done projecting for this round")
-		#	for area_name in all_areas:
-		#		print("Post proj stats for " + area_name)
-		#		print("w=" + str(b.area_by_name[area_name].w))
-		#		print("num_first_winners=" + str(b.area_by_name[area_name].num_first_winners))
-
-		for rule in lexeme["POST_RULES"]:
-			b.applyRule(rule)
-
-		if debug:
-			print("Starting debugger after the word " + word)
-			debugger.run()
-			
-
-	# Readout
-	# For all readout methods, unfix assemblies and remove plasticity.
-	b.disable_plasticity = True
-	for area in all_areas:
-		b.area_by_name[area].unfix_assembly()
-
-	dependencies = []
-	def read_out(area, mapping):
-		to_areas = mapping[area]
-		b.project({}, {area: to_areas})
-		this_word = b.getWord(LEX)
-
-		for to_area in to_areas:
-			if to_area == LEX:
-				continue
-			b.project({}, {to_area: [LEX]})
-			other_word = b.getWord(LEX)
-			dependencies.append([this_word, other_word, to_area])
-
-		for to_area in to_areas:
-			if to_area != LEX:
-				read_out(to_area, mapping)
-
-
-	def treeify(parsed_dict, parent):
-		for key, values in parsed_dict.items():
-			key_node = pptree.Node(key, parent)
-			if isinstance(values, str):
-				_ = pptree.Node(values, key_node)
-			else:
-				treeify(values, key_node)
-
-	if readout_method == ReadoutMethod.FIXED_MAP_READOUT:
-		# Try "reading out" the parse.
-		# To do so, start with final assembly in VERB
-		# project VERB->SUBJ,OBJ,LEX
-
-		parsed = {VERB: read_out(VERB, readout_rules)}
-
-		print("Final parse dict: ")
-		print(parsed)
-
-		root = pptree.Node(VERB)
-		treeify(parsed[VERB], root)
-
+	lexeme_dict, all_areas, explicit_areas, readout_method, readout_rules,
+	min_rounds=None):
+	pack = parser_engine.LanguagePack("", type(b), lexeme_dict, all_areas,
+		explicit_areas, readout_rules)
+	dependencies = parser_engine.parseSentence(b, sentence, pack,
+		project_rounds, verbose, debug, readout_method, min_rounds)
+	if min_rounds is not None:
+		print("Projection rounds per word: ")
+		print(list(zip(pack.segment(sentence), b.rounds_used)))
 	if readout_method == ReadoutMethod.FIBER_READOUT:
-		activated_fibers = b.getActivatedFibers()
-		if verbose:
-			print("Got activated fibers for readout:")
-			print(activated_fibers)
-
-		read_out(VERB, activated_fibers)
 		print("Got dependencies: ")
 		print(dependencies)
-
-		# root = pptree.Node(VERB)
-		#treeify(parsed[VERB], root)
-
-	# pptree.print_tree(root)
+	return dependencies
 
 
 def main():
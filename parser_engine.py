@@ -0,0 +1,849 @@
+#! /usr/bin/python3.9
+# Parser engine shared by parser.py, recursive_parser.py and
+# chinese_parser.py.
+#
+# The engine holds everything that does not depend on the language: the
+# ParserBrain (inhibition state, compiled lexicon programs, project maps,
+# readout), the debugger, the per-word parsing loop, the readout, and batch,
+# cached and incremental parsing. A language is a LanguagePack: its brain
+# class (which adds the areas and plasticities), lexicon, areas and readout
+# rules, plus optional hooks:
+#   segment(sentence)     splits a sentence into words (default: spaces);
+#   parse_words(b, words, pack, project_rounds, verbose, debugger, debug)
+#                         feeds the words to the brain (default: one
+#                         parseWord per word; recursive_parser replaces it
+#                         to handle DEP_CLAUSE);
+#   finish(words, dependencies, pack)
+#                         post-processes the dependencies read out.
+# A pack also sets the projection rounds per word its parser needs
+# (project_rounds, default 20), used wherever none are given.
+# The parser modules define their packs and register them in LANGUAGES, so
+# every engine function takes either a pack or the name of one.
+
+import assembly
+import brain
+import lexicon
+import shared_brain
+import json
+import concurrent.futures
+import functools
+import pickle
+import numpy as np
+
+from collections import namedtuple
+from collections import OrderedDict
+from collections import defaultdict
+from enum import Enum
+
+# The explicit area holding the word assemblies, in every language.
+LEX = "LEX"
+
+
+class ParserBrain(brain.Brain):
+	# Language-specific behaviour, set by the subclasses:
+	# Remove A->B from the readout fibers when A->C->B exists.
+	transitive_readout = True
+	# Raise when LEX projects into more than one other area ("war of fibers").
+	single_LEX_fiber = False
+	# getWord fallbacks: an assembly of null_det_index in null_det_area reads
+	# as "<null-det>", and any other unreadable assembly as non_word.
+	null_det_area = None
+	null_det_index = None
+	non_word = None
+	# readWord retries unreadable words at this smaller overlap, and readout
+	# drops dependencies on words it still cannot read.
+	readout_fallback_overlap = None
+	skip_unread_words = False
+
+	def __init__(self, p, lexeme_dict={}, all_areas=[], recurrent_areas=[], initial_areas=[], readout_rules={}, seed=0, block_LEX=False):
+		brain.Brain.__init__(self, p, seed=seed)
+		self.lexeme_dict = lexeme_dict
+		# Whether addLEXArea allocates word assemblies on first activation.
+		self.block_LEX = block_LEX
+		# Assembly index -> word, for reading out explicit areas in getWord.
+		self.lexeme_labels = assembly.labels_from_lexicon(lexeme_dict)
+		self.all_areas = all_areas
+		self.recurrent_areas = recurrent_areas
+		self.initial_areas = initial_areas
+
+		# Inhibition state as bitmasks: bit i is set while the area (fiber) is
+		# inhibited by rule index i, so 0 means disinhibited.
+		self.fiber_states = defaultdict()
+		self.area_states = defaultdict(int)
+		self.activated_fibers = defaultdict(set)
+		self.readout_rules = readout_rules
+		# Projection rounds run for each word parsed so far (see parseWord).
+		self.rounds_used = []
+		self.initialize_states()
+
+	def initialize_states(self):
+		for from_area in self.all_areas:
+			self.fiber_states[from_area] = defaultdict(int)
+			for to_area in self.all_areas:
+				self.fiber_states[from_area][to_area] = 1
+
+		for area in self.all_areas:
+			self.area_states[area] = 1
+
+		for area in self.initial_areas:
+			self.area_states[area] &= ~1
+		self._project_map_cache = None
+
+	def applyFiberRule(self, rule):
+		if rule.action == lexicon.INHIBIT:
+			self.fiber_states[rule.area1][rule.area2] |= 1 << rule.index
+			self.fiber_states[rule.area2][rule.area1] |= 1 << rule.index
+		elif rule.action == lexicon.DISINHIBIT:
+			self.fiber_states[rule.area1][rule.area2] &= ~(1 << rule.index)
+			self.fiber_states[rule.area2][rule.area1] &= ~(1 << rule.index)
+		self._project_map_cache = None
+
+	def applyAreaRule(self, rule):
+		if rule.action == lexicon.INHIBIT:
+			self.area_states[rule.area] |= 1 << rule.index
+		elif rule.action == lexicon.DISINHIBIT:
+			self.area_states[rule.area] &= ~(1 << rule.index)
+		self._project_map_cache = None
+
+	def applyRule(self, rule):
+		if isinstance(rule, lexicon.FiberRule):
+			self.applyFiberRule(rule)
+			return True
+		if isinstance(rule, lexicon.AreaRule):
+			self.applyAreaRule(rule)
+			return True
+		return False
+
+	# Applies a compiled lexicon.Program: the net effect of its rules.
+	def applyProgram(self, program):
+		area_states = self.area_states
+		for area, set_mask, keep_mask in program.areas:
+			area_states[area] = (area_states[area] & keep_mask) | set_mask
+		fiber_states = self.fiber_states
+		for from_area, to_area, set_mask, keep_mask in program.fibers:
+			states = fiber_states[from_area]
+			states[to_area] = (states[to_area] & keep_mask) | set_mask
+		self._project_map_cache = None
+
+	# Projects along the project map once. With check_stable, returns
+	# whether the parse of the current word has settled (see stable).
+	def parse_project(self, check_stable=False):
+		project_map = self.getProjectMap()
+		self.remember_fibers(project_map)
+		if not check_stable:
+			self.project({}, project_map)
+			return None
+		previous_winners = {to_area: self.area_by_name[to_area].winners
+			for to_areas in project_map.values() for to_area in to_areas}
+		self.project({}, project_map)
+		return self.stable(project_map, previous_winners)
+
+	# Whether a projection along project_map changed nothing the readout
+	# depends on: no area projected into gained new winners or changed its
+	# winners, and every fiber the readout can follow already recalls its
+	# target assembly from the source assembly alone.
+	def stable(self, project_map, previous_winners):
+		for area_name, winners in previous_winners.items():
+			area = self.area_by_name[area_name]
+			if area.num_first_winners > 0 or set(area.winners) != set(winners):
+				return False
+		for from_area, to_areas in project_map.items():
+			if from_area == LEX:
+				continue
+			for to_area in to_areas:
+				if to_area != from_area and not self.recalls(from_area, to_area):
+					return False
+		return True
+
+	# Whether projecting from_area alone into to_area would bring back the
+	# winners of to_area (for LEX: the word they read as).
+	def recalls(self, from_area, to_area):
+		source = self.area_by_name[from_area]
+		target = self.area_by_name[to_area]
+		inputs = self.connectomes[from_area][to_area][source.winners].sum(axis=0)
+		if inputs.size > target.k:
+			recalled = np.argpartition(-inputs, target.k)[:target.k]
+		else:
+			recalled = np.arange(inputs.size)
+		if to_area == LEX:
+			index = self.assembly_index(LEX, self.lexeme_labels)
+			word = index.read_label(target.winners, 0.7)
+			return word is not None and index.read_label(recalled, 0.7) == word
+		return set(recalled.tolist()) == set(target.winners)
+
+	# For fiber-activation readout, remember all fibers that were ever fired.
+	def remember_fibers(self, project_map):
+		for from_area, to_areas in project_map.items():
+			self.activated_fibers[from_area].update(to_areas)
+
+	def recurrent(self, area):
+		return (area in self.recurrent_areas)
+
+	# The map only depends on the inhibition state (reset by the apply*Rule
+	# methods) and on which areas have winners, so it is recomputed only
+	# when one of those changes; callers get a copy they may modify.
+	def getProjectMap(self):
+		has_winners = tuple(bool(self.area_by_name[area].winners)
+			for area in self.all_areas)
+		if (self._project_map_cache is None
+			or self._project_map_cache[0] != has_winners):
+			self._project_map_cache = (has_winners,
+				self.computeProjectMap(has_winners))
+		proj_map = defaultdict(set)
+		for area, to_areas in self._project_map_cache[1].items():
+			proj_map[area] = set(to_areas)
+		# "War of fibers"
+		if self.single_LEX_fiber and LEX in proj_map and len(proj_map[LEX]) > 2:  # because LEX->LEX
+			raise Exception("Got that LEX projecting into many areas: " + str(proj_map[LEX]))
+		return proj_map
+
+	def computeProjectMap(self, has_winners):
+		active = dict(zip(self.all_areas, has_winners))
+		disinhibited = [area for area in self.all_areas
+			if self.area_states[area] == 0]
+		proj_map = {}
+		for area1 in disinhibited:
+			fibers = self.fiber_states[area1]
+			for area2 in disinhibited:
+				if area1 == LEX and area2 == LEX:
+					continue
+				if fibers[area2] == 0:
+					if active[area1]:
+						proj_map.setdefault(area1, set()).add(area2)
+					if active[area2]:
+						proj_map.setdefault(area2, set()).add(area2)
+		return proj_map
+
+	# LEX holds one k-neuron assembly per word. With block_LEX it is a block
+	# area (see brain.Brain.add_block_area): a word's assembly and its
+	# connectivity are only sampled when the word is first activated, so
+	# memory scales with the words parsed rather than with num_words, and
+	# the vocabulary is not bounded by num_words.
+	def addLEXArea(self, num_words, k, beta):
+		if self.block_LEX:
+			self.add_block_area(LEX, k, beta)
+		else:
+			self.add_explicit_area(LEX, num_words * k, k, beta)
+
+	def activateWord(self, area_name, word):
+		self.activate(area_name, self.lexeme_dict[word]["index"])
+
+	def activateIndex(self, area_name, index):
+		self.activate(area_name, index)
+
+	def interpretAssemblyAsString(self, area_name):
+		return self.getWord(area_name, 0.7)
+
+	def getWord(self, area_name, min_overlap=0.7):
+		if not self.area_by_name[area_name].winners:
+			raise Exception("Cannot get word because no assembly in " + area_name)
+		# One bincount over the winners instead of a set per lexeme; ties go
+		# to the first word in lexeme_dict, as before.
+		index = self.assembly_index(area_name, self.lexeme_labels)
+		word = index.read_label(self.area_by_name[area_name].winners, min_overlap)
+		if word or self.non_word is None:
+			return word
+		if area_name == self.null_det_area:
+			counts = index.counts(self.area_by_name[area_name].winners)
+			if self.null_det_index < len(counts) and counts[self.null_det_index] > min_overlap * index.k:
+				return "<null-det>"
+		# If nothing matched, at least we can see that in the parse output.
+		return self.non_word
+
+	# The word in LEX, for the readout.
+	def readWord(self):
+		word = self.getWord(LEX)
+		if word is None and self.readout_fallback_overlap is not None:
+			word = self.getWord(LEX, min_overlap=self.readout_fallback_overlap)
+		return word
+
+	def getActivatedFibers(self):
+		# Prune activated_fibers pased on the readout_rules
+		# Lists in readout_rules order rather than sets, so the readout order
+		# does not depend on string hashing (or on how the sets were pickled).
+		pruned_activated_fibers = defaultdict(list)
+		for from_area, to_areas in self.activated_fibers.items():
+			for to_area in self.readout_rules[from_area]:
+				if to_area in to_areas:
+					pruned_activated_fibers[from_area].append(to_area)
+		if not self.transitive_readout:
+			return pruned_activated_fibers
+
+		# Transitive reduction: if A->C and C->B, remove A->B
+		# This helps remove redundant connections, e.g. VERB->ADJ when VERB->OBJ->ADJ exists
+		# (like in "dogs are big cats")
+		for area in list(pruned_activated_fibers.keys()):
+			targets = list(pruned_activated_fibers[area])
+			for target_b in targets:
+				if target_b == LEX:
+					continue
+				for target_c in targets:
+					if target_b == target_c:
+						continue
+					if target_b in pruned_activated_fibers[target_c]:
+						pruned_activated_fibers[area].remove(target_b)
+						break
+
+		return pruned_activated_fibers
+
+	# Reads out the word of area and of every area it has fibers to in
+	# mapping, appending [head word, dependent word, area] to dependencies,
+	# then recurses into those areas.
+	def readOutArea(self, area, mapping, dependencies):
+		to_areas = mapping[area]
+		self.project({}, {area: to_areas})
+		this_word = self.readWord()
+
+		for to_area in to_areas:
+			if to_area == LEX:
+				continue
+			self.project({}, {to_area: [LEX]})
+			other_word = self.readWord()
+			if other_word or not self.skip_unread_words:
+				dependencies.append([this_word, other_word, to_area])
+
+		for to_area in to_areas:
+			if to_area != LEX:
+				self.readOutArea(to_area, mapping, dependencies)
+
+
+class ParserDebugger():
+	def __init__(self, brain, all_areas, explicit_areas):
+		self.b = brain
+		self.all_areas = all_areas
+		self.explicit_areas = explicit_areas
+
+	def run(self):
+		command = input("DEBUGGER: ENTER to continue, 'P' for PEAK \n")
+		while command:
+			if command == "P":
+				self.peak()
+				return
+			elif command:
+				print("DEBUGGER: Command not recognized...")
+				command = input("DEBUGGER: ENTER to continue, 'P' for PEAK \n")
+			else:
+				return
+
+	def peak(self):
+		remove_map = defaultdict(int)
+		# Temporarily set beta to 0
+		self.b.disable_plasticity = True
+		self.b.save_winners = True
+
+		for area in self.all_areas:
+			self.b.area_by_name[area].unfix_assembly()
+		while True:
+			test_proj_map_string = input("DEBUGGER: enter projection map, eg. {\"VERB\": [\"LEX\"]}, or ENTER to quit\n")
+			if not test_proj_map_string:
+				break
+			test_proj_map = json.loads(test_proj_map_string)
+			# Important: save winners to later "remove" this test project round
+			to_area_set = set()
+			for _, to_area_list in test_proj_map.items():
+				for to_area in to_area_list:
+					to_area_set.add(to_area)
+					if not self.b.area_by_name[to_area].saved_winners:
+						self.b.area_by_name[to_area].saved_winners.append(self.b.area_by_name[to_area].winners)
+
+			for to_area in to_area_set:
+				remove_map[to_area] += 1
+
+			self.b.project({}, test_proj_map)
+			for area in self.explicit_areas:
+				if area in to_area_set:
+					area_word = self.b.interpretAssemblyAsString(area)
+					print("DEBUGGER: in explicit area " + area + ", got: " + area_word)
+
+			print_assemblies = input("DEBUGGER: print assemblies in areas? Eg. 'LEX,VERB' or ENTER to cont\n")
+			if not print_assemblies:
+				continue
+			for print_area in print_assemblies.split(","):
+				print("DEBUGGER: Printing assembly in area " + print_area)
+				print(str(self.b.area_by_name[print_area].winners))
+				if print_area in self.explicit_areas:
+					word = self.b.interpretAssemblyAsString(print_area)
+					print("DEBUGGER: in explicit area got assembly = " + word)
+
+		# Restore assemblies (winners) and w values to before test projections
+		for area, num_test_projects in remove_map.items():
+			self.b.area_by_name[area].winners = self.b.area_by_name[area].saved_winners[0]
+			self.b.area_by_name[area].w = self.b.area_by_name[area].saved_w[-num_test_projects - 1]
+			self.b.area_by_name[area].saved_w.truncate(-num_test_projects)
+		self.b.disable_plasticity = False
+		self.b.save_winners = False
+		for area in self.all_areas:
+			self.b.area_by_name[area].saved_winners.clear()
+
+
+# strengthen the assembly representing this word in LEX
+# possibly useful way to simulate long-term potentiated word assemblies
+# so that they are easily completed.
+def potentiate_word_in_LEX(b, word, rounds=20):
+	b.activateWord(LEX, word)
+	for _ in range(20):
+		b.project({}, {LEX: [LEX]})
+
+
+# Readout types
+class ReadoutMethod(Enum):
+	FIXED_MAP_READOUT = 1
+	FIBER_READOUT = 2
+	NATURAL_READOUT = 3
+
+
+# Feeds one word into the parser brain: activates its assembly in LEX,
+# applies the lexeme's PRE_RULES, projects for project_rounds rounds and
+# applies its POST_RULES.
+# With min_rounds set, projection stops early, after at least min_rounds
+# and at most project_rounds rounds, at the first round that leaves the
+# parse settled (see ParserBrain.stable). The rounds run are appended to
+# b.rounds_used.
+def parseWord(b, word, lexeme_dict, project_rounds, verbose=False,
+	debugger=None, min_rounds=None):
+	programs = lexicon.compile_lexicon(lexeme_dict)[word]
+	projectWord(b, word, programs, project_rounds, verbose, debugger,
+		min_rounds)
+	b.applyProgram(programs.post)
+
+# parseWord without the POST_RULES.
+def projectWord(b, word, programs, project_rounds, verbose=False,
+	debugger=None, min_rounds=None):
+	extreme_debug = False
+
+	b.activateWord(LEX, word)
+	if verbose:
+		print("Activated word: " + word)
+		print(b.area_by_name[LEX].winners)
+
+	b.applyProgram(programs.pre)
+
+	proj_map = b.getProjectMap()
+	for area in proj_map:
+		if area not in proj_map[LEX]:
+			b.area_by_name[area].fix_assembly()
+			if verbose:
+				print("FIXED assembly bc not LEX->this area in: " + area)
+		elif area != LEX:
+			b.area_by_name[area].unfix_assembly()
+			b.area_by_name[area].winners = []
+			if verbose:
+				print("ERASED assembly because LEX->this area in " + area)
+
+	proj_map = b.getProjectMap()
+	if verbose:
+		print("Got proj_map = ")
+		print(proj_map)
+
+	rounds = 0
+	while rounds < project_rounds:
+		stable = b.parse_project(check_stable=min_rounds is not None)
+		rounds += 1
+		if verbose:
+			proj_map = b.getProjectMap()
+			print("Got proj_map = ")
+			print(proj_map)
+		if extreme_debug and word == "a" and debugger:
+			print("Starting debugger after round " + str(rounds - 1) + "for word" + word)
+			debugger.run()
+		if stable and rounds >= min_rounds:
+			if verbose:
+				print("Assemblies stable after " + str(rounds) + " rounds")
+			break
+	b.rounds_used.append(rounds)
+
+# The default parse_words of a LanguagePack: parseWord for every word.
+def parseWords(b, words, pack, project_rounds, verbose=False, debugger=None,
+	debug=False, min_rounds=None):
+	for word in words:
+		parseWord(b, word, pack.lexeme_dict, project_rounds, verbose, debugger,
+			min_rounds)
+
+		if debug:
+			print("Starting debugger after the word " + word)
+			debugger.run()
+
+# Reads the parse out of the brain (this changes the brain: plasticity is
+# disabled and assemblies are unfixed and projected). Returns the
+# dependencies as [head word, dependent word, area] lists. FIBER_READOUT
+# starts from the roots areas (default: VERB).
+def readOut(b, all_areas, readout_method, readout_rules, verbose=False,
+	roots=("VERB",)):
+	# For all readout methods, unfix assemblies and remove plasticity.
+	b.disable_plasticity = True
+	for area in all_areas:
+		b.area_by_name[area].unfix_assembly()
+
+	dependencies = []
+
+	if readout_method == ReadoutMethod.FIXED_MAP_READOUT:
+		# Try "reading out" the parse.
+		# To do so, start with final assembly in VERB
+		# project VERB->SUBJ,OBJ,LEX
+		b.readOutArea(roots[0], readout_rules, dependencies)
+
+		print("Final parse dict: ")
+		print(dependencies)
+
+	if readout_method == ReadoutMethod.FIBER_READOUT:
+		activated_fibers = b.getActivatedFibers()
+		if verbose:
+			print("Got activated fibers for readout:")
+			print(activated_fibers)
+
+		for root in roots:
+			b.readOutArea(root, activated_fibers, dependencies)
+
+	return dependencies
+
+
+def splitWords(sentence):
+	return sentence.split(" ")
+
+# Everything the engine needs to know about a language; see the top of
+# this file for the hooks.
+LanguagePack = namedtuple("LanguagePack", ["name", "brain_class", "lexeme_dict",
+	"all_areas", "explicit_areas", "readout_rules", "root_area", "segment",
+	"parse_words", "finish", "project_rounds"],
+	defaults=("VERB", splitWords, parseWords, None, 20))
+
+# Registered language packs, by name.
+LANGUAGES = {}
+
+def register(pack):
+	LANGUAGES[pack.name] = pack
+	return pack
+
+def languagePack(language):
+	if isinstance(language, LanguagePack):
+		return language
+	return LANGUAGES[language]
+
+def newBrain(pack, p=0.1, LEX_k=20, seed=0, verbose=False, block_LEX=False):
+	return pack.brain_class(p, LEX_k=LEX_k, verbose=verbose, seed=seed,
+		block_LEX=block_LEX)
+
+# Reads out the dependencies of the words parsed into b, post-processed by
+# the pack's finish hook.
+def readParse(b, pack, words, readout_method=ReadoutMethod.FIBER_READOUT,
+	verbose=False, roots=None):
+	if roots is None:
+		roots = (pack.root_area,)
+	dependencies = readOut(b, pack.all_areas, readout_method,
+		pack.readout_rules, verbose, roots)
+	if pack.finish is not None and readout_method == ReadoutMethod.FIBER_READOUT:
+		dependencies = pack.finish(words, dependencies, pack)
+	return dependencies
+
+# Parses a sentence into b and returns its dependencies. b.rounds_used
+# then holds the projection rounds of every word (see parseWord).
+def parseSentence(b, sentence, language, project_rounds=None, verbose=False,
+	debug=False, readout_method=ReadoutMethod.FIBER_READOUT, min_rounds=None):
+	pack = languagePack(language)
+	if project_rounds is None:
+		project_rounds = pack.project_rounds
+	debugger = ParserDebugger(b, pack.all_areas, pack.explicit_areas)
+	words = pack.segment(sentence)
+	pack.parse_words(b, words, pack, project_rounds, verbose, debugger, debug,
+		min_rounds)
+	return readParse(b, pack, words, readout_method, verbose)
+
+def _perWordPack(language):
+	pack = languagePack(language)
+	if pack.parse_words is not parseWords:
+		raise ValueError(pack.name + " does not parse word by word")
+	return pack
+
+
+# Batch parsing.
+# parse_batch parses many sentences over a process pool and returns their
+# dependencies instead of printing them. The parser brain is built once (a
+# warm template) and every sentence is parsed on a fresh copy of it, so
+# each sentence is parsed exactly as by parse(). With shared_memory, the
+# template is published once into shared memory (see shared_brain.py) and
+# workers attach to it copy-on-write instead of holding their own copies.
+
+ParseResult = namedtuple("ParseResult", ["sentence", "dependencies", "error",
+	"rounds_used"], defaults=(None,))
+
+# Pickled template brains of this process, by (language, p, LEX_k).
+_templates = {}
+# shared_brain.SharedBrainTemplates installed in this (worker) process.
+_shared_templates = {}
+
+def warmTemplate(language="English", p=0.1, LEX_k=20):
+	pack = register(languagePack(language))
+	key = (pack.name, p, LEX_k)
+	if key not in _templates:
+		b = newBrain(pack, p, LEX_k)
+		_templates[key] = pickle.dumps(b, protocol=pickle.HIGHEST_PROTOCOL)
+	return _templates[key]
+
+def installSharedTemplate(language, p, LEX_k, template):
+	pack = register(languagePack(language))
+	_shared_templates[(pack.name, p, LEX_k)] = template
+
+def cloneTemplate(language="English", p=0.1, LEX_k=20):
+	pack = languagePack(language)
+	shared = _shared_templates.get((pack.name, p, LEX_k))
+	if shared is not None:
+		return shared.attach()
+	return pickle.loads(warmTemplate(pack, p, LEX_k))
+
+def parse_quietly(sentence, language="English", p=0.1, LEX_k=20,
+	project_rounds=None, readout_method=ReadoutMethod.FIBER_READOUT,
+	min_rounds=None):
+	pack = languagePack(language)
+	b = cloneTemplate(pack, p, LEX_k)
+	try:
+		dependencies = parseSentence(b, sentence, pack, project_rounds,
+			readout_method=readout_method, min_rounds=min_rounds)
+	except Exception as e:  # Unknown word, LEX "war of fibers", ...
+		return ParseResult(sentence, None, f"{type(e).__name__}: {e}",
+			b.rounds_used)
+	return ParseResult(sentence, dependencies, None, b.rounds_used)
+
+# Returns a ParseResult(sentence, dependencies, error, rounds_used) per
+# sentence, in order; sentences that fail to parse have dependencies=None
+# and the error message. processes=1 parses in this process; None uses one
+# per CPU.
+def parse_batch(sentences, language="English", p=0.1, LEX_k=20,
+	project_rounds=None, readout_method=ReadoutMethod.FIBER_READOUT,
+	processes=None, chunksize=1, shared_memory=True, min_rounds=None):
+	sentences = list(sentences)
+	pack = languagePack(language)
+	# Workers register the pack in their initializer; tasks then only pass
+	# its name.
+	parse_one = functools.partial(parse_quietly, language=pack.name, p=p,
+		LEX_k=LEX_k, project_rounds=project_rounds, readout_method=readout_method,
+		min_rounds=min_rounds)
+	if processes == 1 or len(sentences) <= 1:
+		parse_one = functools.partial(parse_one, language=pack)
+		return [parse_one(sentence) for sentence in sentences]
+	if not shared_memory:
+		with concurrent.futures.ProcessPoolExecutor(max_workers=processes,
+			initializer=warmTemplate, initargs=(pack, p, LEX_k)) as pool:
+			return list(pool.map(parse_one, sentences, chunksize=chunksize))
+	template = shared_brain.publish(newBrain(pack, p, LEX_k))
+	try:
+		with concurrent.futures.ProcessPoolExecutor(max_workers=processes,
+			initializer=installSharedTemplate,
+			initargs=(pack, p, LEX_k, template)) as pool:
+			return list(pool.map(parse_one, sentences, chunksize=chunksize))
+	finally:
+		template.unlink()
+
+
+# Prefix-sharing parse cache.
+# Parsing a word depends only on the brain state left by the words before
+# it, so a ParseCache keeps (pickled) snapshots of the brain after every
+# prefix it has parsed, in a trie of words per (language, p, LEX_k,
+# project_rounds, min_rounds, seed). A sentence resumes from the snapshot of its
+# longest cached prefix and only projects the remaining words; the result
+# is identical to parsing it from scratch, since the snapshots include the
+# brain's random generator. Snapshots are evicted least recently used
+# first once they take more than max_bytes.
+
+class _PrefixNode():
+	__slots__ = ("word", "parent", "children", "snapshot")
+
+	def __init__(self, word=None, parent=None):
+		self.word = word
+		self.parent = parent
+		self.children = {}
+		self.snapshot = None
+
+
+class ParseCache():
+	def __init__(self, max_bytes=256 * 2**20):
+		self.max_bytes = max_bytes
+		self.nbytes = 0
+		# Trie roots by (language, p, LEX_k, project_rounds, min_rounds, seed).
+		self.roots = {}
+		# Nodes holding a snapshot, least recently used first.
+		self.lru = OrderedDict()
+		self.words_parsed = 0
+		self.words_skipped = 0
+
+	def __len__(self):
+		return len(self.lru)
+
+	def _store(self, node, b):
+		node.snapshot = pickle.dumps(b, protocol=pickle.HIGHEST_PROTOCOL)
+		self.nbytes += len(node.snapshot)
+		self.lru[node] = None
+		while self.nbytes > self.max_bytes and self.lru:
+			self._evict(self.lru.popitem(last=False)[0])
+
+	def _evict(self, node):
+		self.nbytes -= len(node.snapshot)
+		node.snapshot = None
+		# Drop trie branches that no longer lead to any snapshot.
+		while (node.parent is not None and not node.children
+			and node.snapshot is None):
+			del node.parent.children[node.word]
+			node = node.parent
+
+	def resume(self, words, language="English", p=0.1, LEX_k=20,
+		project_rounds=20, seed=0, min_rounds=None):
+		pack = _perWordPack(language)
+		key = (pack.name, p, LEX_k, project_rounds, min_rounds, seed)
+		root = self.roots.get(key)
+		if root is None:
+			root = self.roots[key] = _PrefixNode()
+		# Walk down to the longest prefix that still has a snapshot.
+		node, best, depth, best_depth = root, root, 0, 0
+		for word in words:
+			node = node.children.get(word)
+			if node is None:
+				break
+			depth += 1
+			if node.snapshot is not None:
+				best, best_depth = node, depth
+		if best.snapshot is None:
+			b = newBrain(pack, p, LEX_k, seed)
+			self._store(root, b)
+			return b, root, 0
+		self.lru.move_to_end(best)
+		return pickle.loads(best.snapshot), best, best_depth
+
+	# Parses the words into a brain, resuming from the longest cached prefix
+	# and caching the snapshot after every new word. Returns the brain after
+	# the last word (owned by the caller; readOut may change it).
+	def parse_words(self, words, language="English", p=0.1, LEX_k=20,
+		project_rounds=20, seed=0, min_rounds=None):
+		lexeme_dict = _perWordPack(language).lexeme_dict
+		b, node, depth = self.resume(words, language, p, LEX_k, project_rounds,
+			seed, min_rounds)
+		self.words_skipped += depth
+		for word in words[depth:]:
+			parseWord(b, word, lexeme_dict, project_rounds, min_rounds=min_rounds)
+			self.words_parsed += 1
+			child = node.children.get(word)
+			if child is None:
+				child = node.children[word] = _PrefixNode(word, node)
+			node = child
+			self._store(node, b)
+		return b
+
+	def parse(self, sentence, language="English", p=0.1, LEX_k=20,
+		project_rounds=20, seed=0, readout_method=ReadoutMethod.FIBER_READOUT,
+		min_rounds=None):
+		pack = _perWordPack(language)
+		words = pack.segment(sentence)
+		b = self.parse_words(words, pack, p, LEX_k, project_rounds, seed,
+			min_rounds)
+		return readParse(b, pack, words, readout_method)
+
+
+# Incremental parsing.
+# An IncrementalParser is fed one word at a time; after each word it reads
+# out the dependencies found so far, so a caller sees partial results
+# without waiting for the sentence to end, and can stop early (feed raises
+# on unknown words and on LEX projecting into several areas):
+#
+#   parser = IncrementalParser()
+#   for word in "the big dogs chase cats".split(" "):
+#       print(word, parser.feed(word))
+#
+# The readout changes the brain, which is put back afterwards; the parser
+# brain itself only ever sees the words. Until a verb arrives the readout
+# starts from every area that no other area's activated fibers point to
+# (e.g. SUBJ after "the big dogs"), so partial results are not empty.
+
+def readoutRoots(activated_fibers, all_areas):
+	targets = set()
+	for from_area, to_areas in activated_fibers.items():
+		targets.update(to_area for to_area in to_areas if to_area != from_area)
+	return [area for area in all_areas
+		if area != LEX and activated_fibers.get(area) and area not in targets]
+
+# A readout projects with plasticity off, so it leaves the synapse weights
+# as they are; it does change the winners, support and history of the areas
+# it projects into, which assemblies are fixed and the random generator.
+# saveReadoutState records just those (and the connectome shapes, should a
+# lazy area recruit new neurons) for restoreReadoutState to put back.
+def saveReadoutState(b):
+	areas = {name: (area.winners, area.w, area._new_winners, area._new_w,
+		area.num_first_winners, area.num_rounds, area.fixed_assembly,
+		len(area.saved_w), len(area.saved_winners),
+		getattr(area, "ever_fired", None), getattr(area, "num_ever_fired", None))
+		for name, area in b.area_by_name.items()}
+	for name, area in b.area_by_name.items():
+		if area.explicit:
+			area.ever_fired = area.ever_fired.copy()
+	shapes = {key: connectome.shape for key, connectome in b.iter_connectomes()}
+	return (areas, shapes, b.disable_plasticity,
+		b._rng.bit_generator.state, b._previous_bytes_by_fiber,
+		len(b.saved_memory))
+
+def restoreReadoutState(b, state):
+	areas, shapes, disable_plasticity, rng_state, previous_bytes, num_saved_memory = state
+	for name, (winners, w, new_winners, new_w, num_first_winners, num_rounds,
+		fixed_assembly, num_saved_w, num_saved_winners, ever_fired,
+		num_ever_fired) in areas.items():
+		area = b.area_by_name[name]
+		area.winners = winners
+		area.w = w
+		area._new_winners = new_winners
+		area._new_w = new_w
+		area.num_first_winners = num_first_winners
+		area.num_rounds = num_rounds
+		area.fixed_assembly = fixed_assembly
+		area.saved_w.truncate(num_saved_w)
+		area.saved_winners.truncate(num_saved_winners)
+		if area.explicit:
+			area.ever_fired = ever_fired
+			area.num_ever_fired = num_ever_fired
+	for (kind, source, target), shape in shapes.items():
+		fibers = b.connectomes_by_stimulus if kind == "stim" else b.connectomes
+		if fibers[source][target].shape != shape:
+			fibers[source][target] = fibers[source][target][
+				tuple(slice(0, size) for size in shape)]
+	b.disable_plasticity = disable_plasticity
+	b._rng.bit_generator.state = rng_state
+	b._previous_bytes_by_fiber = previous_bytes
+	del b.saved_memory[num_saved_memory:]
+
+class IncrementalParser():
+	def __init__(self, language="English", p=0.1, LEX_k=20, project_rounds=20,
+		readout_method=ReadoutMethod.FIBER_READOUT, seed=0, verbose=False,
+		min_rounds=None):
+		self.pack = _perWordPack(language)
+		self.project_rounds = project_rounds
+		self.min_rounds = min_rounds
+		self.readout_method = readout_method
+		self.verbose = verbose
+		self.brain = newBrain(self.pack, p, LEX_k, seed)
+		self.words = []
+		self.dependencies = []
+
+	# Parses one more word and returns the dependencies of the words so far.
+	def feed(self, word):
+		parseWord(self.brain, word, self.pack.lexeme_dict,
+			self.project_rounds, self.verbose, min_rounds=self.min_rounds)
+		self.words.append(word)
+		self.dependencies = self.readOut()
+		return self.dependencies
+
+	# Reads out the words fed so far, without changing the parser brain: the
+	# readout runs on the brain itself and only the state it touches is
+	# restored afterwards (see saveReadoutState).
+	def readOut(self):
+		b = self.brain
+		state = saveReadoutState(b)
+		try:
+			roots = readoutRoots(b.getActivatedFibers(), self.pack.all_areas)
+			return readParse(b, self.pack, self.words, self.readout_method,
+				self.verbose, roots=roots)
+		finally:
+			restoreReadoutState(b, state)
+
+# Yields (word, dependencies so far) after each word of the sentence.
+def parse_incrementally(sentence, language="English", p=0.1, LEX_k=20,
+	project_rounds=20, readout_method=ReadoutMethod.FIBER_READOUT, seed=0,
+	min_rounds=None):
+	parser = IncrementalParser(language, p, LEX_k, project_rounds,
+		readout_method, seed, min_rounds=min_rounds)
+	for word in parser.pack.segment(sentence):
+		yield word, parser.feed(word)
@@ -0,0 +1,371 @@
+# Corpus evaluation of the parsers: accuracy, throughput and latency.
+#
+# Reads a corpus of sentences with gold dependencies, parses them over a
+# process pool (every sentence on a fresh copy of a warm template brain,
+# as parser_engine.parse_batch does) and reports, per language:
+# - labelled dependency precision, recall and F1 against the gold
+#   [head, dependent, area] triples, plus the sentences that failed;
+# - the sentences parsed per second of wall time;
+# - percentiles of the per-word parse latency (the projection of one
+#   word; readout is timed separately, per sentence);
+# - the peak RSS of the run.
+# The report is JSON; passing a stored report as baseline lists the
+# metrics that got worse, for comparing engine changes.
+#
+#   python parser_eval.py parser_corpus.jsonl --output eval.json
+#   python parser_eval.py parser_corpus.jsonl --min-rounds 1 --baseline eval.json
+#
+# The corpus is JSON Lines, one sentence per line (blank lines and lines
+# starting with # are skipped):
+#
+#   {"language": "English", "sentence": "dogs chase cats",
+#    "dependencies": [["chase", "dogs", "SUBJ"], ["chase", "cats", "OBJ"]]}
+
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import importlib
+import io
+import json
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+
+import parser_engine
+
+FORMAT_VERSION = 1
+
+# Modules whose language packs are registered for the evaluation; modules
+# with missing dependencies (chinese_parser needs jieba) are skipped.
+PACK_MODULES = ('parser', 'recursive_parser', 'chinese_parser')
+
+PERCENTILES = (50, 90, 99)
+
+# Metrics where larger is better, and the ones where smaller is.
+HIGHER_IS_BETTER = ('precision', 'recall', 'f1', 'sentences_per_second')
+LOWER_IS_BETTER = ('word_seconds_p50', 'word_seconds_p90', 'word_seconds_p99')
+
+
+def register_packs(modules=PACK_MODULES):
+  for module in modules:
+    try:
+      importlib.import_module(module)
+    except ImportError:
+      pass
+
+
+def load_corpus(path, language=None):
+  """Reads a corpus file.
+
+  Args:
+    path: JSON Lines file, see the top of this file.
+    language: Language of the entries that do not name one.
+
+  Returns:
+    A list of dicts with the language, sentence and gold dependencies.
+  """
+  corpus = []
+  with open(path, encoding='utf-8') as f:
+    for line_number, line in enumerate(f, 1):
+      line = line.strip()
+      if not line or line.startswith('#'):
+        continue
+      entry = json.loads(line)
+      entry.setdefault('language', language)
+      if entry['language'] is None:
+        raise ValueError(f'{path}:{line_number}: no language')
+      corpus.append(entry)
+  return corpus
+
+
+def _peak_rss_bytes(who=resource.RUSAGE_SELF):
+  peak = resource.getrusage(who).ru_maxrss
+  # Linux reports KiB, macOS bytes.
+  return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _init_worker(languages, p, LEX_k):
+  register_packs()
+  for language in languages:
+    if language in parser_engine.LANGUAGES:
+      parser_engine.warmTemplate(language, p, LEX_k)
+
+
+def parse_entry(entry, p=0.1, LEX_k=20, project_rounds=None, min_rounds=None,
+                readout_method=parser_engine.ReadoutMethod.FIBER_READOUT):
+  """Parses one corpus entry and times it.
+
+  Packs that parse word by word are timed per word; for the others (the
+  recursive parser) every word is charged the sentence's mean. Without
+  `project_rounds`, the pack's own number of rounds is used.
+
+  Returns:
+    A dict with the entry, the predicted dependencies (None on error),
+    the error, the per-word and readout seconds, the rounds used per word
+    and this process' peak RSS.
+  """
+  word_seconds = []
+  readout_seconds = None
+  rounds_used = []
+  dependencies = error = None
+  try:
+    pack = parser_engine.languagePack(entry['language'])
+    if project_rounds is None:
+      project_rounds = pack.project_rounds
+    b = parser_engine.cloneTemplate(pack, p, LEX_k)
+    rounds_used = b.rounds_used
+    words = pack.segment(entry['sentence'])
+    if pack.parse_words is parser_engine.parseWords:
+      for word in words:
+        start = time.perf_counter()
+        parser_engine.parseWord(b, word, pack.lexeme_dict, project_rounds,
+                                min_rounds=min_rounds)
+        word_seconds.append(time.perf_counter() - start)
+    else:
+      start = time.perf_counter()
+      # The clause parser narrates its progress.
+      with contextlib.redirect_stdout(io.StringIO()):
+        pack.parse_words(b, words, pack, project_rounds,
+                         min_rounds=min_rounds)
+      seconds = time.perf_counter() - start
+      word_seconds = [seconds / len(words)] * len(words)
+    start = time.perf_counter()
+    dependencies = parser_engine.readParse(b, pack, words, readout_method)
+    readout_seconds = time.perf_counter() - start
+  except Exception as e:  # Unknown word, LEX "war of fibers", ...
+    error = f'{type(e).__name__}: {e}'
+  return {
+    'language': entry['language'],
+    'sentence': entry['sentence'],
+    'gold': entry['dependencies'],
+    'predicted': dependencies,
+    'error': error,
+    'word_seconds': word_seconds,
+    'readout_seconds': readout_seconds,
+    'rounds_used': rounds_used,
+    'peak_rss_bytes': _peak_rss_bytes(),
+  }
+
+
+def score(gold, predicted):
+  """Returns (matched, num gold, num predicted) dependency triples.
+
+  Triples are matched as multisets; a failed parse predicts nothing.
+  """
+  gold = collections.Counter(map(tuple, gold))
+  predicted = collections.Counter(map(tuple, predicted or ()))
+  return sum((gold & predicted).values()), sum(gold.values()), sum(
+      predicted.values())
+
+
+def _ratio(numerator, denominator):
+  return numerator / denominator if denominator else 0.0
+
+
+def summarize(results, seconds):
+  """Aggregates parse_entry results per language and over all of them."""
+  groups = collections.defaultdict(list)
+  for result in results:
+    groups[result['language']].append(result)
+  groups['all'] = list(results)
+  summary = {}
+  for language, group in groups.items():
+    matched = num_gold = num_predicted = 0
+    for result in group:
+      m, g, p = score(result['gold'], result['predicted'])
+      matched += m
+      num_gold += g
+      num_predicted += p
+    precision = _ratio(matched, num_predicted)
+    recall = _ratio(matched, num_gold)
+    word_seconds = [s for result in group for s in result['word_seconds']]
+    readout_seconds = [result['readout_seconds'] for result in group
+                       if result['readout_seconds'] is not None]
+    stats = {
+      'sentences': len(group),
+      'failed': sum(result['error'] is not None for result in group),
+      'exact': sum(result['predicted'] is not None and
+                   score(result['gold'], result['predicted'])[0]
+                   == len(result['gold']) == len(result['predicted'])
+                   for result in group),
+      'gold_dependencies': num_gold,
+      'predicted_dependencies': num_predicted,
+      'matched_dependencies': matched,
+      'precision': precision,
+      'recall': recall,
+      'f1': _ratio(2 * precision * recall, precision + recall),
+      'words': len(word_seconds),
+      'parse_seconds': sum(word_seconds),
+      'readout_seconds': sum(readout_seconds),
+      'rounds': sum(sum(result['rounds_used']) for result in group),
+    }
+    if word_seconds:
+      for q, value in zip(PERCENTILES, np.percentile(word_seconds,
+                                                     PERCENTILES)):
+        stats[f'word_seconds_p{q}'] = float(value)
+      stats['word_seconds_max'] = max(word_seconds)
+    if language == 'all':
+      stats['wall_seconds'] = seconds
+      stats['sentences_per_second'] = _ratio(len(group), seconds)
+    summary[language] = stats
+  return summary
+
+
+def evaluate(corpus, p=0.1, LEX_k=20, project_rounds=None, min_rounds=None,
+             processes=None, chunksize=1, verbose=True):
+  """Parses a corpus and returns the JSON-serializable report.
+
+  Args:
+    corpus: Entries as returned by load_corpus.
+    project_rounds: Rounds per word for every language, or None for each
+      pack's own (the recursive parser needs more).
+    processes: Worker processes; 1 parses in this process, None uses one
+      per CPU.
+  """
+  register_packs()
+  languages = sorted({entry['language'] for entry in corpus})
+  parse_one = functools.partial(parse_entry, p=p, LEX_k=LEX_k,
+                                project_rounds=project_rounds,
+                                min_rounds=min_rounds)
+  if processes == 1:
+    _init_worker(languages, p, LEX_k)
+    start = time.perf_counter()
+    results = [parse_one(entry) for entry in corpus]
+  else:
+    # Wall time includes starting the workers and warming their templates.
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=processes, initializer=_init_worker,
+        initargs=(languages, p, LEX_k)) as pool:
+      results = list(pool.map(parse_one, corpus, chunksize=chunksize))
+  seconds = time.perf_counter() - start
+  peak_rss = max([_peak_rss_bytes(), _peak_rss_bytes(resource.RUSAGE_CHILDREN)]
+                 + [result['peak_rss_bytes'] for result in results])
+  if verbose:
+    for result in results:
+      status = result['error'] or result['predicted']
+      print(f"{result['language']:<10} {result['sentence']}: {status}")
+  summary = summarize(results, seconds)
+  summary['all']['peak_rss_bytes'] = peak_rss
+  return {
+    'version': FORMAT_VERSION,
+    'meta': {
+      'python': platform.python_version(),
+      'numpy': np.__version__,
+      'platform': platform.platform(),
+      'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+      'processes': processes,
+      'p': p,
+      'LEX_k': LEX_k,
+      'project_rounds': project_rounds,
+      'min_rounds': min_rounds,
+    },
+    'summary': summary,
+    'sentences': results,
+  }
+
+
+def compare(report, baseline, tolerance=0.2):
+  """Lists the metrics that got worse than in a baseline report.
+
+  Accuracy metrics count as worse on any drop; throughput and latency only
+  beyond a relative `tolerance`. Languages missing from either side are
+  ignored.
+
+  Returns:
+    (language, metric, baseline value, new value) for every regression.
+  """
+  regressions = []
+  for language, stats in report['summary'].items():
+    old = baseline['summary'].get(language)
+    if old is None:
+      continue
+    for metric in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+      if metric not in stats or metric not in old:
+        continue
+      new_value, old_value = stats[metric], old[metric]
+      if metric in ('precision', 'recall', 'f1'):
+        worse = new_value < old_value - 1e-9
+      elif metric in HIGHER_IS_BETTER:
+        worse = new_value < old_value * (1 - tolerance)
+      else:
+        worse = new_value > old_value * (1 + tolerance)
+      if worse:
+        regressions.append((language, metric, old_value, new_value))
+  return regressions
+
+
+def report_text(report):
+  """Formats the summary of a report as a table."""
+  columns = ('sentences', 'failed', 'precision', 'recall', 'f1',
+             'word_seconds_p50', 'word_seconds_p90', 'word_seconds_p99')
+  lines = [f"{'language':<20} " + ' '.join(f'{c:>16}' for c in columns)]
+  for language, stats in report['summary'].items():
+    cells = []
+    for column in columns:
+      value = stats.get(column)
+      if value is None:
+        cells.append(f"{'':>16}")
+      elif isinstance(value, int):
+        cells.append(f'{value:>16}')
+      else:
+        cells.append(f'{value:>16.4f}')
+    lines.append(f'{language:<20} ' + ' '.join(cells))
+  total = report['summary']['all']
+  lines.append(f"{total['sentences_per_second']:.2f} sentences/s, "
+               f"peak RSS {total['peak_rss_bytes'] / 2**20:.1f} MiB")
+  return '\n'.join(lines)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+      description='Evaluates the parsers on a corpus with gold '
+                  'dependencies.')
+  parser.add_argument('corpus', help='JSON Lines corpus file')
+  parser.add_argument('--language',
+                      help='language of entries that do not name one')
+  parser.add_argument('--output', help='write the report to this JSON file')
+  parser.add_argument('--baseline', help='compare against this JSON report')
+  parser.add_argument('--tolerance', type=float, default=0.2,
+                      help='allowed relative throughput / latency '
+                           'regression (default 0.2)')
+  parser.add_argument('--processes', type=int,
+                      help='worker processes (default: one per CPU)')
+  parser.add_argument('--p', type=float, default=0.1)
+  parser.add_argument('--LEX-k', type=int, default=20)
+  parser.add_argument('--project-rounds', type=int,
+                      help="rounds per word (default: each language's own)")
+  parser.add_argument('--min-rounds', type=int,
+                      help='stop projecting a word once its parse settles, '
+                           'after at least this many rounds')
+  parser.add_argument('--quiet', action='store_true',
+                      help='do not print every parse')
+  args = parser.parse_args(argv)
+
+  corpus = load_corpus(args.corpus, args.language)
+  report = evaluate(corpus, args.p, args.LEX_k, args.project_rounds,
+                    args.min_rounds, processes=args.processes,
+                    verbose=not args.quiet)
+  if args.output:
+    with open(args.output, 'w', encoding='utf-8') as f:
+      json.dump(report, f, indent=1, ensure_ascii=False)
+  print(report_text(report))
+  if args.baseline:
+    with open(args.baseline, encoding='utf-8') as f:
+      baseline = json.load(f)
+    regressions = compare(report, baseline, args.tolerance)
+    for language, metric, old, new in regressions:
+      print(f'REGRESSION {language} {metric}: {old:.4g} -> {new:.4g}')
+    if regressions:
+      return 1
+    print('No regressions against ' + args.baseline)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
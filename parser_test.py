@@ -0,0 +1,239 @@
+#! /usr/bin/python
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import lexicon
+import parser
+import parser_engine
+import parser_eval
+import recursive_parser
+import shared_brain
+
+
+def parse_silently(sentence, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return parser.parse(sentence, **kwargs)
+
+
+class TestBatchParsing(unittest.TestCase):
+    def test_batch_matches_parse(self):
+        sentences = ["dogs chase cats", "cats are bad", "cats zebra"]
+        results = parser.parse_batch(sentences, processes=2)
+        self.assertEqual([r.sentence for r in results], sentences)
+        for result in results[:2]:
+            self.assertIsNone(result.error)
+            self.assertEqual(result.dependencies,
+                             parse_silently(result.sentence))
+        self.assertIsNone(results[2].dependencies)
+        self.assertIn("zebra", results[2].error)
+
+    def test_attached_parse_copies_few_pages(self):
+        pack = parser_engine.languagePack("English")
+        template = shared_brain.publish(parser_engine.newBrain(pack))
+        try:
+            b = template.attach()
+            with contextlib.redirect_stdout(io.StringIO()):
+                dependencies = parser_engine.parseSentence(
+                    b, "cats chase mice", pack, 20)
+            stats = b.paging_stats()
+            del b
+        finally:
+            template.unlink()
+        self.assertEqual(dependencies, parse_silently("cats chase mice"))
+        if stats['private_page_bytes'] is None:
+            self.skipTest("private pages are not reported here")
+        self.assertEqual(stats['bytes_copied_on_write'], 0)
+        self.assertGreater(stats['private_page_bytes'], 0)
+        self.assertLess(stats['private_page_bytes'], template.nbytes / 4)
+
+
+class TestParseCache(unittest.TestCase):
+    def test_cached_parse_matches_parse(self):
+        cache = parser.ParseCache()
+        for sentence in ["cats chase dogs", "cats chase mice", "cats chase dogs"]:
+            self.assertEqual(cache.parse(sentence), parse_silently(sentence))
+        # "cats chase" is parsed once; the repeated sentence not at all.
+        self.assertEqual(cache.words_parsed, 4)
+        self.assertEqual(cache.words_skipped, 5)
+
+    def test_eviction_keeps_under_max_bytes(self):
+        cache = parser.ParseCache()
+        cache.parse_words(["cats", "chase"])
+        snapshot_bytes = cache.nbytes
+        cache = parser.ParseCache(max_bytes=snapshot_bytes)
+        cache.parse_words(["cats", "chase", "dogs"])
+        self.assertLessEqual(cache.nbytes, snapshot_bytes)
+        self.assertLess(len(cache), 4)
+        # The longest prefixes were used last and are kept.
+        _, _, depth = cache.resume(["cats", "chase", "dogs"])
+        self.assertEqual(depth, 3)
+
+
+class TestIncrementalParsing(unittest.TestCase):
+    def test_partial_results_end_in_full_parse(self):
+        sentence = "the big dogs chase cats"
+        steps = list(parser.parse_incrementally(sentence))
+        self.assertEqual([word for word, _ in steps], sentence.split(" "))
+        self.assertEqual(steps[0][1], [])
+        # The subject's dependents are known before the verb.
+        self.assertIn(["dogs", "big", "ADJ"], steps[2][1])
+        self.assertEqual(steps[-1][1], parse_silently(sentence))
+
+    def test_unknown_word_stops_parse(self):
+        incremental = parser.IncrementalParser()
+        incremental.feed("cats")
+        with self.assertRaises(KeyError):
+            incremental.feed("zebra")
+        self.assertEqual(incremental.words, ["cats"])
+
+
+class TestProjectMap(unittest.TestCase):
+    def test_cached_map_follows_rules_and_winners(self):
+        b = parser.EnglishParserBrain(0.1)
+        b.activateWord(parser.LEX, "dogs")
+        self.assertEqual(b.getProjectMap(), {})
+        for rule in parser.LEXEME_DICT["dogs"]["PRE_RULES"]:
+            b.applyRule(rule)
+        projected = {parser.LEX: {parser.LEX, parser.SUBJ}}
+        proj_map = b.getProjectMap()
+        self.assertEqual(proj_map, projected)
+        # Callers may modify the map they get.
+        proj_map[parser.LEX].add(parser.OBJ)
+        self.assertEqual(b.getProjectMap(), projected)
+        b.applyRule(parser.AreaRule(parser.INHIBIT, parser.SUBJ, 1))
+        self.assertEqual(b.area_states[parser.SUBJ], 0b10)
+        self.assertEqual(b.getProjectMap(), {})
+        b.applyRule(parser.AreaRule(parser.DISINHIBIT, parser.SUBJ, 1))
+        self.assertEqual(b.getProjectMap(), projected)
+        b.area_by_name[parser.LEX].winners = []
+        self.assertEqual(b.getProjectMap(), {})
+
+
+class TestAdaptiveRounds(unittest.TestCase):
+    def test_early_stop_keeps_parse(self):
+        sentence = "the big dogs chase cats"
+        fixed = parser.parse_quietly(sentence)
+        adaptive = parser.parse_quietly(sentence, min_rounds=2)
+        self.assertEqual(fixed.rounds_used, [20] * 5)
+        self.assertEqual(adaptive.dependencies, fixed.dependencies)
+        self.assertEqual(len(adaptive.rounds_used), 5)
+        self.assertTrue(all(2 <= r <= 20 for r in adaptive.rounds_used))
+        self.assertLess(sum(adaptive.rounds_used), sum(fixed.rounds_used))
+
+
+class TestCorpusEvaluation(unittest.TestCase):
+    def test_scores_against_gold(self):
+        entries = [
+            {"sentence": "dogs chase cats",
+             "dependencies": [["chase", "dogs", "SUBJ"],
+                              ["chase", "cats", "OBJ"],
+                              ["cats", "the", "DET"]]},
+            {"sentence": "cats zebra", "dependencies": [["zebra", "cats", "SUBJ"]]},
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "corpus.jsonl")
+            with open(path, "w") as f:
+                f.write("# comment\n\n")
+                f.write("\n".join(json.dumps(e) for e in entries))
+            corpus = parser_eval.load_corpus(path, language="English")
+        report = parser_eval.evaluate(corpus, processes=1, verbose=False)
+        stats = report["summary"]["English"]
+        self.assertEqual(stats["sentences"], 2)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["matched_dependencies"], 2)
+        self.assertEqual(stats["precision"], 1.0)
+        self.assertEqual(stats["recall"], 0.5)
+        # "cats" is parsed before "zebra" fails.
+        self.assertEqual(stats["words"], 4)
+        self.assertIn("zebra", report["sentences"][1]["error"])
+        self.assertEqual(parser_eval.compare(report, report), [])
+        json.dumps(report)
+
+    def test_uses_the_pack_project_rounds(self):
+        sentence = "the dogs that bite cats , run"
+        pack = recursive_parser.LANGUAGES["English"]
+        self.assertEqual(pack.project_rounds, 30)
+        result = parser_eval.parse_entry(
+            {"language": pack.name, "sentence": sentence, "dependencies": []})
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = recursive_parser.parse(sentence)
+        self.assertIsNone(result["error"])
+        self.assertEqual(result["predicted"], expected)
+
+
+class TestParserEngine(unittest.TestCase):
+    def test_parse_sentence_by_language_name(self):
+        b = parser_engine.newBrain(parser_engine.languagePack("English"))
+        self.assertEqual(
+            parser_engine.parseSentence(b, "dogs chase cats", "English"),
+            parse_silently("dogs chase cats"))
+
+    def test_clause_pack_is_not_parsed_per_word(self):
+        pack = recursive_parser.LANGUAGES["English"]
+        self.assertIs(parser_engine.languagePack(pack.name), pack)
+        with self.assertRaises(ValueError):
+            parser_engine.IncrementalParser(pack.name)
+
+    def test_block_LEX_allocates_parsed_words_only(self):
+        pack = parser_engine.languagePack("English")
+        b = parser_engine.newBrain(pack, block_LEX=True)
+        self.assertEqual(b.area_by_name[parser.LEX].n, 0)
+        self.assertEqual(
+            parser_engine.parseSentence(b, "the dogs chase cats", pack),
+            parse_silently("the dogs chase cats"))
+        self.assertEqual(b.area_by_name[parser.LEX].n, 4 * 20)
+        eager = parser_engine.newBrain(pack)
+        self.assertGreater(eager.connectomes[parser.LEX][parser.LEX].nbytes,
+                           b.connectomes[parser.LEX][parser.LEX].nbytes * 20)
+
+        def LEX_bytes():
+            return sum(connectome.nbytes
+                       for fiber, connectome in b.iter_connectomes()
+                       if parser.LEX in fiber[1:])
+
+        # Every further word adds the same number of bytes.
+        growth = []
+        for word in parser.LEXEME_DICT:
+            before = LEX_bytes()
+            b.activateWord(parser.LEX, word)
+            if LEX_bytes() != before:
+                growth.append(LEX_bytes() - before)
+        self.assertGreater(len(growth), 10)
+        self.assertEqual(set(growth), {growth[0]})
+
+
+class TestCompiledLexicon(unittest.TestCase):
+    def test_later_rules_win(self):
+        program = lexicon.compile_rules([
+            parser.AreaRule(parser.INHIBIT, parser.SUBJ, 0),
+            parser.AreaRule(parser.INHIBIT, parser.SUBJ, 1),
+            parser.AreaRule(parser.DISINHIBIT, parser.SUBJ, 0),
+            parser.FiberRule(parser.DISINHIBIT, parser.LEX, parser.OBJ, 1),
+        ])
+        b = parser.EnglishParserBrain(0.1)
+        b.applyProgram(program)
+        self.assertEqual(b.area_states[parser.SUBJ], 0b10)
+        self.assertEqual(b.fiber_states[parser.LEX][parser.OBJ], 0b01)
+        self.assertEqual(b.fiber_states[parser.OBJ][parser.LEX], 0b01)
+
+    def test_programs_match_rules(self):
+        programs = lexicon.compile_lexicon(parser.LEXEME_DICT)
+        self.assertIs(programs, lexicon.compile_lexicon(parser.LEXEME_DICT))
+        for word, lexeme in parser.LEXEME_DICT.items():
+            by_rules = parser.EnglishParserBrain(0.1)
+            by_program = parser.EnglishParserBrain(0.1)
+            for rule in lexeme["PRE_RULES"] + lexeme["POST_RULES"]:
+                by_rules.applyRule(rule)
+            by_program.applyProgram(programs[word].pre)
+            by_program.applyProgram(programs[word].post)
+            self.assertEqual(by_rules.area_states, by_program.area_states)
+            self.assertEqual(by_rules.fiber_states, by_program.fiber_states)
+
+
+if __name__ == '__main__':
+    unittest.main()
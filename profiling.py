@@ -0,0 +1,97 @@
+# Low-overhead per-phase timing of `brain.Brain.project_into`.
+#
+# A Brain created with `profile=True` (or after `brain.enable_profiling()`)
+# records wall time and call counts for every phase of a projection step,
+# broken down by target area and by fiber (the stimulus or source area the
+# work was done for). A brain without a profiler only pays one `is not None`
+# test per phase.
+#
+#   b = brain.Brain(0.01, profile=True)
+#   ... b.project(...) ...
+#   print(b.profile_report())
+
+import collections
+import time
+
+# Phases of project_into, in execution order.
+INPUTS = 'inputs'                      # summing synaptic input of prev. support
+SAMPLING = 'sampling'                  # binom.ppf threshold + truncnorm draw
+TOP_K = 'top_k'                        # selecting the k winners
+FIRST_WINNERS = 'first_winners'        # splitting first winners' input by fiber
+STIMULUS_PLASTICITY = 'stimulus_plasticity'  # growing + updating stim->target
+STIMULUS_EXPANSION = 'stimulus_expansion'    # growing non-firing stim->target
+AREA_PLASTICITY = 'area_plasticity'    # growing + updating source->target
+AREA_EXPANSION = 'area_expansion'      # growing other->target, target->other
+PHASES = (INPUTS, SAMPLING, TOP_K, FIRST_WINNERS, STIMULUS_PLASTICITY,
+          STIMULUS_EXPANSION, AREA_PLASTICITY, AREA_EXPANSION)
+
+PhaseStats = collections.namedtuple('PhaseStats', ['calls', 'seconds'])
+
+
+class PhaseProfiler:
+  """Accumulates (calls, seconds) per (phase, target area, fiber).
+
+  `fiber` is the stimulus or area name the phase worked on, or None for
+  phases that concern the target area as a whole.
+  """
+
+  clock = staticmethod(time.perf_counter)
+
+  def __init__(self):
+    self._entries = {}
+
+  def lap(self, phase, target, fiber, start):
+    """Charges the time since `start` to a phase; returns the current time.
+
+    Laps chain: pass the returned time as `start` of the next phase.
+    """
+    now = time.perf_counter()
+    entry = self._entries.get((phase, target, fiber))
+    if entry is None:
+      self._entries[(phase, target, fiber)] = entry = [0, 0.0]
+    entry[0] += 1
+    entry[1] += now - start
+    return now
+
+  def reset(self):
+    self._entries.clear()
+
+  def stats(self):
+    """Returns {(phase, target, fiber): PhaseStats}."""
+    return {key: PhaseStats(calls, seconds)
+            for key, (calls, seconds) in self._entries.items()}
+
+  def totals(self, by='phase'):
+    """Sums the stats over everything but `by` ('phase', 'target', 'fiber')."""
+    position = {'phase': 0, 'target': 1, 'fiber': 2}[by]
+    calls = collections.Counter()
+    seconds = collections.Counter()
+    for key, (num_calls, num_seconds) in self._entries.items():
+      calls[key[position]] += num_calls
+      seconds[key[position]] += num_seconds
+    return {name: PhaseStats(calls[name], seconds[name]) for name in calls}
+
+  def report(self):
+    """Formats the stats as a table, phases in execution order."""
+    if not self._entries:
+      return 'No projections profiled.'
+    total = sum(seconds for _, seconds in self._entries.values()) or 1.0
+    order = {phase: i for i, phase in enumerate(PHASES)}
+    rows = sorted(self._entries.items(),
+                  key=lambda item: (order.get(item[0][0], len(order)),
+                                    str(item[0][1]), str(item[0][2])))
+    lines = [f"{'phase':<20} {'target':<12} {'fiber':<12} {'calls':>8} "
+             f"{'total ms':>10} {'mean us':>10} {'share':>7}"]
+    for (phase, target, fiber), (calls, seconds) in rows:
+      lines.append(
+          f"{phase:<20} {str(target):<12} {'-' if fiber is None else str(fiber):<12} "
+          f"{calls:>8} {seconds * 1e3:>10.2f} {seconds / calls * 1e6:>10.1f} "
+          f"{seconds / total:>7.1%}")
+    lines.append('')
+    for phase, (calls, seconds) in sorted(
+        self.totals('phase').items(),
+        key=lambda item: order.get(item[0], len(order))):
+      lines.append(f"{phase:<20} {'(all)':<12} {'':<12} {calls:>8} "
+                   f"{seconds * 1e3:>10.2f} {seconds / calls * 1e6:>10.1f} "
+                   f"{seconds / total:>7.1%}")
+    return '\n'.join(lines)
@@ -0,0 +1,291 @@
+# Scaling study: how Brain cost grows with n, k, p, areas and rounds.
+#
+# Runs the core operations of benchmarks.py over geometric grids of sizes
+# (one parameter at a time around a base configuration), and for every run
+# records wall time, peak RSS, live connectome bytes, final support size w
+# and the per-phase time of project_into (see profiling.py). It then fits
+# an empirical exponent e in cost ~ size^e for every metric and phase, and
+# flags super-linear curves together with the phase that grows fastest,
+# i.e. the operation responsible for it.
+#
+#   python scaling.py --quick
+#   python scaling.py --operations projection --output scaling.json
+#
+# Every case runs in its own (forked) process, so peak RSS is per case.
+
+import argparse
+import concurrent.futures
+import json
+import math
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+
+import benchmarks
+import brain
+import profiling
+
+
+def geometric(start, ratio, num):
+  """`num` sizes start, start * ratio, ..., rounded to integers if start is."""
+  values = [start * ratio ** i for i in range(num)]
+  if isinstance(start, int):
+    return [int(round(v)) for v in values]
+  return values
+
+
+SCALES = {
+  'n': geometric(10000, 2, 5),
+  'k': geometric(50, 2, 4),
+  'p': geometric(0.005, 2, 4),
+  'num_areas': geometric(1, 2, 4),
+  'rounds': geometric(5, 2, 4),
+}
+QUICK_SCALES = {
+  'n': geometric(3000, 2, 3),
+  'k': geometric(20, 2, 3),
+  'p': geometric(0.01, 2, 3),
+  'num_areas': geometric(1, 2, 3),
+  'rounds': geometric(5, 2, 3),
+}
+
+# What each phase of project_into does, for the report.
+PHASE_CAUSES = {
+  profiling.INPUTS: 'summing the connectome rows of every source winner',
+  profiling.SAMPLING: 'binom.ppf threshold and truncnorm candidate draw',
+  profiling.TOP_K: 'heapq.nlargest over support + candidates',
+  profiling.FIRST_WINNERS:
+      'per-first-winner rng.choice loop splitting inputs by fiber',
+  profiling.STIMULUS_PLASTICITY: 'per-winner stimulus plasticity loop',
+  profiling.STIMULUS_EXPANSION: 'growing non-firing stimulus vectors',
+  profiling.AREA_PLASTICITY:
+      'per-first-winner column fill + winner x source-winner plasticity loop',
+  profiling.AREA_EXPANSION:
+      'resizing (np.pad-style copy) and Bernoulli-filling every other fiber',
+}
+
+# Exponents above this count as super-linear.
+SUPERLINEAR = 1.15
+
+
+def _peak_rss_bytes():
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports KiB, macOS bytes.
+  return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(operation, params, seed=0):
+  """Runs one case in this process and returns its measurements.
+
+  Every Brain the operation creates is profiled; connectome bytes and w
+  are those of the largest brain at the end of the run.
+  """
+  brains = []
+
+  def brain_factory(*args, **kwargs):
+    b = brain.Brain(*args, profile=True, **kwargs)
+    brains.append(b)
+    return b
+
+  function, _ = benchmarks.OPERATIONS[operation]
+  benchmarks._seed(seed)
+  rss_before = _peak_rss_bytes()
+  start = time.perf_counter()
+  function(brain_factory=brain_factory, **params)
+  seconds = time.perf_counter() - start
+  phases = {phase: 0.0 for phase in profiling.PHASES}
+  connectome_bytes = final_w = 0
+  for b in brains:
+    for phase, stats in b._profiler.totals('phase').items():
+      phases[phase] += stats.seconds
+    live, _ = b.connectome_nbytes()
+    connectome_bytes = max(connectome_bytes, live)
+    final_w = max(final_w, sum(area.w for area in b.area_by_name.values()))
+  peak_rss = _peak_rss_bytes()
+  return {
+    'operation': operation,
+    'params': params,
+    'seconds': seconds,
+    'peak_rss_bytes': peak_rss,
+    'rss_growth_bytes': peak_rss - rss_before,
+    'connectome_bytes': connectome_bytes,
+    'final_w': final_w,
+    'phase_seconds': phases,
+  }
+
+
+def _measure_isolated(operation, params, seed):
+  method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+  with concurrent.futures.ProcessPoolExecutor(
+      max_workers=1, mp_context=multiprocessing.get_context(method)) as pool:
+    return pool.submit(measure, operation, params, seed).result()
+
+
+def fit_exponent(sizes, values):
+  """Least-squares slope of log(value) against log(size), or nan."""
+  sizes = np.asarray(sizes, dtype=float)
+  values = np.asarray(values, dtype=float)
+  keep = (sizes > 0) & (values > 0)
+  if keep.sum() < 2 or len(np.unique(sizes[keep])) < 2:
+    return math.nan
+  slope, _ = np.polyfit(np.log(sizes[keep]), np.log(values[keep]), 1)
+  return float(slope)
+
+
+METRICS = ('seconds', 'rss_growth_bytes', 'connectome_bytes', 'final_w')
+
+
+def fit(results):
+  """Fits exponents per (operation, parameter) curve.
+
+  Returns:
+    A list of dicts with the operation, the varied parameter, the sizes
+    and the exponent of every metric and of every phase's time.
+  """
+  curves = {}
+  for result in results:
+    curves.setdefault((result['operation'], result['parameter']),
+                      []).append(result)
+  fits = []
+  for (operation, parameter), curve in curves.items():
+    sizes = [r['params'][parameter] for r in curve]
+    exponents = {metric: fit_exponent(sizes, [r[metric] for r in curve])
+                 for metric in METRICS}
+    phase_exponents = {
+      phase: fit_exponent(sizes, [r['phase_seconds'][phase] for r in curve])
+      for phase in profiling.PHASES}
+    # Share of each phase in the largest case, to ignore negligible ones.
+    largest = curve[int(np.argmax(sizes))]
+    total = sum(largest['phase_seconds'].values()) or 1.0
+    phase_shares = {phase: largest['phase_seconds'][phase] / total
+                    for phase in profiling.PHASES}
+    fits.append({
+      'operation': operation,
+      'parameter': parameter,
+      'sizes': sizes,
+      'exponents': exponents,
+      'phase_exponents': phase_exponents,
+      'phase_shares': phase_shares,
+    })
+  return fits
+
+
+def diagnose(fits, threshold=SUPERLINEAR, min_share=0.05):
+  """Flags super-linear time curves and the phase responsible.
+
+  The responsible phase is the fastest-growing one among those taking at
+  least `min_share` of the projection time at the largest size.
+  """
+  flags = []
+  for f in fits:
+    exponent = f['exponents']['seconds']
+    if math.isnan(exponent) or exponent <= threshold:
+      continue
+    candidates = [(e, phase) for phase, e in f['phase_exponents'].items()
+                  if not math.isnan(e) and f['phase_shares'][phase] >= min_share]
+    phase = max(candidates)[1] if candidates else None
+    flags.append({
+      'operation': f['operation'],
+      'parameter': f['parameter'],
+      'exponent': exponent,
+      'phase': phase,
+      'phase_exponent': f['phase_exponents'][phase] if phase else None,
+      'phase_share': f['phase_shares'][phase] if phase else None,
+      'cause': PHASE_CAUSES.get(phase),
+    })
+  return flags
+
+
+def study(operations=None, quick=False, scales=None, base_params=None,
+          seed=0, isolate=True, verbose=True):
+  """Runs the scaling study; returns JSON-serializable results."""
+  base_params = base_params or (
+      benchmarks.QUICK_BASE_PARAMS if quick else benchmarks.BASE_PARAMS)
+  scales = scales or (QUICK_SCALES if quick else SCALES)
+  results = []
+  for operation in operations or benchmarks.OPERATIONS:
+    _, takes_num_areas = benchmarks.OPERATIONS[operation]
+    for parameter, sizes in scales.items():
+      if parameter == 'num_areas' and not takes_num_areas:
+        continue
+      for size in sizes:
+        params = dict(base_params, **{parameter: size})
+        if isolate:
+          result = _measure_isolated(operation, params, seed)
+        else:
+          result = measure(operation, params, seed)
+        result['parameter'] = parameter
+        if verbose:
+          print(f"{operation:<22} {parameter}={size:<10} "
+                f"{result['seconds']:8.3f}s "
+                f"{result['connectome_bytes'] / 2**20:8.1f} MiB conn "
+                f"w={result['final_w']}")
+        results.append(result)
+  fits = fit(results)
+  return {
+    'meta': {
+      'python': platform.python_version(),
+      'numpy': np.__version__,
+      'platform': platform.platform(),
+      'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+      'quick': quick,
+      'base_params': base_params,
+    },
+    'results': results,
+    'fits': fits,
+    'flags': diagnose(fits),
+  }
+
+
+def report(results):
+  """Formats the fitted exponents and flags of a study as text."""
+  lines = [f"{'operation':<22} {'parameter':<10} "
+           + ' '.join(f'{metric:>17}' for metric in METRICS)]
+  for f in results['fits']:
+    lines.append(f"{f['operation']:<22} {f['parameter']:<10} "
+                 + ' '.join(f"{f['exponents'][metric]:>17.2f}"
+                            for metric in METRICS))
+  lines.append('')
+  if not results['flags']:
+    lines.append('No super-linear time growth.')
+  for flag in results['flags']:
+    line = (f"SUPER-LINEAR {flag['operation']} in {flag['parameter']}: "
+            f"time ~ {flag['parameter']}^{flag['exponent']:.2f}")
+    if flag['phase']:
+      line += (f"; fastest-growing phase {flag['phase']} "
+               f"(^{flag['phase_exponent']:.2f}, "
+               f"{flag['phase_share']:.0%} of time): {flag['cause']}")
+    lines.append(line)
+  return '\n'.join(lines)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+      description='Measures how Brain cost scales with n, k, p, areas and '
+                  'rounds.')
+  parser.add_argument('--output', help='write results to this JSON file')
+  parser.add_argument('--operations', nargs='+',
+                      choices=sorted(benchmarks.OPERATIONS),
+                      help='only run these operations')
+  parser.add_argument('--quick', action='store_true',
+                      help='small sizes (a smoke run)')
+  parser.add_argument('--no-isolate', action='store_true',
+                      help='run all cases in this process (peak RSS is then '
+                           'cumulative)')
+  args = parser.parse_args(argv)
+
+  results = study(args.operations, quick=args.quick,
+                  isolate=not args.no_isolate)
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(results, f, indent=1)
+  print(report(results))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
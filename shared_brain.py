@@ -0,0 +1,153 @@
+# Read-only brain templates in shared memory, for multi-process workers.
+#
+# publish() copies every connectome of a constructed brain (a ParserBrain,
+# LearnBrain, ...) into one multiprocessing.shared_memory block and pickles
+# the rest of it (areas, stimuli, parser state, rng). The returned template
+# is small and picklable; attach() in any process maps the block and
+# returns a brain whose connectomes are read-only views into it, so N
+# workers share one template's worth of connectome memory:
+#
+#   template = shared_brain.publish(parser.EnglishParserBrain(0.1))
+#   # in each worker (e.g. passed through a pool initializer):
+#   b = template.attach()      # zero-copy; parse / project as usual
+#   # in the publishing process, once the workers are done:
+#   template.unlink()
+#
+# Attached brains map the block copy-on-write (on POSIX) and use a
+# connectome_store.CopyOnWriteStore: only the pages a projection writes to
+# (the rows around the winners) and the connectomes it grows are copied
+# into the worker's private memory; b.paging_stats() reports how much.
+# Everything a worker never writes to stays shared.
+
+import copy
+import mmap
+import pickle
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import connectome_store
+
+# Byte alignment of every connectome in the shared block.
+_ALIGNMENT = 64
+
+
+def _private_mapping(shm, nbytes):
+  """Maps the block copy-on-write (MAP_PRIVATE), or returns None.
+
+  Needs the block's file descriptor, which POSIX shared memory has.
+  """
+  fd = getattr(shm, '_fd', -1)
+  if fd < 0 or nbytes == 0:
+    return None
+  return mmap.mmap(fd, nbytes, access=mmap.ACCESS_COPY)
+
+
+def _set_connectome(b, key, array):
+  kind, source, target = key
+  if kind == 'stim':
+    b.connectomes_by_stimulus.setdefault(source, {})[target] = array
+  else:
+    b.connectomes.setdefault(source, {})[target] = array
+
+
+def _skeleton(b):
+  """Pickles `b` without its connectomes (and without live callbacks)."""
+  shallow = copy.copy(b)
+  shallow.connectomes = {name: {} for name in b.connectomes}
+  shallow.connectomes_by_stimulus = {
+    name: {} for name in b.connectomes_by_stimulus}
+  shallow._store = None
+  shallow._observers = []
+  return pickle.dumps(shallow, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class SharedBrainTemplate:
+  """Handle of a brain published into shared memory.
+
+  Attributes:
+    name: Name of the shared memory block.
+    nbytes: Size of the block (all connectomes, aligned).
+    layout: (fiber key, byte offset, shape, dtype) of every connectome.
+  """
+
+  def __init__(self, name, nbytes, layout, skeleton, shm=None):
+    self.name = name
+    self.nbytes = nbytes
+    self.layout = layout
+    self._skeleton = skeleton
+    # This process' mapping of the block, opened on first attach().
+    self._shm = shm
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['_shm'] = None
+    return state
+
+  def _mapping(self):
+    if self._shm is None:
+      self._shm = shared_memory.SharedMemory(name=self.name)
+    return self._shm
+
+  def attach(self):
+    """Returns a new brain backed by the shared connectomes.
+
+    Where possible the brain gets its own copy-on-write mapping of the
+    block, so the pages it writes to are copied and the rest stay shared;
+    otherwise its connectomes are read-only views, copied whole on first
+    write (see connectome_store.CopyOnWriteStore).
+    """
+    b = pickle.loads(self._skeleton)
+    mapping = _private_mapping(self._mapping(), self.nbytes)
+    if mapping is not None:
+      buffer = np.frombuffer(mapping, dtype=np.uint8)
+      b._store = connectome_store.CopyOnWriteStore(
+          private_region=(buffer.ctypes.data, buffer.nbytes))
+    else:
+      buffer = np.frombuffer(self._mapping().buf, dtype=np.uint8)
+      b._store = connectome_store.CopyOnWriteStore()
+    for key, offset, shape, dtype in self.layout:
+      if 0 in shape:
+        array = np.zeros(shape, dtype=dtype)
+      else:
+        array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+        if mapping is None:
+          array.flags.writeable = False
+      _set_connectome(b, key, array)
+    return b
+
+  def close(self):
+    """Unmaps the block in this process.
+
+    Brains attached in this process must be dropped first; their
+    connectomes are views into the mapping.
+    """
+    if self._shm is not None:
+      self._shm.close()
+      self._shm = None
+
+  def unlink(self):
+    """Frees the block (once every process has closed its mapping)."""
+    self._mapping().unlink()
+    self.close()
+
+
+def publish(b):
+  """Copies a brain into shared memory and returns its template handle.
+
+  `b` itself is not modified and stays independent of the template.
+  """
+  layout = []
+  nbytes = 0
+  arrays = []
+  for key, connectome in b.iter_connectomes():
+    array = np.ascontiguousarray(connectome)
+    layout.append((key, nbytes, array.shape, array.dtype.str))
+    arrays.append(array)
+    nbytes += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+  shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+  for (_, offset, shape, dtype), array in zip(layout, arrays):
+    if array.size:
+      np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = (
+          array)
+  return SharedBrainTemplate(shm.name, nbytes, layout, _skeleton(b), shm=shm)
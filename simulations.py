@@ -10,8 +10,13 @@
 
 import brain
 import brain_util as bu
+import checkpoint
+import connectivity
+import observers
 import numpy as np
+import os
 import random
+import sweep
 import copy
 import pickle
 import matplotlib.pyplot as plt
@@ -19,23 +24,50 @@ import matplotlib.pyplot as plt
 from collections import OrderedDict
 
 
-def project_sim(n=1000000,k=1000,p=0.01,beta=0.05,t=50):
-	b = brain.Brain(p)
+# connectome_dir: scratch directory for memory-mapped connectomes (for very
+# large n), see brain.Brain.
+# checkpoint_dir: write incremental checkpoints there every checkpoint_every
+# rounds; an interrupted run resumes from the last one (see checkpoint.py).
+# brain_factory: called like brain.Brain to build the brain, e.g. to
+# configure or keep hold of it (see scaling.py); the simulations that
+# benchmarks.py runs all take one.
+def project_sim(n=1000000,k=1000,p=0.01,beta=0.05,t=50,connectome_dir=None,
+	checkpoint_dir=None,checkpoint_every=10,seed=0,brain_factory=brain.Brain):
+	b = brain_factory(p,connectome_dir=connectome_dir,seed=seed)
 	b.add_stimulus("stim",k)
 	b.add_area("A",n,k,beta)
-	b.project({"stim":["A"]},{})
-	for i in range(t-1):
-		b.project({"stim":["A"]},{"A":["A"]})
+	ckpt = None
+	start = 0
+	if checkpoint_dir:
+		ckpt = checkpoint.Checkpointer(b, checkpoint_dir, every=checkpoint_every)
+		extra = ckpt.restore()
+		if extra:
+			start = extra["next_round"]
+	for i in range(start, t):
+		if i == 0:
+			b.project({"stim":["A"]},{})
+		else:
+			b.project({"stim":["A"]},{"A":["A"]})
+		if ckpt:
+			ckpt.step(next_round=i+1)
 	return b.areas["A"].saved_w
 
 
-def project_beta_sim(n=100000,k=317,p=0.01,t=100):
-	results = {}
-	for beta in [0.25,0.1,0.075,0.05,0.03,0.01,0.007,0.005,0.003,0.001]:
-		print("Working on " + str(beta) + "\n")
-		out = project_sim(n,k,p,beta,t)
-		results[beta] = out
-	return results
+# The betas run in parallel (see sweep.py). With checkpoint_dir, finished
+# betas are cached in checkpoint_dir/results and each beta in progress is
+# checkpointed in its own subdirectory.
+def project_beta_sim(n=100000,k=317,p=0.01,t=100,checkpoint_dir=None,checkpoint_every=10,
+	processes=None):
+	betas = [0.25,0.1,0.075,0.05,0.03,0.01,0.007,0.005,0.003,0.001]
+	points = sweep.grid(n=[n],k=[k],p=[p],beta=betas,t=[t])
+	cache_dir = None
+	if checkpoint_dir:
+		cache_dir = os.path.join(checkpoint_dir, "results")
+		for point in points:
+			point["checkpoint_dir"] = os.path.join(checkpoint_dir, "beta=" + str(point["beta"]))
+			point["checkpoint_every"] = checkpoint_every
+	results = sweep.run(project_sim, points, processes=processes, cache_dir=cache_dir)
+	return {r.params["beta"]: r.value for r in results}
 
 def assembly_only_sim(n=100000,k=317,p=0.05,beta=0.05,project_iter=10):
 	b = brain.Brain(p)
@@ -50,8 +82,9 @@ def assembly_only_sim(n=100000,k=317,p=0.05,beta=0.05,project_iter=10):
 
 
 # alpha = percentage of (random) final assembly neurons to try firing
-def pattern_com(n=100000,k=317,p=0.05,beta=0.05,project_iter=10,alpha=0.5,comp_iter=1):
-	b = brain.Brain(p,save_winners=True)
+def pattern_com(n=100000,k=317,p=0.05,beta=0.05,project_iter=10,alpha=0.5,comp_iter=1,
+	brain_factory=brain.Brain):
+	b = brain_factory(p,save_winners=True)
 	b.add_stimulus("stim",k)
 	b.add_area("A",n,k,beta)
 	b.project({"stim":["A"]},{})
@@ -66,10 +99,13 @@ def pattern_com(n=100000,k=317,p=0.05,beta=0.05,project_iter=10,alpha=0.5,comp_i
 	return b.areas["A"].saved_w,b.areas["A"].saved_winners
 
 def pattern_com_repeated(n=100000,k=317,p=0.05,beta=0.05,project_iter=12,alpha=0.4,
-	trials=3, max_recurrent_iter=10, resample=False):
-	b = brain.Brain(p,save_winners=True)
+	trials=3, max_recurrent_iter=10, resample=False, seed=0):
+	b = brain.Brain(p,seed=seed)
 	b.add_stimulus("stim",k)
 	b.add_area("A",n,k,beta)
+	# overlap of every round of A with the assembly after projecting
+	overlap = b.add_observer(observers.OverlapObserver(
+		reference_round=project_iter-1,percentage=True),areas=["A"])
 	b.project({"stim":["A"]},{})
 	for i in range(project_iter-1):
 		b.project({"stim":["A"]},{"A":["A"]})
@@ -89,9 +125,7 @@ def pattern_com_repeated(n=100000,k=317,p=0.05,beta=0.05,project_iter=12,alpha=0
 			if (b.areas["A"].num_first_winners == 0) or (rounds == max_recurrent_iter):
 				break
 		rounds_to_completion.append(rounds)
-	saved_winners = b.areas["A"].saved_winners
-	overlaps = bu.get_overlaps(saved_winners,project_iter-1,percentage=True)
-	return overlaps, rounds_to_completion
+	return overlap.overlaps, rounds_to_completion
 
 def pattern_com_alphas(n=100000,k=317,p=0.01,beta=0.05,
 	alphas=[0.1,0.2,0.3,0.4,0.5,0.6,0.7,0.8,0.9,1.0],project_iter=25,comp_iter=5):
@@ -138,8 +172,8 @@ def pattern_com_iterations(n=100000,k=317,p=0.01,beta=0.05,alpha=0.4,comp_iter=8
 	return results
 
 # Sample command c_w,c_winners = bu.association_sim()
-def associate(n=100000,k=317,p=0.05,beta=0.1,overlap_iter=10):
-	b = brain.Brain(p,save_winners=True)
+def associate(n=100000,k=317,p=0.05,beta=0.1,overlap_iter=10,brain_factory=brain.Brain):
+	b = brain_factory(p,save_winners=True)
 	b.add_stimulus("stimA",k)
 	b.add_area("A",n,k,beta)
 	b.add_stimulus("stimB",k)
@@ -176,8 +210,8 @@ def association_sim(n=100000,k=317,p=0.05,beta=0.1,overlap_iter=10):
 	b = associate(n,k,p,beta,overlap_iter)
 	return b.areas["C"].saved_w,b.areas["C"].saved_winners
 
-def association_grand_sim(n=100000,k=317,p=0.01,beta=0.05,min_iter=10,max_iter=20):
-	b = brain.Brain(p,save_winners=True)
+def association_grand_sim(n=100000,k=317,p=0.01,beta=0.05,min_iter=10,max_iter=20,seed=0):
+	b = brain.Brain(p,save_winners=True,seed=seed)
 	b.add_stimulus("stimA",k)
 	b.add_area("A",n,k,beta)
 	b.add_stimulus("stimB",k)
@@ -220,8 +254,26 @@ def association_grand_sim(n=100000,k=317,p=0.01,beta=0.05,min_iter=10,max_iter=2
 		results[i] = float(o)/float(k)
 	return results
 
-def merge_sim(n=100000,k=317,p=0.01,beta=0.05,max_t=50):
-	b = brain.Brain(p)
+# Projects a stimulus down a chain of areas A0 -> A1 -> ... (each area also
+# firing into itself); t rounds once the whole chain is active.
+def project_chain_sim(n=100000,k=317,p=0.01,beta=0.05,t=20,num_areas=2,brain_factory=brain.Brain):
+	b = brain_factory(p)
+	b.add_stimulus("stim",k)
+	names = ["A" + str(i) for i in range(num_areas)]
+	for name in names:
+		b.add_area(name,n,k,beta)
+	b.project({"stim":[names[0]]},{})
+	# Activate the chain one area at a time.
+	for i in range(1, num_areas):
+		b.project({"stim":[names[0]]},
+			{names[j]:names[j:j+2] for j in range(i)})
+	for i in range(t):
+		b.project({"stim":[names[0]]},
+			{names[j]:names[j:j+2] for j in range(num_areas)})
+	return [b.areas[name].saved_w for name in names]
+
+def merge_sim(n=100000,k=317,p=0.01,beta=0.05,max_t=50,seed=0,brain_factory=brain.Brain):
+	b = brain_factory(p,seed=seed)
 	b.add_stimulus("stimA",k)
 	b.add_stimulus("stimB",k)
 	b.add_area("A",n,k,beta)
@@ -239,13 +291,12 @@ def merge_sim(n=100000,k=317,p=0.01,beta=0.05,max_t=50):
 			{"A":["A","C"],"B":["B","C"],"C":["C","A","B"]})
 	return b.areas["A"].saved_w, b.areas["B"].saved_w, b.areas["C"].saved_w
 
-def merge_beta_sim(n=100000,k=317,p=0.01,t=100):
-	results = {}
-	for beta in [0.3,0.2,0.1,0.075,0.05]:
-		print("Working on " + str(beta) + "\n")
-		out = merge_sim(n,k,p,beta=beta,max_t=t)
-		results[beta] = out
-	return results
+# The betas run in parallel (see sweep.py); with cache_dir, finished betas
+# are kept there and not recomputed.
+def merge_beta_sim(n=100000,k=317,p=0.01,t=100,processes=None,cache_dir=None):
+	points = sweep.grid(n=[n],k=[k],p=[p],beta=[0.3,0.2,0.1,0.075,0.05],max_t=[t])
+	results = sweep.run(merge_sim, points, processes=processes, cache_dir=cache_dir)
+	return {r.params["beta"]: r.value for r in results}
 # UTILS FOR EVAL
 
 
@@ -363,8 +414,8 @@ def plot_overlap(show=True, save="", use_text_font=True):
 	if not show and save != "":
 		plt.savefig(save)
 
-def density(n=100000,k=317,p=0.01,beta=0.05,rounds=20):
-	b = brain.Brain(p)
+def density(n=100000,k=317,p=0.01,beta=0.05,rounds=20,seed=0):
+	b = brain.Brain(p,seed=seed)
 	b.add_stimulus("stim",k)
 	b.add_area("A",n,k,beta)
 	b.project({"stim":["A"]},{})
@@ -374,20 +425,13 @@ def density(n=100000,k=317,p=0.01,beta=0.05,rounds=20):
 		saved_w.append(b.areas["A"].w)
 	conn = b.connectomes["A"]["A"]
 	final_winners = b.areas["A"].winners
-	edges = 0
-	for i in final_winners:
-		for j in final_winners:
-			if conn[i][j] != 0:
-				edges += 1
-	return float(edges)/float(k**2), saved_w
-
-def density_sim(n=100000,k=317,p=0.01,beta_values=[0,0.025,0.05,0.075,0.1]):
-	results = {}
-	for beta in beta_values:
-		print("Working on " + str(beta) + "\n")
-		out = density(n,k,p,beta)
-		results[beta] = out
-	return results
+	return connectivity.density(conn, final_winners), saved_w
+
+def density_sim(n=100000,k=317,p=0.01,beta_values=[0,0.025,0.05,0.075,0.1],
+	processes=None,cache_dir=None):
+	points = sweep.grid(n=[n],k=[k],p=[p],beta=beta_values)
+	results = sweep.run(density, points, processes=processes, cache_dir=cache_dir)
+	return {r.params["beta"]: r.value for r in results}
 
 def plot_density_ee(show=True,save="",use_text_font=True):
 	if(use_text_font):
@@ -407,34 +451,48 @@ def plot_density_ee(show=True,save="",use_text_font=True):
 # For default values, first B->A gets only 25% of A's original assembly
 # After subsequent recurrent firings restore up to 42% 
 # With artificially high beta, can get 100% restoration.
-def fixed_assembly_recip_proj(n=100000, k=317, p=0.01, beta=0.05):
-	b = brain.Brain(p, save_winners=True)
+def fixed_assembly_recip_proj(n=100000, k=317, p=0.01, beta=0.05, rounds=20, verbose=True,
+	brain_factory=brain.Brain):
+	b = brain_factory(p)
 	b.add_stimulus("stimA",k)
 	b.add_area("A",n,k,beta)
 	# Will project fixes A into B
 	b.add_area("B",n,k,beta)
+	# A's rounds: 1 + rounds from the stimulus, rounds frozen; the last frozen
+	# round is the reference for the B->A restoration that follows.
+	frozen_round = 2*rounds
+	overlap = b.add_observer(observers.OverlapObserver(
+		reference_round=frozen_round,start_round=frozen_round,percentage=True),
+		areas=["A"])
 	b.project({"stimA":["A"]},{})
-	print("A.w=" + str(b.areas["A"].w))
-	for i in range(20):
-		b.project({"stimA":["A"]}, {"A":["A"]})
+	if verbose:
 		print("A.w=" + str(b.areas["A"].w))
+	for i in range(rounds):
+		b.project({"stimA":["A"]}, {"A":["A"]})
+		if verbose:
+			print("A.w=" + str(b.areas["A"].w))
 	# Freeze assembly in A and start projecting A <-> B
 	b.areas["A"].fix_assembly()
 	b.project({}, {"A":["B"]})
-	for i in range(20):
+	for i in range(rounds):
 		b.project({}, {"A":["B"], "B":["A","B"]})
-		print("B.w=" + str(b.areas["B"].w))
+		if verbose:
+			print("B.w=" + str(b.areas["B"].w))
 	# If B has stabilized, this implies that the A->B direction is stable.
 	# Therefore to test that this "worked" we should check that B->A restores A
-	print("Before B->A, A.w=" + str(b.areas["A"].w))
+	if verbose:
+		print("Before B->A, A.w=" + str(b.areas["A"].w))
 	b.areas["A"].unfix_assembly()
 	b.project({},{"B":["A"]})
-	print("After B->A, A.w=" + str(b.areas["A"].w))
-	for i in range(20):
+	if verbose:
+		print("After B->A, A.w=" + str(b.areas["A"].w))
+	for i in range(rounds):
 		b.project({}, {"B":["A"],"A":["A"]})
-		print("A.w=" + str(b.areas["A"].w))
-	overlaps = bu.get_overlaps(b.areas["A"].saved_winners[-22:],0,percentage=True)
-	print(overlaps)
+		if verbose:
+			print("A.w=" + str(b.areas["A"].w))
+	if verbose:
+		print(overlap.overlaps)
+	return overlap.overlaps
 
 
 def fixed_assembly_merge(n=100000, k=317, p=0.01, beta=0.05):
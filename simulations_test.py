@@ -1,5 +1,9 @@
 #! /usr/bin/python
 
+import os
+import shutil
+import tempfile
+
 import brain_util as bu
 import simulations
 import unittest
@@ -27,6 +31,24 @@ class TestBrainFunction(unittest.TestCase):
         self.assertLessEqual(w_b[-1], 3200)
         self.assertLessEqual(w_c[-1], 6400)
 
+    def test_project_beta_checkpoints_per_beta(self):
+        checkpoint_dir = tempfile.mkdtemp()
+        try:
+            results = simulations.project_beta_sim(
+                2000, 20, 0.05, 3, checkpoint_dir=checkpoint_dir,
+                processes=1)
+            rerun = simulations.project_beta_sim(
+                2000, 20, 0.05, 3, checkpoint_dir=checkpoint_dir,
+                processes=1)
+            subdirs = sorted(os.listdir(checkpoint_dir))
+        finally:
+            shutil.rmtree(checkpoint_dir)
+        self.assertEqual(len(results), 10)
+        self.assertEqual(rerun, results)
+        self.assertEqual(len(subdirs), 11)
+        self.assertIn("beta=0.25", subdirs)
+        self.assertIn("results", subdirs)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,272 @@
+# Parallel parameter sweeps with an on-disk result cache.
+#
+# A sweep calls a simulation function once per (grid point, seed). Points
+# are fanned out over a process pool, and every result is stored in a cache
+# directory keyed by the function, its parameters and the seed, so running
+# the same or an extended sweep again only computes the missing points:
+#
+#   results = sweep.run(simulations.merge_sim,
+#                       sweep.grid(n=[100000], k=[317], p=[0.01],
+#                                  beta=[0.3, 0.2, 0.1], max_t=[100]),
+#                       seeds=range(5), cache_dir="sweeps")
+#   for r in results: r.params, r.seed, r.value
+#
+# run_adaptive() instead keeps adding seeds (trials) to each point until
+# the confidence interval of a statistic of the results is narrow enough:
+#
+#   results = sweep.run_adaptive(simulations.pattern_com_repeated, points,
+#                                width=0.5, statistic=lambda out: out[1][0])
+#
+# Each call gets its own seed, derived from the sweep seed and the point's
+# parameters (not its position in the grid, so extending a grid does not
+# reseed old points). It seeds `random` and `np.random` in the worker and is
+# passed on as `seed=` if the function takes one (e.g. to brain.Brain).
+#
+# The function must be importable by the worker processes, i.e. defined at
+# module level.
+
+import collections
+import concurrent.futures
+import hashlib
+import inspect
+import itertools
+import json
+import math
+import os
+import pickle
+import random
+import tempfile
+
+import numpy as np
+from scipy import stats
+
+SweepResult = collections.namedtuple(
+    'SweepResult', ['params', 'seed', 'value', 'cached'])
+AdaptiveResult = collections.namedtuple(
+    'AdaptiveResult',
+    ['params', 'values', 'mean', 'half_width', 'num_trials', 'converged'])
+
+
+def grid(**axes):
+  """Returns the cartesian product of the axes as a list of param dicts.
+
+  The last axis varies fastest: grid(a=[1, 2], b=[3, 4]) is
+  [{a: 1, b: 3}, {a: 1, b: 4}, {a: 2, b: 3}, {a: 2, b: 4}].
+  """
+  names = list(axes)
+  return [dict(zip(names, values))
+          for values in itertools.product(*axes.values())]
+
+
+def function_name(fn):
+  return f'{fn.__module__}.{fn.__qualname__}'
+
+
+def _canonical(params):
+  return json.dumps(params, sort_keys=True, default=repr)
+
+
+def point_key(fn, params, seed, version=None):
+  """Cache key of one call: a hash of function, parameters, seed, version."""
+  text = json.dumps([function_name(fn), _canonical(params), seed, version])
+  return hashlib.sha256(text.encode()).hexdigest()
+
+
+def point_seed(params, seed):
+  """The seed a point actually runs with (a 32-bit int)."""
+  digest = hashlib.sha256(_canonical(params).encode()).digest()
+  entropy = [seed] + list(np.frombuffer(digest[:16], dtype=np.uint32))
+  return int(np.random.SeedSequence(entropy).generate_state(1)[0])
+
+
+class ResultCache:
+  """Pickled results in a directory, one file per key."""
+
+  def __init__(self, directory):
+    self.directory = directory
+    os.makedirs(directory, exist_ok=True)
+
+  def _path(self, key):
+    return os.path.join(self.directory, key[:2], key + '.pkl')
+
+  def __contains__(self, key):
+    return os.path.exists(self._path(key))
+
+  def get(self, key):
+    """Returns the stored entry for `key`, or None."""
+    try:
+      with open(self._path(key), 'rb') as f:
+        return pickle.load(f)
+    except FileNotFoundError:
+      return None
+
+  def put(self, key, entry):
+    # Write to a temporary file and rename, so concurrent sweeps and
+    # interrupted runs never leave a partial entry behind.
+    path = self._path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+      pickle.dump(entry, f)
+    os.replace(tmp_path, path)
+
+
+def _takes_seed(fn):
+  try:
+    return 'seed' in inspect.signature(fn).parameters
+  except (TypeError, ValueError):
+    return False
+
+
+def call_point(fn, params, seed):
+  """Runs one point with its derived seed (in a worker or inline)."""
+  actual_seed = point_seed(params, seed)
+  random.seed(actual_seed)
+  np.random.seed(actual_seed)
+  kwargs = dict(params)
+  if _takes_seed(fn) and 'seed' not in kwargs:
+    kwargs['seed'] = actual_seed
+  return fn(**kwargs)
+
+
+def _run_tasks(fn, tasks, processes, cache_dir, version, verbose):
+  """Runs (params, seed) tasks; returns their SweepResults in order."""
+  cache = ResultCache(cache_dir) if cache_dir else None
+  results = [None] * len(tasks)
+  missing = []
+  for i, (params, seed) in enumerate(tasks):
+    entry = cache.get(point_key(fn, params, seed, version)) if cache else None
+    if entry is not None:
+      results[i] = SweepResult(params, seed, entry['value'], True)
+    else:
+      missing.append(i)
+
+  def finish(i, value):
+    params, seed = tasks[i]
+    if verbose:
+      print(f'{function_name(fn)} {_canonical(params)} seed={seed} done')
+    if cache:
+      cache.put(point_key(fn, params, seed, version), {
+        'function': function_name(fn),
+        'params': params,
+        'seed': seed,
+        'value': value,
+      })
+    results[i] = SweepResult(params, seed, value, False)
+
+  if processes == 1 or len(missing) <= 1:
+    for i in missing:
+      finish(i, call_point(fn, *tasks[i]))
+    return results
+  with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+    futures = {pool.submit(call_point, fn, *tasks[i]): i for i in missing}
+    for future in concurrent.futures.as_completed(futures):
+      finish(futures[future], future.result())
+  return results
+
+
+def run(fn, points, seeds=(0,), processes=None, cache_dir=None, version=None,
+        verbose=True):
+  """Runs `fn(**params)` for every point and seed.
+
+  Args:
+    fn: Module-level simulation function.
+    points: Parameter dicts, e.g. from grid().
+    seeds: Sweep seeds; every point is run once per seed.
+    processes: Worker processes; None for one per CPU, 1 to run inline in
+      this process (no pickling, easy to debug).
+    cache_dir: Directory of the result cache, or None for no caching.
+    version: Anything JSON-able that is part of the cache key; change it to
+      invalidate results after changing the simulation code.
+    verbose: Print a line per computed point.
+
+  Returns:
+    A list of SweepResult(params, seed, value, cached), in the order of
+    `points` x `seeds`.
+  """
+  tasks = [(params, seed) for params in points for seed in seeds]
+  return _run_tasks(fn, tasks, processes, cache_dir, version, verbose)
+
+
+def confidence_half_width(values, confidence=0.95):
+  """Half-width of the Student-t confidence interval of the mean."""
+  if len(values) < 2:
+    return math.inf
+  sem = np.std(values, ddof=1) / math.sqrt(len(values))
+  return float(stats.t.ppf((1 + confidence) / 2, len(values) - 1) * sem)
+
+
+def _trials_needed(values, width, confidence):
+  """Estimated number of trials for a confidence interval of `width`."""
+  std = np.std(values, ddof=1)
+  if std == 0:
+    return len(values)
+  z = stats.norm.ppf((1 + confidence) / 2)
+  return math.ceil((2 * z * std / width) ** 2)
+
+
+def run_adaptive(fn, points, width, statistic=None, confidence=0.95,
+                 min_trials=3, max_trials=30, max_batch=None, processes=None,
+                 cache_dir=None, version=None, verbose=True):
+  """Runs every point until its statistic's confidence interval is narrow.
+
+  Trials are the seeds 0, 1, 2, ... of run(), so they are cached (and
+  reused) like any other sweep result. Every round runs, for all points
+  that have not converged yet, the number of extra trials their current
+  spread predicts they need, all together on one process pool.
+
+  Args:
+    fn: Module-level simulation function.
+    points: Parameter dicts, e.g. from grid().
+    width: Target full width of the confidence interval of the mean.
+    statistic: Maps a result of `fn` to a number (default: the result).
+    confidence: Confidence level of the interval.
+    min_trials: Trials run for every point before the first check.
+    max_trials: Trial budget per point.
+    max_batch: Cap on the trials added to a point per round.
+    processes, cache_dir, version, verbose: As for run().
+
+  Returns:
+    A list of AdaptiveResult(params, values, mean, half_width, num_trials,
+    converged), one per point.
+  """
+  if min_trials < 2:
+    raise ValueError(f'min_trials must be >= 2, got {min_trials}')
+  statistic = statistic or (lambda value: value)
+  values = [[] for _ in points]
+  pending = {i: min(min_trials, max_trials) for i in range(len(points))}
+  while pending:
+    tasks, owners = [], []
+    for i, num_new in pending.items():
+      done = len(values[i])
+      for seed in range(done, done + num_new):
+        tasks.append((points[i], seed))
+        owners.append(i)
+    results = _run_tasks(fn, tasks, processes, cache_dir, version, verbose)
+    for i, result in zip(owners, results):
+      values[i].append(statistic(result.value))
+    pending = {}
+    for i, point_values in enumerate(values):
+      done = len(point_values)
+      if (done >= max_trials
+          or 2 * confidence_half_width(point_values, confidence) <= width):
+        continue
+      num_new = max(1, _trials_needed(point_values, width, confidence) - done)
+      if max_batch is not None:
+        num_new = min(num_new, max_batch)
+      pending[i] = min(num_new, max_trials - done)
+  adaptive_results = []
+  for params, point_values in zip(points, values):
+    half_width = confidence_half_width(point_values, confidence)
+    adaptive_results.append(AdaptiveResult(
+        params, point_values, float(np.mean(point_values)), half_width,
+        len(point_values), 2 * half_width <= width))
+  return adaptive_results
+
+
+def by_param(results, name):
+  """{value of param `name`: [values of all seeds]} of a sweep's results."""
+  grouped = collections.OrderedDict()
+  for result in results:
+    grouped.setdefault(result.params[name], []).append(result.value)
+  return grouped
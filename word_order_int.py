@@ -25,8 +25,9 @@ MOOD = "MOOD"
 
 class LearnBrain(brain.Brain):
 	def __init__(self, p, EXPLICIT_k=100, NON_EXPLICIT_k=100, NON_EXPLICIT_n=100000, beta=0.06, previous_constituent_fire_rounds=2, training_fire_rounds=10, num_nouns=2, num_verbs=2, num_moods=1,
-					mood_to_trans_word_order = {0: ["S","V","O"]}):
-			brain.Brain.__init__(self, p)
+					mood_to_trans_word_order = {0: ["S","V","O"]}, connectome_dir=None):
+			# connectome_dir: keep the (large) connectomes in memory-mapped files there.
+			brain.Brain.__init__(self, p, connectome_dir=connectome_dir)
 			self.num_nouns = num_nouns 
 			self.num_verbs = num_verbs 
 			self.num_words = self.num_nouns + self.num_verbs